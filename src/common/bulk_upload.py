@@ -0,0 +1,288 @@
+import os
+import shutil
+import tarfile
+import time
+import zipfile
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from src.common import json_codec
+from src.common.constants import SUPPORTED_IMAGE_FILE_EXTENSIONS
+from src.common.logger import get_logger
+from src.common.thumbnails import THUMBNAIL_SIZES, get_thumbnail_sizes, make_thumbnails
+from src.converters.registry import convert_job, get_reader_class
+
+logger = get_logger(__name__)
+
+"""
+.. module:: bulk_upload
+   :synopsis: chunked and resumable ingestion of a server-side folder or archive
+   Instead of holding the uploaded files in memory (st.file_uploader), the files of a folder, zip or tar
+   on the server are streamed in COPY_CHUNK_SIZE chunks to <project>/data and <project>/labels.
+   As soon as a file lands, its thumbnail (images) or its conversion (label formats with a label file per task)
+   is submitted to a process pool, so that the copy, the thumbnails and the conversion overlap.
+   The progress is appended to <project>/.upload_progress as JSON lines:
+        {"started": "a.jpg", "size": 1024, "mtime": 1700000000}
+        {"copied": "a.jpg", "size": 1024, "mtime": 1700000000}
+        {"converted": "a.xml", "output": ".../anno-a.json"}
+        {"converted": "labels", "output": ".../anno-source.json", "inputs": [["a.json", 512, 1700000000], ...]}
+   Running the same upload again skips the files already copied and converted, and resumes a partially copied
+   file (<name>.part) from its last byte when the source is seekable.
+   The data and labels folders are flat: a file with the name of a file already uploaded from another folder
+   of the source is skipped and reported in BulkUpload.collisions instead of overwriting it.
+   The label file converted from a.xml is anno-a.json (anno-<source name>.json for the formats converted together),
+   so that the caller can tell the label files that already have a task when an upload is resumed.
+   A label file is converted again only if its inputs changed, and then to a new anno-<name>-<index>.json:
+   the label file converted before may be the label file of a task, reviewed and journaled since.
+"""
+
+COPY_CHUNK_SIZE = 8 * 1024 * 1024
+PROGRESS_FILENAME = ".upload_progress"
+
+_Member = namedtuple('_Member', ['name', 'size', 'mtime', 'open'])
+
+
+def _iter_folder_members(folder: str):
+    for root, dirs, files in os.walk(folder):
+        dirs.sort()
+        for file in sorted(files):
+            filename = os.path.join(root, file)
+            file_stat = os.stat(filename)
+            yield _Member(os.path.relpath(filename, folder), file_stat.st_size, int(file_stat.st_mtime),
+                          lambda filename=filename: open(filename, 'rb'))
+
+
+def _iter_zip_members(zip_filename: str):
+    with zipfile.ZipFile(zip_filename) as zip_file:
+        for info in zip_file.infolist():
+            if info.is_dir():
+                continue
+            mtime = int(time.mktime(info.date_time + (0, 0, -1)))
+            yield _Member(info.filename, info.file_size, mtime, lambda info=info: zip_file.open(info))
+
+
+def _iter_tar_members(tar_filename: str):
+    # the members are read in the order of the archive so that compressed archives are decompressed once
+    with tarfile.open(tar_filename, 'r:*') as tar_file:
+        for member in tar_file:
+            if not member.isfile():
+                continue
+            yield _Member(member.name, member.size, int(member.mtime),
+                          lambda member=member: tar_file.extractfile(member))
+
+
+def iter_source_members(source: str):
+    """
+    :param source: folder, zip or tar (optionally compressed) on the server
+    :return: a generator of the files in the source
+    """
+    if os.path.isdir(source):
+        return _iter_folder_members(source)
+    if zipfile.is_zipfile(source):
+        return _iter_zip_members(source)
+    if tarfile.is_tarfile(source):
+        return _iter_tar_members(source)
+    raise ValueError(f"{source} is not a folder, a zip or a tar file")
+
+
+def count_source_members(source: str) -> int:
+    """
+    :return: the number of files in the source or None if counting requires reading the whole archive (tar)
+    """
+    if os.path.isdir(source):
+        return sum(len(files) for _, _, files in os.walk(source))
+    if zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as zip_file:
+            return sum(1 for info in zip_file.infolist() if not info.is_dir())
+    return None
+
+
+def _copy_member(member: _Member, filename: str, resume: bool):
+    """
+    copy the member to filename in chunks through <filename>.part
+    :param resume: append to the existing .part file of a previous run
+    """
+    part_filename = filename + ".part"
+    with member.open() as src:
+        offset = os.path.getsize(part_filename) if resume and os.path.exists(part_filename) else 0
+        if offset and (offset > member.size or not src.seekable()):
+            offset = 0
+        if offset:
+            src.seek(offset)
+            logger.info(f"Resuming {member.name} from {offset} bytes")
+
+        with open(part_filename, 'ab' if offset else 'wb') as dst:
+            shutil.copyfileobj(src, dst, COPY_CHUNK_SIZE)
+    os.replace(part_filename, filename)
+
+
+class BulkUpload:
+    def __init__(self, source: str, project_folder: str, format_type: str = None, max_workers: int = None):
+        """
+        :param source: folder, zip or tar on the server
+        :param project_folder: folder of the project; the files are saved to its data and labels folders
+        :param format_type: label format; the label files are not converted if None
+        :param max_workers: the number of processes for the thumbnails and the conversion
+        """
+        self.source = source
+        self.project_folder = project_folder
+        self.format_type = format_type
+        self.max_workers = max_workers or os.cpu_count() or 1
+
+        self.data_folder = os.path.join(project_folder, "data")
+        self.labels_folder = os.path.join(project_folder, "labels")
+        self.progress_filename = os.path.join(project_folder, PROGRESS_FILENAME)
+
+        self.reader_class = get_reader_class(format_type) if format_type else None
+        self.label_file_extensions = tuple(f".{ext}" for ext in self.reader_class.LABEL_FILE_EXTENSIONS) \
+            if self.reader_class else ()
+        self.image_file_extensions = tuple(f".{ext}" for ext in SUPPORTED_IMAGE_FILE_EXTENSIONS)
+        # (member name, member name of the file uploaded before under the same name) of the skipped files
+        self.collisions = []
+
+    def _read_progress(self) -> (dict, dict, dict):
+        started, copied, converted = dict(), dict(), dict()
+        if not os.path.exists(self.progress_filename):
+            return started, copied, converted
+
+        with open(self.progress_filename, 'rb') as progress_file:
+            data = progress_file.read()
+        # a line without a newline was being written when the upload stopped
+        for line in data[:data.rfind(b"\n") + 1].splitlines():
+            if not line.strip():
+                continue
+            entry = json_codec.loads(line)
+            if 'started' in entry:
+                started[entry['started']] = (entry['size'], entry['mtime'])
+            elif 'copied' in entry:
+                copied[entry['copied']] = (entry['size'], entry['mtime'])
+            elif 'converted' in entry:
+                converted[entry['converted']] = (entry['output'], entry.get('inputs'))
+        return started, copied, converted
+
+    def _append_progress(self, entry: dict):
+        with open(self.progress_filename, 'ab') as progress_file:
+            progress_file.write(json_codec.dumps(entry) + b"\n")
+
+    def _get_converted_filename(self, name: str) -> str:
+        """
+        :return: <project>/anno-<name>.json or anno-<name>-<index>.json if it exists already
+        """
+        converted_filename = os.path.join(self.project_folder, f"anno-{name}.json")
+        index = 1
+        while os.path.exists(converted_filename):
+            converted_filename = os.path.join(self.project_folder, f"anno-{name}-{index}.json")
+            index += 1
+        return converted_filename
+
+    def _get_folder(self, member_name: str) -> str:
+        lower_name = member_name.lower()
+        if lower_name.endswith(self.image_file_extensions):
+            return self.data_folder
+        if self.label_file_extensions and lower_name.endswith(self.label_file_extensions):
+            return self.labels_folder
+        return None
+
+    def run(self, on_progress=None) -> (list, list):
+        """
+        copy the files of the source, generate the thumbnails and convert the label files
+        :param on_progress: called with (the number of files processed, the number of files or None, filename)
+        :return: (saved data filenames, converted label filenames)
+        """
+        thumbnails_folders = [os.path.join(self.project_folder, folder) for folder in THUMBNAIL_SIZES]
+        for folder in [self.project_folder, self.data_folder, self.labels_folder] + thumbnails_folders:
+            os.makedirs(folder, exist_ok=True)
+
+        started, copied, converted = self._read_progress()
+        total_count = count_source_members(self.source)
+        saved_data_filenames, saved_label_filenames, converted_filenames = [], [], []
+        # [name, size, mtime] of the label files to tell whether they changed since they were converted together
+        label_inputs = []
+        # key=filename in the data or labels folder value=member name
+        member_names = dict()
+        self.collisions = []
+        pending = dict()
+
+        def _on_done(done_futures):
+            for future in done_futures:
+                progress_entry = pending.pop(future)
+                if progress_entry is None:
+                    continue
+                try:
+                    future.result()
+                    self._append_progress(progress_entry)
+                except Exception as e:
+                    logger.error(f"Failed to convert {progress_entry['converted']}: {str(e)}")
+
+        with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+            for member_count, member in enumerate(iter_source_members(self.source), start=1):
+                folder = self._get_folder(member.name)
+                if folder is None:
+                    logger.info(f"Skipping {member.name}")
+                    continue
+
+                name = os.path.basename(member.name)
+                filename = os.path.join(folder, name)
+                if filename in member_names:
+                    logger.warning(f"Skipping {member.name}: {member_names[filename]} is uploaded as {name}")
+                    self.collisions.append((member.name, member_names[filename]))
+                    continue
+                member_names[filename] = member.name
+
+                member_key = (member.size, member.mtime)
+                needs_copy = copied.get(name) != member_key or not os.path.exists(filename)
+                if needs_copy:
+                    resume = started.get(name) == member_key
+                    if not resume:
+                        self._append_progress({"started": name, "size": member.size, "mtime": member.mtime})
+                    _copy_member(member, filename, resume)
+                    self._append_progress({"copied": name, "size": member.size, "mtime": member.mtime})
+
+                if folder == self.data_folder:
+                    saved_data_filenames.append(filename)
+                    # the thumbnails newer than the image are skipped by make_thumbnails
+                    thumbnail_sizes = get_thumbnail_sizes(filename, self.project_folder)
+                    pending[executor.submit(make_thumbnails, filename, thumbnail_sizes)] = None
+                else:
+                    saved_label_filenames.append(filename)
+                    label_inputs.append([name, member.size, member.mtime])
+                    if self.reader_class.FILE_PER_TASK:
+                        converted_filename, _ = converted.get(name, (None, None))
+                        if needs_copy or converted_filename is None or not os.path.exists(converted_filename):
+                            converted_filename = self._get_converted_filename(os.path.splitext(name)[0])
+                            future = executor.submit(convert_job, self.format_type, [filename],
+                                                     converted_filename, None, 1)
+                            pending[future] = {"converted": name, "output": converted_filename}
+                        converted_filenames.append(converted_filename)
+
+                # bound the number of the queued jobs while the copy goes on
+                if len(pending) > 4 * self.max_workers:
+                    done_futures, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+                    _on_done(done_futures)
+
+                if on_progress:
+                    on_progress(member_count, total_count, name)
+
+            if saved_label_filenames and not self.reader_class.FILE_PER_TASK:
+                # the label files are converted together once they have all landed
+                labels_name = os.path.basename(self.labels_folder)
+                inputs = sorted(label_inputs)
+                converted_filename, converted_inputs = converted.get(labels_name, (None, None))
+                if converted_inputs != inputs or converted_filename is None or \
+                        not os.path.exists(converted_filename):
+                    source_name = os.path.splitext(os.path.basename(os.path.normpath(self.source)))[0]
+                    converted_filename = self._get_converted_filename(source_name)
+                    future = executor.submit(convert_job, self.format_type, sorted(saved_label_filenames),
+                                             converted_filename, sorted(saved_data_filenames), 1)
+                    pending[future] = {"converted": labels_name, "output": converted_filename, "inputs": inputs}
+                converted_filenames.append(converted_filename)
+
+            done_futures, _ = wait(list(pending))
+            _on_done(done_futures)
+
+        converted_filenames = [converted_filename for converted_filename in converted_filenames
+                               if os.path.exists(converted_filename)]
+        saved_data_filenames.sort()
+        logger.info(f"Uploaded {len(saved_data_filenames)} data files and {len(saved_label_filenames)} label files "
+                    f"from {self.source}")
+        return saved_data_filenames, converted_filenames
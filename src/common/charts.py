@@ -2,11 +2,11 @@ import datetime as dt
 import os
 
 import altair as alt
-import cv2
 import pandas as pd
 import streamlit as st
 
 from src.common import constants, utils
+from src.common.file_catalog import get_file_catalog
 from src.common.logger import get_logger
 
 from PIL import Image
@@ -22,42 +22,18 @@ from matplotlib.backends.backend_pdf import PdfPages
 logger = get_logger(__name__)
 
 @st.cache_data
-def plot_aspect_ratios_brightness(title: str, files_dict: dict):
-    if files_dict is None or len(files_dict.items()) == 0:
-        return
-
-    # Initialize a list to store the aspect ratios
-    aspect_ratios = {}
-    brightness_values = {}
-
-    # Loop through all the files in the folder and calculate their aspect ratios
-    for folder, files in files_dict.items():
-        for file in files:
-            image_path = os.path.join(folder, file)
-            # Read the image using opencv-python
-            img = cv2.imread(image_path)
-
-            if img is None:
-                continue
-
-            # Get the width and height of the image
-            height, width, _ = img.shape
-
-            # Calculate the aspect ratio
-            aspect_ratio = width / height
-            if aspect_ratios.get(aspect_ratio):
-                aspect_ratios[aspect_ratio] = aspect_ratios[aspect_ratio] + 1
-            else:
-                aspect_ratios[aspect_ratio] = 1
-
-            # Convert the image to grayscale
-            gray_img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-            # Calculate the average brightness of the image
-            brightness = gray_img.mean()
-            if brightness_values.get(brightness):
-                brightness_values[brightness] = brightness_values[brightness] + 1
-            else:
-                brightness_values[brightness] = 1
+def plot_aspect_ratios_brightness(title: str, image_stats: pd.DataFrame):
+    """
+    :param title: title
+    :param image_stats: per-image statistics (see image_stats.update_image_stats)
+    :return: (aspect ratio chart, brightness chart, aspect ratio table, brightness table)
+    """
+    if image_stats is None or len(image_stats) == 0:
+        return None, None, None, None
+
+    # Count the images per aspect ratio and per mean brightness
+    aspect_ratios = image_stats['aspect_ratio'].value_counts(sort=False).to_dict()
+    brightness_values = image_stats['brightness_mean'].value_counts(sort=False).to_dict()
 
     aspect_ratios_list = [(k, v) for k, v in aspect_ratios.items()]
 
@@ -212,29 +188,30 @@ def plot_file_sizes(df_file_info: pd.DataFrame):
     return chart
 
 @st.cache_data
-def plot_file_info(title: str, files_dict: dict):
-    if files_dict is None or len(files_dict.items()) == 0:
-        return
+def plot_file_info(title: str, project_folder: str, generation: int, folder: str = "data"):
+    """
+    :param title: title
+    :param project_folder: project folder
+    :param generation: generation of the file catalog of the project; only to invalidate the cache
+    :param folder: folder relative to the project folder
+    :return: (created time chart, file size chart, created time table)
+    """
+    files = get_file_catalog(project_folder).get_files(folder, constants.SUPPORTED_IMAGE_FILE_EXTENSIONS)
+    if len(files) == 0:
+        return None, None, None
 
     st.header(title)
     file_info_dict = dict()
-    for folder, files in files_dict.items():
-        level = folder.count(os.sep)
-        indent = '-' * level
-        # st.markdown('{}📁({}) {}/'.format(indent, len(files), folder))
-        with st.expander('📁({}) {}/'.format(len(files), folder.replace(constants.ADQ_WORKING_FOLDER, ""))):
-            for file in files:
-                file_stat = os.stat(os.path.join(folder, file))
-                dt_cdatetime = dt.datetime.fromtimestamp(file_stat.st_ctime)
-                st.markdown("📄{} ({}) created: {}".format(file,
-                                                           utils.humanize_bytes(file_stat.st_size),
-                                                           dt_cdatetime.date()))
-                # st.markdown("📄{} ({}) {}".format(file,
-                #                                  utils.humanize_bytes(file_stat.st_size),
-                #                                  dt_cdatetime.date()))
-                ctime_object = dt_cdatetime.time()
-                # Append date and time to x and y data lists
-                file_info_dict[file] = (dt_cdatetime.date(), float(ctime_object.strftime('%H.%M')), file_stat.st_size)
+    folder_path = os.path.join(project_folder, folder)
+    with st.expander('📁({}) {}/'.format(len(files), folder_path.replace(constants.ADQ_WORKING_FOLDER, ""))):
+        for file, size, ctime in files[['name', 'size', 'ctime']].itertuples(index=False):
+            dt_cdatetime = dt.datetime.fromtimestamp(ctime)
+            st.markdown("📄{} ({}) created: {}".format(file,
+                                                       utils.humanize_bytes(size),
+                                                       dt_cdatetime.date()))
+            ctime_object = dt_cdatetime.time()
+            # Append date and time to x and y data lists
+            file_info_dict[file] = (dt_cdatetime.date(), float(ctime_object.strftime('%H.%M')), size)
 
     df_ctime = pd.DataFrame.from_dict(file_info_dict, orient='index', columns=['date', 'time', 'size'])
     df_ctime = df_ctime.assign(file=file_info_dict.keys())
@@ -16,10 +16,14 @@ GPR_JSON = "GPR JSON"
 COCO_JSON = "COCO JSON"
 ADQ_JSON = "ADQ JSON"
 YOLO_V5_TXT = "YOLO_V5 TXT"
+SUPERBAI_JSON = "SUPERBAI JSON"
+AIMMO_JSON = "AIMMO JSON"
 
 SUPPORTED_LABEL_FILE_EXTENSIONS = ['json', 'xml', 'txt']
 # SUPPORTED_LABEL_FORMATS = [STRADVISION_XML, CVAT_BBOX_XML, PASCAL_VOC_XML, GPR_JSON, ADQ_JSON, YOLO_V5_TXT]
 SUPPORTED_LABEL_FORMATS = [STRADVISION_XML, CVAT_XML]
+# the bulk upload also takes the GPR json files of the images (converted together with the images it uploads)
+BULK_UPLOAD_LABEL_FORMATS = SUPPORTED_LABEL_FORMATS + [GPR_JSON]
 SUPPORTED_IMAGE_FILE_EXTENSIONS = ['jpg', 'jpeg', 'png', 'bmp', 'tiff', 'gif']
 SUPPORTED_VIDEO_FILE_EXTENSIONS = "*.mp4 *.avi *.mov"
 SUPPORTED_AUDIO_FILE_EXTENSIONS = "*.mp3 *.wav"
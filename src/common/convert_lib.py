@@ -3,10 +3,17 @@ import json
 import os
 import shutil
 import xml.etree.ElementTree as ET
-from src.common import utils
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from src.common import image_probe, json_codec
+from src.converters.coco_reader import COCOReader
 import streamlit as st
 
 POINT_SEP = ':'
+# below this number of files, parsing in the current process is faster than starting the processes
+PARALLEL_MIN_FILES = 64
+PARALLEL_CHUNK_SIZE = 64
 
 
 # function name : collect_org_annofile_as_list
@@ -34,99 +41,135 @@ def collect_org_annofile_as_list(target_data_directory, file_ext, image_annofile
     return org_annofile_list
 
 
-def from_yolo_txt(img_annof_relation: str, anno_files: list, image_files: list, target_folder: str) -> str:
-    def _parse_yolov5_label_file(label_file_path: str, width: int, height: int) -> list:
-        with open(label_file_path, 'r') as label_file:
-            print(f"Parsing {label_file_path}")
-            lines = label_file.readlines()
-            objects = []
-            for line in lines:
-                line = line.strip()
-                if not line:
-                    continue
-
-                label, *points = line.split(' ')
-                if len(points) != 4:
-                    print(f"Skipping invalid entry {line}")
-                    continue
-                points = [float(p) for p in points]
-                cx, cy, cw, ch = points
-
-                shape_width_offset = (cw * width) / 2
-                shape_height_offset = (ch * height) / 2
-                xtl = (cx * width) - shape_width_offset
-                ytl = (cy * height) - shape_height_offset
-                xbr = (cx * width) + shape_width_offset
-                ybr = (cy * height) + shape_height_offset
-                obj = {'label': label, 'type': 'box', 'points': [[xtl, ytl, xbr, ybr]]}
-                objects.append(obj)
-        return objects
-
-    if img_annof_relation != '11':
-        return
-
-    output_jdict = dict()
-    output_jdict['mode'] = 'annotation'
-    output_jdict['twconverted'] = '96E7D8C8-44E4-4055-8487-85B3208E51A2'
-    output_jdict['template_version'] = "0.1"
-
+def _to_yolo_objects(label_file_path: str, width: int, height: int) -> list:
+    """
+    parse a YOLO label file: "label cx cy w h" for boxes and "label x1 y1 x2 y2 ..." for segmentation polygons.
+    all the values are normalized by the image size, and the lines of each kind are converted at once.
+    :param label_file_path: YOLO txt filename
+    :param width: image width
+    :param height: image height
+    :return: objects in the order of the lines
+    """
+    print(f"Parsing {label_file_path}")
+    with open(label_file_path, 'r') as label_file:
+        rows = [line.split() for line in label_file if line.strip()]
+
+    objects = [None] * len(rows)
+    box_indices = [idx for idx, row in enumerate(rows) if len(row) == 5]
+    if box_indices:
+        boxes = np.array([rows[idx][1:] for idx in box_indices], dtype=np.float64)
+        cx, cy = boxes[:, 0] * width, boxes[:, 1] * height
+        shape_width_offsets = (boxes[:, 2] * width) / 2
+        shape_height_offsets = (boxes[:, 3] * height) / 2
+        xyxy = np.stack([cx - shape_width_offsets, cy - shape_height_offsets,
+                         cx + shape_width_offsets, cy + shape_height_offsets], axis=1).tolist()
+        for idx, points in zip(box_indices, xyxy):
+            objects[idx] = {'label': rows[idx][0], 'type': 'box', 'points': [points]}
+
+    polygon_indices = [idx for idx, row in enumerate(rows) if len(row) >= 7 and len(row) % 2 == 1]
+    if polygon_indices:
+        lengths = np.array([len(rows[idx]) - 1 for idx in polygon_indices])
+        coords = np.array([value for idx in polygon_indices for value in rows[idx][1:]],
+                          dtype=np.float64).reshape(-1, 2) * (width, height)
+        polygons = np.split(coords, np.cumsum(lengths // 2)[:-1])
+        for idx, points in zip(polygon_indices, polygons):
+            objects[idx] = {'label': rows[idx][0], 'type': 'polygon', 'points': points.tolist()}
+
+    for row, obj in zip(rows, objects):
+        if obj is None:
+            print(f"Skipping invalid entry {' '.join(row)}")
+    return [obj for obj in objects if obj is not None]
+
+
+def _to_yolo_objects_star(args) -> list:
+    return _to_yolo_objects(*args)
+
+
+def to_yolo_images(anno_files: list, image_files: list, max_workers: int = None) -> list:
+    """
+    :param anno_files: YOLO txt filenames, one per image
+    :param image_files: image filenames of anno_files (relative to the parent folder of the label folder)
+    :param max_workers: the number of processes; 1 parses in the current process
+    :return: DataLabels image dictionaries
+    """
     output_jdict_imgs = list()
 
-    for image_id, (anno_filename, image_filename) in enumerate(zip(anno_files, image_files)):
+    image_filenames = [os.path.join(os.path.dirname(os.path.dirname(anno_filename)), image_filename)
+                       for anno_filename, image_filename in zip(anno_files, image_files)]
+    # read the image headers in a batch
+    image_sizes = image_probe.get_image_sizes(image_filenames)
+
+    # parse the label files across processes
+    parse_args = [(anno_filename, width, height) for anno_filename, (width, height) in zip(anno_files, image_sizes)]
+    if len(parse_args) < PARALLEL_MIN_FILES or max_workers == 1:
+        objects_list = [_to_yolo_objects(*args) for args in parse_args]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            objects_list = list(executor.map(_to_yolo_objects_star, parse_args, chunksize=PARALLEL_CHUNK_SIZE))
+
+    for image_id, (image_filename, (width, height), objects) in enumerate(zip(image_filenames, image_sizes,
+                                                                              objects_list)):
         cur_img = dict()
         cur_img['image_id'] = str(image_id)
-
-        image_dir = os.path.dirname(os.path.dirname(anno_filename))
-        image_filename = os.path.join(image_dir, image_filename)
         cur_img['name'] = os.path.basename(image_filename)
 
-        width, height = utils.get_resolution(image_filename)
         cur_img['width'] = int(width)
         cur_img['height'] = int(height)
-
-        objects_dict = _parse_yolov5_label_file(anno_filename, width, height)
-        cur_img['objects'] = objects_dict
+        cur_img['objects'] = objects
 
         output_jdict_imgs.append(cur_img)
 
-    output_jdict['images'] = output_jdict_imgs
+    return output_jdict_imgs
+
+
+def from_yolo_txt(img_annof_relation: str, anno_files: list, image_files: list, target_folder: str) -> str:
+    if img_annof_relation != '11':
+        return
+
+    output_jdict = dict()
+    output_jdict['mode'] = 'annotation'
+    output_jdict['twconverted'] = '96E7D8C8-44E4-4055-8487-85B3208E51A2'
+    output_jdict['template_version'] = "0.1"
+    output_jdict['images'] = to_yolo_images(anno_files, image_files)
 
     # take the folder name as the fname
     filename = os.path.basename(os.path.dirname(anno_files[0]))
 
     # directly write to the destination
     target_filename = os.path.join(target_folder, filename + '.json')
-    with open(target_filename, 'w', encoding='utf-8') as jf:
-        json.dump(output_jdict, jf, indent=2, ensure_ascii=False)
+    json_codec.dump_file(output_jdict, target_filename)
 
     st.write("Converted {}".format(filename))
 
     return target_filename
 
 
-def from_gpr_json(img_annof_relation: str, anno_file_list: list, target_folder: str) -> str:
-    if img_annof_relation != '11':
-        return
-
-    output_jdict = dict()
-    output_jdict['mode'] = 'annotation'
-    output_jdict['twconverted'] = '96E7D8C8-44E4-4055-8487-85B3208E51A2'
-    output_jdict['template_version'] = "0.1"
-
+def to_gpr_images(anno_file_list: list, data_files: list = None) -> list:
+    """
+    :param anno_file_list: GPR json filenames, one per image
+    :param data_files: image filenames; the images are looked up in the parent folder of the json folder if None
+    :return: DataLabels image dictionaries
+    """
     output_jdict_imgs = list()
 
-    for image_id, anno_json_file in enumerate(anno_file_list):
+    jdicts = list()
+    for anno_json_file in anno_file_list:
         with open(anno_json_file, 'r', encoding='utf-8') as jf:
-            jdict = json.load(jf)
+            jdicts.append(json.load(jf))
+
+    data_files_dict = {os.path.basename(data_file): data_file for data_file in data_files or []}
+    image_filenames = [data_files_dict.get(os.path.basename(jdict['fileName']),
+                                           os.path.join(os.path.dirname(os.path.dirname(anno_json_file)),
+                                                        os.path.basename(jdict['fileName'])))
+                       for anno_json_file, jdict in zip(anno_file_list, jdicts)]
+    # read the image headers in a batch
+    image_sizes = image_probe.get_image_sizes(image_filenames)
 
+    for image_id, (jdict, (width, height)) in enumerate(zip(jdicts, image_sizes)):
         cur_img = dict()
         cur_img['image_id'] = str(image_id)
         cur_img['name'] = os.path.basename(jdict['fileName'])
 
-        image_dir = os.path.dirname(os.path.dirname(anno_json_file))
-        image_filename = os.path.join(image_dir, cur_img['name'])
-        width, height = utils.get_resolution(image_filename)
-
         cur_img['width'] = int(width)
         cur_img['height'] = int(height)
 
@@ -159,7 +202,18 @@ def from_gpr_json(img_annof_relation: str, anno_file_list: list, target_folder:
 
         output_jdict_imgs.append(cur_img)
 
-    output_jdict['images'] = output_jdict_imgs
+    return output_jdict_imgs
+
+
+def from_gpr_json(img_annof_relation: str, anno_file_list: list, target_folder: str) -> str:
+    if img_annof_relation != '11':
+        return
+
+    output_jdict = dict()
+    output_jdict['mode'] = 'annotation'
+    output_jdict['twconverted'] = '96E7D8C8-44E4-4055-8487-85B3208E51A2'
+    output_jdict['template_version'] = "0.1"
+    output_jdict['images'] = to_gpr_images(anno_file_list)
 
     # take the folder name as the fname
     filename = os.path.basename(os.path.dirname(anno_file_list[0]))
@@ -174,18 +228,11 @@ def from_gpr_json(img_annof_relation: str, anno_file_list: list, target_folder:
     return target_filename
 
 
-# 우선은 default PASCAL VOC 포맷처럼, bounding box에 대한 변환작업만 수행
-def convert_PASCAL_to_Form(img_annof_relation, anno_file_list, target_folder):
-    if img_annof_relation != '11':
-        return
-
-    output_jdict = dict()
-
-    # 최종 산출물인 json 파일에 default로 들어있는 key-value값
-    output_jdict['mode'] = 'annotation'
-    output_jdict['twconverted'] = '96E7D8C8-44E4-4055-8487-85B3208E51A2'
-    output_jdict['template_version'] = "0.1"
-
+def to_pascal_images(anno_file_list: list) -> list:
+    """
+    :param anno_file_list: PASCAL VOC xml filenames, one per image
+    :return: ADQ image dictionaries
+    """
     # output_jdict_imgs : 최종 산출물인 json 파일의 images의 value가 될 이미지 list
     output_jdict_imgs = list()
 
@@ -267,7 +314,22 @@ def convert_PASCAL_to_Form(img_annof_relation, anno_file_list, target_folder):
         # 현재 이미지(cur_img)에 대한 처리가 완료되면, output_jdict_imgs에 현재 이미지 관련 정보를 추가한다.
         output_jdict_imgs.append(cur_img)
 
-    output_jdict['images'] = output_jdict_imgs
+    return output_jdict_imgs
+
+
+# 우선은 default PASCAL VOC 포맷처럼, bounding box에 대한 변환작업만 수행
+def convert_PASCAL_to_Form(img_annof_relation, anno_file_list, target_folder):
+    if img_annof_relation != '11':
+        return
+
+    output_jdict = dict()
+
+    # 최종 산출물인 json 파일에 default로 들어있는 key-value값
+    output_jdict['mode'] = 'annotation'
+    output_jdict['twconverted'] = '96E7D8C8-44E4-4055-8487-85B3208E51A2'
+    output_jdict['template_version'] = "0.1"
+
+    output_jdict['images'] = to_pascal_images(anno_file_list)
 
     # copy the original annotation files under origin
     target_ori_folder = os.path.join(target_folder, "origin")
@@ -303,245 +365,139 @@ def convert_COCO_to_Form(img_annof_relation, data_directory, annotation_fmt):
 
 
     if img_annof_relation == 'N1':
-        output_jdict = dict()
-
-        with open(os.path.join(data_directory, anno_file_list[0]), 'r', encoding='utf-8') as jf:
-            coco_jdict = json.load(jf)
-
-        # COCO json의 경우, images, annotations, categories라는 key를 가지고 있으며
-        # images : 현재 어노테이션 파일의 target인 이미지들의 list
-        # annotations : 현재 어노테이션 파일이 표기한 객체들의 list
-        # categories : 현재 어노테이션 파일의 class category의 list
-        coco_img_list = coco_jdict['images']
-        coco_label_list = coco_jdict['categories']
-        coco_anno_list = coco_jdict['annotations']
-
-
-        # 기본적으로 COCO json의 category는
-        # 'id', 'name', 'supercategory'라는 3개의 key를 보관하고 있다.
-        # 'name'(우리가 class라고 부르는 대상)의 상위 개체를 'supercategory'로 표기하지만
-        # 현재 변환 기능에서는 필요하지 않은 정보이므로
-        #
-        # { "category_id" : "class 이름" }인 dictionary를 만들어주는 과정을 아래 line의 코드에서 수행한다.
-        coco_label_dict = dict()
-        for each_label in coco_label_list:
-            coco_label_dict[each_label['id']] = each_label['name']
-
-
-        # 기본적으로 COCO json의 image는
-        # 우리가 필요한 "id", "file_name", "width", "height"의 key를 보관하고 있다.
-        #
-        # 아래 line의 코드에서는
-        # {
-        #     "image_id" : {
-        #                      "dest_image_id" :,
-        #                      "dest_name" :,
-        #                      "dest_width" :,
-        #                      "dest_height" :,
-        #                      "dest_objects" : []
-        #                   }
-        # }
-        # 인 dictionary를 만들어주는 과정을 수행한다.
-        coco_image_dict = dict()
-        for each_img in coco_img_list:
-            cur_img = dict()
-            cur_img['image_id'] = str(each_img['id'])
-            cur_img['name'] = str(each_img['file_name'])
-            cur_img['width'] = str(each_img['width'])
-            cur_img['height'] = str(each_img['height'])
-            cur_img['objects'] = list()
-
-            coco_image_dict[each_img['id']] = cur_img
-
-
-        # 기본적으로 COCO json의 annotations는
-        # 해당 객체의 최외곽 사각형을 라벨링한 'box'라는 key와
-        # 해당 객체를 구성하는 1개 이상의 polygon(1개 이상인 경우, 앞의 객체로 겹쳐진 경우 각각)을 라벨링한
-        # 'segmentation'이라는 key를 보관하고 있다.
-        #
-        # 따라서, box 객체와, segmentation을 구성하는 각 polygon은 동일한 객체를 의미하기 때문에
-        # 최종 산출물인 tw json annotation 파일에서는 group_id라는 key를 통해서 동일한 객체를 표기하도록 해야한다.
-        # 아래 cur_group_id는 group_id의 value 역할을 수행하기 위한 변수이다.
-        cur_group_id = 0
-        for each_anno in coco_anno_list:
-            # box 객체에 대한 정보를 추가해주는 코드
-            cur_box_obj = dict()
-            cur_box_obj['label'] = coco_label_dict[each_anno['category_id']]
-            cur_box_obj['type'] = 'box'
-            cur_box_obj['occluded'] = "0"
-            cur_box_obj['z_order'] = "0"
-            cur_box_obj['group_id'] = str(cur_group_id)
-
-            box_position = str(each_anno['bbox'][0]) + ', ' + str(each_anno['bbox'][1]) + ', ' + str(each_anno['bbox'][0] + each_anno['bbox'][2]) + ', ' + str(each_anno['bbox'][1] + each_anno['bbox'][3])
-
-            cur_box_obj['position'] = box_position
-
-            # 대응하는 이미지에, box 객체(cur_box_obj) 정보를 추가해주는 코드
-            coco_image_dict[each_anno['image_id']]['objects'].append(cur_box_obj)
-
-            # polygons : segmentation을 구성하는 polygon 객체
-            polygons = each_anno['segmentation']
-
-            # 따라서 1회 이상 for loop 연산을 수행한다.
-            for each_polygon in polygons:
-                cur_obj = dict()
-                cur_obj['label'] = coco_label_dict[each_anno['category_id']]
-                cur_obj['type'] = 'polygon'
-                cur_obj['occluded'] = "0"
-                cur_obj['z_order'] = "0"
-                cur_obj['group_id'] = str(cur_group_id)
-
-                num_of_points = len(each_polygon) // 2
-
-                str_point_list = list()
-
-                for idx in range(num_of_points):
-                    new_point = str(each_polygon[2*idx]) + ',' + str(each_polygon[2*idx+1])
-                    str_point_list.append(new_point)
-
-                cur_obj['position'] = ';'.join(str_point_list)
-
-                # 대응하는 이미지에, polygon 객체(cur_obj) 정보를 추가해주는 코드
-                coco_image_dict[each_anno['image_id']]['objects'].append(cur_obj)
-
-            cur_group_id += 1
-
-
-        new_img_list = list()
-        for each_key in coco_image_dict:
-            new_img_list.append(coco_image_dict[each_key])
-
-
-        # 최종 산출물인 json 파일에 default로 들어있는 key-value값
-        output_jdict['mode'] = 'annotation'
-        output_jdict['twconverted'] = '96E7D8C8-44E4-4055-8487-85B3208E51A2'
-        output_jdict['template_version'] = "0.1"
-        
-        output_jdict['images'] = new_img_list
-
+        # COCO json의 categories, images, annotations를 스트리밍으로 읽어서 이미지별로 묶어 변환한다.
+        # (see src.converters.coco_reader)
+        fname, ext = os.path.splitext(anno_file_list[0])
+        converted_filename = os.path.join(data_directory, fname + '.converted')
+        COCOReader().convert([os.path.join(data_directory, anno_file_list[0])], converted_filename)
 
-        # 최종 산출물일 dictionary 객체(output_jdict) 연산이 완료되면
+        # 변환이 완료되면
         # 우선 원본 어노테이션 파일을 데이터 폴더\origin 폴더로 이동시켜서 원본 어노테이션 파일(json)을 백업한다.
         # 아래 저장하는 코드와 순서가 바뀌면
         # 원본 어노테이션 정보가 날아가는 오류가 발생하기 때문에 주의가 필요하다.
         shutil.move(os.path.join(data_directory, anno_file_list[0]), os.path.join(data_directory, 'origin'))
 
-        fname, ext = os.path.splitext(anno_file_list[0])
-
         # 그리고나서, 원본 어노테이션 파일이름.json으로 데이터를 저장하면 작업이 완료된다.
-        with open(os.path.join(data_directory, fname + '.json'), 'w', encoding='utf-8') as jf:
-            json.dump(output_jdict, jf, indent=4, ensure_ascii=False)
+        os.replace(converted_filename, os.path.join(data_directory, fname + '.json'))
 
 
-# SuperbAI의 json 파일을 검증도구에서 사용할 포맷으로 변경할 떄 사용하는 함수
-def convert_SUPERBAI_to_Form(img_annof_relation, data_directory, annotation_fmt):
-    # file_format : 어노테이션 파일 포맷('xml')
-    # anno_file_list : 현재 데이터 폴더(data_directory)에 있는 어노테이션 파일의 목록
-    file_format = annotation_fmt.split(' ')[-1]
-    anno_file_list = collect_org_annofile_as_list(data_directory, file_format, img_annof_relation)
+def to_superbai_images(anno_file_list: list) -> list:
+    """
+    :param anno_file_list: Superb AI json filenames, one per image
+    :return: ADQ image dictionaries
+    """
+    # SuperbAI가 지원하는 객체 타입
+    SuperbAI_object_types = ['box', 'polygon', 'polyline']
 
-    if img_annof_relation == '11':
-        output_jdict = dict()
+    # output_jdict_imgs : 최종 산출물인 json 파일의 images의 value가 될 이미지 list
+    output_jdict_imgs = list()
 
-        # SuperbAI가 지원하는 객체 타입
-        SuperbAI_object_types = ['box', 'polygon', 'polyline']
+    # 전달받은 Superb AI 데이터의 경우, 이미지 : 어노테이션 파일의 관계가 1 : 1이기 때문에
+    # 별도의 image_id 정보가 없다.
+    # id_idx가 대신 image_id 역할을 하기위해 선언한 변수
+    id_idx = 0
 
-        # 최종 산출물인 json 파일에 default로 들어있는 key-value값
-        output_jdict['mode'] = 'annotation'
-        output_jdict['twconverted'] = '96E7D8C8-44E4-4055-8487-85B3208E51A2'
-        output_jdict['template_version'] = "0.1"
+    # 전달받은 Superb AI 데이터의 경우, 이미지 : 어노테이션 파일의 관계가 1 : 1이기 때문에
+    # 어노테이션 파일 개수만큼 for loop를 수행해야 output_jdict의 images value를 얻어낼 수 있다.
+    for each_jsonfile in anno_file_list:
+        cur_img = dict()
+        cur_img['image_id'] = str(id_idx)
+        id_idx += 1
 
-        # output_jdict_imgs : 최종 산출물인 json 파일의 images의 value가 될 이미지 list
-        output_jdict_imgs = list()
+        with open(each_jsonfile, 'r', encoding='utf-8') as jf:
+            superb_jdict = json.load(jf)
 
-        # 전달받은 Superb AI 데이터의 경우, 이미지 : 어노테이션 파일의 관계가 1 : 1이기 때문에
-        # 별도의 image_id 정보가 없다.
-        # id_idx가 대신 image_id 역할을 하기위해 선언한 변수
-        id_idx = 0
+        cur_img['name'] = os.path.basename(superb_jdict['data_key'])
 
-        # 전달받은 Superb AI 데이터의 경우, 이미지 : 어노테이션 파일의 관계가 1 : 1이기 때문에
-        # 어노테이션 파일 개수만큼 for loop를 수행해야 output_jdict의 images value를 얻어낼 수 있다.
-        for each_jsonfile in anno_file_list:
-            cur_img = dict()
-            cur_img['image_id'] = str(id_idx)
-            id_idx += 1
+        # 전달받은 Superb AI 데이터의 경우, 이미지의 width, height 정보가 없다.
+        # 따라서, width 및 height 정보를 빈 문자열('')로 값을 지정해준다.
+        cur_img['width'] = ''
+        cur_img['height'] = ''
 
-            with open(os.path.join(data_directory, each_jsonfile), 'r', encoding='utf-8') as jf:
-                superb_jdict = json.load(jf)
+        # cur_img_objlist : 현재 이미지가 가지고 있는 객체('objects')의 value가 될 객체 list
+        cur_img_objlist = list()
 
-            cur_img['name'] = os.path.basename(superb_jdict['data_key'])
+        # 전달받은 Superb AI 데이터의 경우, 라벨링 데이터가 이중으로 묶여있는 특이한 형태를 띄기 때문에 주의가 필요하다.
+        obj_info = superb_jdict['annotation_result']['objects']
 
-            # 전달받은 Superb AI 데이터의 경우, 이미지의 width, height 정보가 없다.
-            # 따라서, width 및 height 정보를 빈 문자열('')로 값을 지정해준다.
-            cur_img['width'] = ''
-            cur_img['height'] = ''
 
-            # cur_img_objlist : 현재 이미지가 가지고 있는 객체('objects')의 value가 될 객체 list
-            cur_img_objlist = list()
+        for each_obj_info in obj_info:
+            cur_obj = dict()
 
-            # 전달받은 Superb AI 데이터의 경우, 라벨링 데이터가 이중으로 묶여있는 특이한 형태를 띄기 때문에 주의가 필요하다.
-            obj_info = superb_jdict['annotation_result']['objects']
+            # 전달받은 Superb AI 데이터의 경우, 객체 type(shape)가 단일 key-value로 이루어진 dictionry이기 떄문에
+            # dictionary.items로 1번째 인덱스와 그외로 접근하는 방식을 택함
+            shape_value = each_obj_info['shape']
+            (shape_type, position_info), = shape_value.items()
 
+            # 전달받은 Superb AI 데이터의 경우, COCO style의 keypoint를 지원하기 때문에
+            # keypoint는 변환 작업을 수행하지 않도록 if 분기문 사용
+            if shape_type not in SuperbAI_object_types:
+                continue
 
-            for each_obj_info in obj_info:
-                cur_obj = dict()
+            cur_obj['type'] = shape_type
+            cur_obj['label'] = each_obj_info['class']
+            cur_obj['occluded'] = "0"
+            cur_obj['z_order'] = "0"
+            cur_obj['group_id'] = ""
 
-                # 전달받은 Superb AI 데이터의 경우, 객체 type(shape)가 단일 key-value로 이루어진 dictionry이기 떄문에
-                # dictionary.items로 1번째 인덱스와 그외로 접근하는 방식을 택함
-                shape_value = each_obj_info['shape']
-                (shape_type, position_info), = shape_value.items()
+            if shape_type == 'box':
+                xtl = position_info['x']
+                ytl = position_info['y']
+                xbr = position_info['x'] + position_info['width']
+                ybr = position_info['y'] + position_info['height']
 
-                # 전달받은 Superb AI 데이터의 경우, COCO style의 keypoint를 지원하기 때문에
-                # keypoint는 변환 작업을 수행하지 않도록 if 분기문 사용
-                if shape_type not in SuperbAI_object_types:
-                    continue
+                position_value = str(xtl) + ', ' + str(ytl) + ', ' + str(xbr) + ', ' + str(ybr)
 
-                cur_obj['type'] = shape_type
-                cur_obj['label'] = each_obj_info['class']
-                cur_obj['occluded'] = "0"
-                cur_obj['z_order'] = "0"
-                cur_obj['group_id'] = ""
+            # shape_type이 polygon이나 polyline인 경우
+            else:
+                str_point_list = list()
+                for each_point in position_info:
+                    str_point = str(each_point['x']) + ',' + str(each_point['y'])
+                    str_point_list.append(str_point)
 
-                if shape_type == 'box':
-                    xtl = position_info['x']
-                    ytl = position_info['y']
-                    xbr = position_info['x'] + position_info['width']
-                    ybr = position_info['y'] + position_info['height']
+                position_value = ';'.join(str_point_list)
 
-                    position_value = str(xtl) + ', ' + str(ytl) + ', ' + str(xbr) + ', ' + str(ybr)
+            cur_obj['position'] = position_value
 
-                # shape_type이 polygon이나 polyline인 경우
-                else:
-                    str_point_list = list()
-                    for each_point in position_info:
-                        str_point = str(each_point['x']) + ',' + str(each_point['y'])
-                        str_point_list.append(str_point)
 
-                    position_value = ';'.join(str_point_list)
+            cur_obj_attrlist = list()
 
-                cur_obj['position'] = position_value
+            for each_attr in each_obj_info['properties']:
+                cur_attr = dict()
+                cur_attr['attribute_name'] = each_attr['name']
+                cur_attr['attribute_value'] = each_attr['value']
+                cur_obj_attrlist.append(cur_attr)
 
+            cur_obj['attributes'] = cur_obj_attrlist
 
-                cur_obj_attrlist = list()
+            # 각 객체에 대한 처리가 완료되면, cur_img_objlist에 현재 객체(cur_obj)를 추가해준다.
+            cur_img_objlist.append(cur_obj)
 
-                for each_attr in each_obj_info['properties']:
-                    cur_attr = dict()
-                    cur_attr['attribute_name'] = each_attr['name']
-                    cur_attr['attribute_value'] = each_attr['value']
-                    cur_obj_attrlist.append(cur_attr)
 
-                cur_obj['attributes'] = cur_obj_attrlist
+        cur_img['objects'] = cur_img_objlist
 
-                # 각 객체에 대한 처리가 완료되면, cur_img_objlist에 현재 객체(cur_obj)를 추가해준다.
-                cur_img_objlist.append(cur_obj)
+        # 현재 이미지(cur_img)에 대한 처리가 완료되면, output_jdict_imgs에 현재 이미지 관련 정보를 추가한다.
+        output_jdict_imgs.append(cur_img)
+    return output_jdict_imgs
 
 
-            cur_img['objects'] = cur_img_objlist
+# SuperbAI의 json 파일을 검증도구에서 사용할 포맷으로 변경할 떄 사용하는 함수
+def convert_SUPERBAI_to_Form(img_annof_relation, data_directory, annotation_fmt):
+    # file_format : 어노테이션 파일 포맷('xml')
+    # anno_file_list : 현재 데이터 폴더(data_directory)에 있는 어노테이션 파일의 목록
+    file_format = annotation_fmt.split(' ')[-1]
+    anno_file_list = collect_org_annofile_as_list(data_directory, file_format, img_annof_relation)
 
-            # 현재 이미지(cur_img)에 대한 처리가 완료되면, output_jdict_imgs에 현재 이미지 관련 정보를 추가한다.
-            output_jdict_imgs.append(cur_img)
+    if img_annof_relation == '11':
+        output_jdict = dict()
+
+        # 최종 산출물인 json 파일에 default로 들어있는 key-value값
+        output_jdict['mode'] = 'annotation'
+        output_jdict['twconverted'] = '96E7D8C8-44E4-4055-8487-85B3208E51A2'
+        output_jdict['template_version'] = "0.1"
 
-        output_jdict['images'] = output_jdict_imgs
+        output_jdict['images'] = to_superbai_images([os.path.join(data_directory, anno_file)
+                                                     for anno_file in anno_file_list])
 
         # 최종 산출물일 dictionary 객체(output_jdict) 연산이 완료되면
         # 우선 원본 어노테이션 파일을 데이터 폴더\origin 폴더로 이동시켜서 원본 어노테이션 파일들(json)을 백업한다.
@@ -555,103 +511,110 @@ def convert_SUPERBAI_to_Form(img_annof_relation, data_directory, annotation_fmt)
             json.dump(output_jdict, jf, indent=4, ensure_ascii=False)
 
 
-# AIMMO의 json 파일을 검증도구에서 사용할 포맷으로 변경할 떄 사용하는 함수
-def convert_AIMMO_to_Form(img_annof_relation, data_directory, annotation_fmt):
-    # file_format : 어노테이션 파일 포맷('xml')
-    # anno_file_list : 현재 데이터 폴더(data_directory)에 있는 어노테이션 파일의 목록
-    file_format = annotation_fmt.split(' ')[-1]
-    anno_file_list = collect_org_annofile_as_list(data_directory, file_format, img_annof_relation)
+def to_aimmo_images(anno_file_list: list) -> list:
+    """
+    :param anno_file_list: AIMMO json filenames, one per image
+    :return: ADQ image dictionaries
+    """
+    # AIMMO가 지원하는 객체 타입
+    Annotation_AI_object_types = { 'bbox' : 'box', 'poly_seg' : 'polygon' }
 
-    if img_annof_relation == '11':
-        output_jdict = dict()
+    # output_jdict_imgs : 최종 산출물인 json 파일의 images의 value가 될 이미지 list
+    output_jdict_imgs = list()
 
-        # AIMMO가 지원하는 객체 타입
-        Annotation_AI_object_types = { 'bbox' : 'box', 'poly_seg' : 'polygon' }
+    # 전달받은 AIMMO 데이터의 경우, 별도의 image_id 정보가 존재하지만
+    # GUID와 같이 unique한 문자열로 표현되어 있어서, 뷰어에서 오류를 발생할 수도 있기 때문에 id_idx 사용
+    id_idx = 0
 
+    # 전달받은 Annotation AI 데이터의 경우, 이미지 : 어노테이션 파일의 관계가 1 : 1이기 때문에
+    # 어노테이션 파일 개수만큼 for loop를 수행해야 output_jdict의 images value를 얻어낼 수 있다.
+    for each_jsonfile in anno_file_list:
+        cur_img = dict()
+        cur_img['image_id'] = str(id_idx)
+        id_idx += 1
 
-        # 최종 산출물인 json 파일에 default로 들어있는 key-value값
-        output_jdict['mode'] = 'annotation'
-        output_jdict['twconverted'] = '96E7D8C8-44E4-4055-8487-85B3208E51A2'
-        output_jdict['template_version'] = "0.1"
+        with open(each_jsonfile, 'r', encoding='utf-8') as jf:
+            annotation_jdict = json.load(jf)
 
-        # output_jdict_imgs : 최종 산출물인 json 파일의 images의 value가 될 이미지 list
-        output_jdict_imgs = list()
+        cur_img['name'] = os.path.basename(annotation_jdict['filename'])
+        cur_img['width'] = annotation_jdict['camera']['resolution_width']
+        cur_img['height'] = annotation_jdict['camera']['resolution_height']
 
-        # 전달받은 AIMMO 데이터의 경우, 별도의 image_id 정보가 존재하지만
-        # GUID와 같이 unique한 문자열로 표현되어 있어서, 뷰어에서 오류를 발생할 수도 있기 때문에 id_idx 사용
-        id_idx = 0
+        # cur_img_objlist : 현재 이미지가 가지고 있는 객체('objects')의 value가 될 객체 list
+        cur_img_objlist = list()
 
-        # 전달받은 Annotation AI 데이터의 경우, 이미지 : 어노테이션 파일의 관계가 1 : 1이기 때문에
-        # 어노테이션 파일 개수만큼 for loop를 수행해야 output_jdict의 images value를 얻어낼 수 있다.
-        for each_jsonfile in anno_file_list:
-            cur_img = dict()
-            cur_img['image_id'] = str(id_idx)
-            id_idx += 1
+        for each_obj_info in annotation_jdict['annotations']:
+            cur_obj = dict()
 
-            with open(os.path.join(data_directory, each_jsonfile), 'r', encoding='utf-8') as jf:
-                annotation_jdict = json.load(jf)
+            shape_type = each_obj_info['type']
 
-            cur_img['name'] = os.path.basename(annotation_jdict['filename'])
-            cur_img['width'] = annotation_jdict['camera']['resolution_width']
-            cur_img['height'] = annotation_jdict['camera']['resolution_height']
+            # 전달받은 Annotation AI 데이터의 경우, 11개의 keypoint를 가지는 특이한 pose를 지원하기 때문에
+            # keypoint는 변환 작업을 수행하지 않도록 if 분기문 사용
+            if shape_type not in Annotation_AI_object_types.keys():
+                continue
 
-            # cur_img_objlist : 현재 이미지가 가지고 있는 객체('objects')의 value가 될 객체 list
-            cur_img_objlist = list()
+            cur_obj['type'] = Annotation_AI_object_types[shape_type]
+            cur_obj['label'] = each_obj_info['label']
+            cur_obj['occluded'] = "0"
+            cur_obj['z_order'] = "0"
+            cur_obj['group_id'] = ""
 
-            for each_obj_info in annotation_jdict['annotations']:
-                cur_obj = dict()
+            if shape_type == 'bbox':
+                xtl = each_obj_info['points'][0][0]
+                ytl = each_obj_info['points'][0][1]
+                xbr = each_obj_info['points'][2][0]
+                ybr = each_obj_info['points'][2][1]
 
-                shape_type = each_obj_info['type']
+                position_value = str(xtl) + ', ' + str(ytl) + ', ' + str(xbr) + ', ' + str(ybr)
 
-                # 전달받은 Annotation AI 데이터의 경우, 11개의 keypoint를 가지는 특이한 pose를 지원하기 때문에
-                # keypoint는 변환 작업을 수행하지 않도록 if 분기문 사용
-                if shape_type not in Annotation_AI_object_types.keys():
-                    continue
+            # shape_type이 poly_seg인 경우
+            else:
+                str_point_list = list()
+                for each_point in each_obj_info['points']:
+                    str_point = str(each_point[0]) + ',' + str(each_point[1])
+                    str_point_list.append(str_point)
+                position_value = ';'.join(str_point_list)
 
-                cur_obj['type'] = Annotation_AI_object_types[shape_type]
-                cur_obj['label'] = each_obj_info['label']
-                cur_obj['occluded'] = "0"
-                cur_obj['z_order'] = "0"
-                cur_obj['group_id'] = ""
+            cur_obj['position'] = position_value
 
-                if shape_type == 'bbox':
-                    xtl = each_obj_info['points'][0][0]
-                    ytl = each_obj_info['points'][0][1]
-                    xbr = each_obj_info['points'][2][0]
-                    ybr = each_obj_info['points'][2][1]
 
-                    position_value = str(xtl) + ', ' + str(ytl) + ', ' + str(xbr) + ', ' + str(ybr)
+            cur_obj_attrlist = list()
 
-                # shape_type이 poly_seg인 경우
-                else:
-                    str_point_list = list()
-                    for each_point in each_obj_info['points']:
-                        str_point = str(each_point[0]) + ',' + str(each_point[1])
-                        str_point_list.append(str_point)
-                    position_value = ';'.join(str_point_list)
+            for each_attr_key in each_obj_info['attributes']:
+                cur_attr = dict()
+                cur_attr['attribute_name'] = each_attr_key
+                cur_attr['attribute_value'] = each_obj_info['attributes'][each_attr_key]
+                cur_obj_attrlist.append(cur_attr)
 
-                cur_obj['position'] = position_value
+            cur_obj['attributes'] = cur_obj_attrlist
 
+            # 각 객체에 대한 처리가 완료되면, cur_img_objlist에 현재 객체(cur_obj)를 추가해준다.
+            cur_img_objlist.append(cur_obj)
 
-                cur_obj_attrlist = list()
+        cur_img['objects'] = cur_img_objlist
 
-                for each_attr_key in each_obj_info['attributes']:
-                    cur_attr = dict()
-                    cur_attr['attribute_name'] = each_attr_key
-                    cur_attr['attribute_value'] = each_obj_info['attributes'][each_attr_key]
-                    cur_obj_attrlist.append(cur_attr)
+        # 현재 이미지(cur_img)에 대한 처리가 완료되면, output_jdict_imgs에 현재 이미지 관련 정보를 추가한다.
+        output_jdict_imgs.append(cur_img)
+    return output_jdict_imgs
 
-                cur_obj['attributes'] = cur_obj_attrlist
 
-                # 각 객체에 대한 처리가 완료되면, cur_img_objlist에 현재 객체(cur_obj)를 추가해준다.
-                cur_img_objlist.append(cur_obj)
+# AIMMO의 json 파일을 검증도구에서 사용할 포맷으로 변경할 떄 사용하는 함수
+def convert_AIMMO_to_Form(img_annof_relation, data_directory, annotation_fmt):
+    # file_format : 어노테이션 파일 포맷('xml')
+    # anno_file_list : 현재 데이터 폴더(data_directory)에 있는 어노테이션 파일의 목록
+    file_format = annotation_fmt.split(' ')[-1]
+    anno_file_list = collect_org_annofile_as_list(data_directory, file_format, img_annof_relation)
 
-            cur_img['objects'] = cur_img_objlist
+    if img_annof_relation == '11':
+        output_jdict = dict()
 
-            # 현재 이미지(cur_img)에 대한 처리가 완료되면, output_jdict_imgs에 현재 이미지 관련 정보를 추가한다.
-            output_jdict_imgs.append(cur_img)
+        # 최종 산출물인 json 파일에 default로 들어있는 key-value값
+        output_jdict['mode'] = 'annotation'
+        output_jdict['twconverted'] = '96E7D8C8-44E4-4055-8487-85B3208E51A2'
+        output_jdict['template_version'] = "0.1"
 
-        output_jdict['images'] = output_jdict_imgs
+        output_jdict['images'] = to_aimmo_images([os.path.join(data_directory, anno_file)
+                                                  for anno_file in anno_file_list])
 
         # 최종 산출물일 dictionary 객체(output_jdict) 연산이 완료되면
         # 우선 원본 어노테이션 파일을 데이터 폴더\origin 폴더로 이동시켜서 원본 어노테이션 파일들(json)을 백업한다.
@@ -0,0 +1,207 @@
+import os
+import threading
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from src.common import json_codec
+from src.common.constants import SUPPORTED_IMAGE_FILE_EXTENSIONS
+from src.common.logger import get_logger
+
+logger = get_logger(__name__)
+
+"""
+.. module:: file_catalog
+   :synopsis: incremental catalog of the files of a project
+   The files under a project folder are listed with os.scandir, a single pass per folder, and kept in
+   <project>/.catalog/files.parquet, a row per file:
+        folder, name, extension, size, mtime_ns, ctime
+   The schema metadata keeps the generation number and the mtime and the sub-folders of every folder.
+   On refresh, only the folders whose mtime changed (a file was added, removed or replaced) are scanned again
+   and the generation number is incremented when a folder changed, so that st.cache_data can be keyed on
+   (project folder, generation) instead of hashing the file lists.
+   A file rewritten in place does not change the mtime of its folder: refresh(full=True) scans all the folders.
+"""
+
+CATALOG_FOLDER = ".catalog"
+CATALOG_FILENAME = "files.parquet"
+CATALOG_VERSION = "1"
+
+_SCHEMA = pa.schema([
+    ("folder", pa.string()),
+    ("name", pa.string()),
+    ("extension", pa.string()),
+    ("size", pa.int64()),
+    ("mtime_ns", pa.int64()),
+    ("ctime", pa.float64()),
+])
+
+
+def _scan_folder(path: str, is_root: bool) -> (list, list):
+    """
+    :param path: folder
+    :param is_root: the project folder, of which the catalog folder is skipped
+    :return: (sorted sub-folder names, sorted (name, extension, size, mtime_ns, ctime) of the files)
+    """
+    subfolders, files = [], []
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                if not (is_root and entry.name == CATALOG_FOLDER):
+                    subfolders.append(entry.name)
+            elif entry.is_file():
+                file_stat = entry.stat()
+                files.append((entry.name, os.path.splitext(entry.name)[1][1:], file_stat.st_size,
+                              file_stat.st_mtime_ns, file_stat.st_ctime))
+    subfolders.sort()
+    files.sort()
+    return subfolders, files
+
+
+class FileCatalog:
+    def __init__(self, project_folder: str):
+        """
+        :param project_folder: ADQ_WORKING_FOLDER/<project>
+        """
+        self.project_folder = os.path.normpath(project_folder)
+        self.generation = 0
+        # relative folder -> (mtime_ns, sub-folder names)
+        self._folders = dict()
+        # relative folder -> [(name, extension, size, mtime_ns, ctime)]
+        self._files = dict()
+        self._data_frame = None
+
+    def get_catalog_filename(self) -> str:
+        return os.path.join(self.project_folder, CATALOG_FOLDER, CATALOG_FILENAME)
+
+    def refresh(self, full: bool = False) -> bool:
+        """
+        scan the folders that changed since the last refresh
+        :param full: scan all the folders
+        :return: True if a folder changed
+        """
+        folders, files = dict(), dict()
+        changed = False
+        stack = [""]
+        while stack:
+            folder = stack.pop()
+            try:
+                mtime_ns = os.stat(os.path.join(self.project_folder, folder)).st_mtime_ns
+            except FileNotFoundError:
+                continue
+
+            cached = self._folders.get(folder)
+            if not full and cached and cached[0] == mtime_ns:
+                subfolders, folder_files = cached[1], self._files.get(folder, [])
+            else:
+                subfolders, folder_files = _scan_folder(os.path.join(self.project_folder, folder), folder == "")
+                changed |= cached is None or subfolders != cached[1] or folder_files != self._files.get(folder, [])
+
+            folders[folder] = (mtime_ns, subfolders)
+            if folder_files:
+                files[folder] = folder_files
+            stack.extend(os.path.join(folder, subfolder) for subfolder in subfolders)
+
+        # the removed folders
+        changed |= folders.keys() != self._folders.keys()
+        self._folders, self._files = folders, files
+        if changed:
+            self.generation += 1
+            self._data_frame = None
+            if folders:
+                self._save()
+        return changed
+
+    def get_files(self, folder: str = None, extensions: list = None) -> pd.DataFrame:
+        """
+        :param folder: folder relative to the project folder (e.g., "data"); all the folders if None
+        :param extensions: file extensions without the dot; all the files if None
+        :return: the rows of the files (see the columns above)
+        """
+        if self._data_frame is None:
+            self._data_frame = pd.DataFrame([(folder_name,) + file for folder_name, folder_files in self._files.items()
+                                             for file in folder_files], columns=_SCHEMA.names)
+        data_frame = self._data_frame
+        if folder is not None:
+            data_frame = data_frame[data_frame['folder'] == os.path.normpath(folder)]
+        if extensions is not None:
+            data_frame = data_frame[data_frame['extension'].isin(extensions)]
+        return data_frame
+
+    def list_files(self, folder: str, extensions: list = SUPPORTED_IMAGE_FILE_EXTENSIONS) -> list:
+        """
+        :param folder: folder relative to the project folder
+        :param extensions: file extensions without the dot
+        :return: sorted filenames including the project folder
+        """
+        folder = os.path.normpath(folder)
+        folder_path = os.path.join(self.project_folder, folder)
+        return [os.path.join(folder_path, name) for name, extension, *_ in self._files.get(folder, [])
+                if extensions is None or extension in extensions]
+
+    def count_files(self, folder: str, extensions: list = SUPPORTED_IMAGE_FILE_EXTENSIONS) -> int:
+        folder = os.path.normpath(folder)
+        return sum(1 for _, extension, *_ in self._files.get(folder, [])
+                   if extensions is None or extension in extensions)
+
+    def _save(self):
+        catalog_filename = self.get_catalog_filename()
+        os.makedirs(os.path.dirname(catalog_filename), exist_ok=True)
+        folders = {folder: [mtime_ns, subfolders] for folder, (mtime_ns, subfolders) in self._folders.items()}
+        metadata = {
+            b"version": CATALOG_VERSION.encode(),
+            b"generation": str(self.generation).encode(),
+            b"folders": json_codec.dumps(folders),
+        }
+        table = pa.Table.from_pandas(self.get_files(), schema=_SCHEMA, preserve_index=False)
+        # write to a temporary file first so that the catalog is never read half-written
+        pq.write_table(table.replace_schema_metadata(metadata), catalog_filename + ".tmp")
+        os.replace(catalog_filename + ".tmp", catalog_filename)
+
+    @staticmethod
+    def load(project_folder: str) -> 'FileCatalog':
+        """
+        :param project_folder: ADQ_WORKING_FOLDER/<project>
+        :return: the saved catalog of the project, which is empty if there is none; call refresh to update it
+        """
+        catalog = FileCatalog(project_folder)
+        catalog_filename = catalog.get_catalog_filename()
+        if not os.path.exists(catalog_filename):
+            return catalog
+
+        try:
+            table = pq.read_table(catalog_filename)
+        except (pa.ArrowInvalid, OSError) as e:
+            logger.warning(f"Cannot read {catalog_filename}: {str(e)}")
+            return catalog
+
+        metadata = table.schema.metadata or {}
+        if metadata.get(b"version") != CATALOG_VERSION.encode():
+            return catalog
+
+        catalog.generation = int(metadata[b"generation"])
+        catalog._folders = {folder: (mtime_ns, subfolders) for folder, (mtime_ns, subfolders)
+                            in json_codec.loads(metadata[b"folders"]).items()}
+        for folder, *file in table.to_pandas().itertuples(index=False):
+            catalog._files.setdefault(folder, []).append(tuple(file))
+        return catalog
+
+
+_catalogs = dict()
+_catalogs_lock = threading.Lock()
+
+
+def get_file_catalog(project_folder: str) -> FileCatalog:
+    """
+    :param project_folder: ADQ_WORKING_FOLDER/<project>
+    :return: the refreshed catalog of the project, shared by all the sessions of the process
+    """
+    project_folder = os.path.normpath(project_folder)
+    with _catalogs_lock:
+        catalog = _catalogs.get(project_folder)
+        if catalog is None:
+            catalog = FileCatalog.load(project_folder)
+            _catalogs[project_folder] = catalog
+        catalog.refresh()
+    return catalog
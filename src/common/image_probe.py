@@ -0,0 +1,123 @@
+import os
+import struct
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from PIL import Image
+
+from src.common.logger import get_logger
+
+logger = get_logger(__name__)
+
+"""
+.. module:: image_probe
+   :synopsis: image dimensions from the file headers
+   The width and height are read from the JPEG SOF, PNG IHDR or BMP info header
+   with a few bytes of I/O instead of decoding the pixels.
+   Other formats or broken headers fall back to PIL, which also reads only the header.
+   The results are cached by the path, mtime and size of the file.
+"""
+
+PROBE_MAX_WORKERS = 16
+PROBE_CACHE_SIZE = 65536
+
+_PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+# SOF markers without DHT (C4), JPG (C8) and DAC (CC)
+_JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+# markers without a length field
+_JPEG_STANDALONE_MARKERS = {0x01, 0xD0, 0xD1, 0xD2, 0xD3, 0xD4, 0xD5, 0xD6, 0xD7, 0xD8}
+
+
+def _probe_jpeg(file) -> (int, int):
+    file.seek(2)
+    while True:
+        byte = file.read(1)
+        while byte and byte != b'\xff':
+            byte = file.read(1)
+        # skip the fill bytes
+        while byte == b'\xff':
+            byte = file.read(1)
+        if not byte:
+            return None
+
+        marker = byte[0]
+        if marker in _JPEG_STANDALONE_MARKERS:
+            continue
+        if marker == 0xD9:
+            return None
+
+        segment_length = struct.unpack('>H', file.read(2))[0]
+        if marker in _JPEG_SOF_MARKERS:
+            # precision (1 byte), height, width
+            height, width = struct.unpack('>xHH', file.read(5))
+            return width, height
+        file.seek(segment_length - 2, os.SEEK_CUR)
+
+
+def _probe_png(file) -> (int, int):
+    file.seek(8)
+    chunk_header = file.read(16)
+    if len(chunk_header) < 16 or chunk_header[4:8] != b'IHDR':
+        return None
+    return struct.unpack('>II', chunk_header[8:16])
+
+
+def _probe_bmp(file) -> (int, int):
+    file.seek(14)
+    info_header_size = struct.unpack('<I', file.read(4))[0]
+    if info_header_size == 12:
+        # BITMAPCOREHEADER
+        width, height = struct.unpack('<HH', file.read(4))
+    else:
+        width, height = struct.unpack('<ii', file.read(8))
+    # the height is negative for top-down bitmaps
+    return width, abs(height)
+
+
+def _probe_header(filename: str) -> (int, int):
+    with open(filename, 'rb') as file:
+        signature = file.read(8)
+        if signature[:2] == b'\xff\xd8':
+            return _probe_jpeg(file)
+        if signature == _PNG_SIGNATURE:
+            return _probe_png(file)
+        if signature[:2] == b'BM':
+            return _probe_bmp(file)
+    return None
+
+
+@lru_cache(maxsize=PROBE_CACHE_SIZE)
+def _get_image_size(filename: str, mtime_ns: int, file_size: int) -> (int, int):
+    try:
+        image_size = _probe_header(filename)
+    except (OSError, struct.error) as e:
+        logger.warning(f"Cannot read the header of {filename}: {str(e)}")
+        image_size = None
+
+    if image_size is None:
+        with Image.open(filename) as img:
+            image_size = img.size
+    return int(image_size[0]), int(image_size[1])
+
+
+def get_image_size(filename: str) -> (int, int):
+    """
+    :param filename: image filename
+    :return: width, height
+    """
+    file_stat = os.stat(filename)
+    return _get_image_size(os.path.abspath(filename), file_stat.st_mtime_ns, file_stat.st_size)
+
+
+def get_image_sizes(filenames: list, max_workers: int = PROBE_MAX_WORKERS) -> list:
+    """
+    probe the images across a thread pool; the probes are I/O bound
+    :param filenames: image filenames
+    :param max_workers: the number of threads
+    :return: (width, height) of the images in the order of filenames
+    """
+    if len(filenames) <= 1:
+        return [get_image_size(filename) for filename in filenames]
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(filenames))) as executor:
+        return list(executor.map(get_image_size, filenames))
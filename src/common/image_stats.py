@@ -0,0 +1,171 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from src.common import image_probe
+from src.common.constants import SUPPORTED_IMAGE_FILE_EXTENSIONS
+from src.common.logger import get_logger
+
+logger = get_logger(__name__)
+
+"""
+.. module:: image_stats
+   :synopsis: persistent per-image statistics of the data files of a project
+   The statistics of every image in <project>/data are kept in <project>/image_stats.parquet, a row per image:
+        name, mtime_ns, file_size           the key of the row; the row is recomputed when they change
+        width, height, aspect_ratio         from the file header (image_probe)
+        brightness_mean, brightness_std     of the luma
+        contrast                            the range between the 2nd and the 98th percentile of the luma
+        blur                                the variance of the Laplacian of the luma; the lower, the blurrier
+        color_histogram                     HISTOGRAM_BINS bins per RGB channel, normalized per channel
+   The pixels are decoded at 1/2 to 1/8 scale (cv2.IMREAD_REDUCED_COLOR_*) as long as the shorter side is still
+   at least STATS_MIN_SIDE, so the blur scores are comparable only between images of similar sizes.
+   Only the new or changed images are decoded, across a process pool. An image that cannot be read keeps a row
+   with null statistics, so that it is not decoded again until it changes.
+"""
+
+STATS_FILENAME = "image_stats.parquet"
+STATS_MIN_SIDE = 256
+HISTOGRAM_BINS = 8
+PARALLEL_MIN_FILES = 16
+PARALLEL_CHUNK_SIZE = 32
+
+_REDUCED_FLAGS = [(8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2)]
+_KEY_COLUMNS = ["name", "mtime_ns", "file_size"]
+_SCHEMA = pa.schema([
+    ("name", pa.string()),
+    ("mtime_ns", pa.int64()),
+    ("file_size", pa.int64()),
+    ("width", pa.int32()),
+    ("height", pa.int32()),
+    ("aspect_ratio", pa.float64()),
+    ("brightness_mean", pa.float32()),
+    ("brightness_std", pa.float32()),
+    ("contrast", pa.float32()),
+    ("blur", pa.float32()),
+    ("color_histogram", pa.list_(pa.float32())),
+])
+
+
+def _get_read_flag(width: int, height: int) -> int:
+    for scale, flag in _REDUCED_FLAGS:
+        if min(width, height) // scale >= STATS_MIN_SIDE:
+            return flag
+    return cv2.IMREAD_COLOR
+
+
+def compute_image_stats(image_path: str) -> dict:
+    """
+    :param image_path: image filename
+    :return: the statistics of the image (see the columns above) or None if the image cannot be read
+    """
+    try:
+        file_stat = os.stat(image_path)
+        width, height = image_probe.get_image_size(image_path)
+        img = cv2.imread(image_path, _get_read_flag(width, height))
+        if img is None:
+            return None
+
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        low, high = np.percentile(gray, (2, 98))
+        histogram = []
+        # BGR -> RGB
+        for channel in (2, 1, 0):
+            channel_histogram = cv2.calcHist([img], [channel], None, [HISTOGRAM_BINS], [0, 256]).reshape(-1)
+            histogram.extend(channel_histogram / max(channel_histogram.sum(), 1))
+
+        return {
+            "name": os.path.basename(image_path),
+            "mtime_ns": file_stat.st_mtime_ns,
+            "file_size": file_stat.st_size,
+            "width": width,
+            "height": height,
+            "aspect_ratio": width / height,
+            "brightness_mean": float(gray.mean()),
+            "brightness_std": float(gray.std()),
+            "contrast": float(high - low),
+            "blur": float(cv2.Laplacian(gray, cv2.CV_32F).var()),
+            "color_histogram": [float(value) for value in histogram],
+        }
+    except Exception as e:
+        logger.error(f"Error computing the statistics of {os.path.basename(image_path)}: {str(e)}")
+        return None
+
+
+def get_stats_filename(project_folder: str) -> str:
+    return os.path.join(project_folder, STATS_FILENAME)
+
+
+def load_image_stats(project_folder: str) -> pd.DataFrame:
+    """
+    :param project_folder: project folder
+    :return: the saved statistics or an empty table if there are none
+    """
+    stats_filename = get_stats_filename(project_folder)
+    if os.path.exists(stats_filename):
+        try:
+            return pq.read_table(stats_filename).to_pandas()
+        except (pa.ArrowInvalid, OSError) as e:
+            logger.warning(f"Cannot read {stats_filename}: {str(e)}")
+    return _SCHEMA.empty_table().to_pandas()
+
+
+def _save_image_stats(image_stats: pd.DataFrame, stats_filename: str):
+    table = pa.Table.from_pandas(image_stats, schema=_SCHEMA, preserve_index=False)
+    # write to a temporary file first so that the table is never read half-written
+    pq.write_table(table, stats_filename + ".tmp")
+    os.replace(stats_filename + ".tmp", stats_filename)
+
+
+def update_image_stats(project_folder: str, max_workers: int = None) -> pd.DataFrame:
+    """
+    compute the statistics of the new or changed images of a project and save them
+    :param project_folder: project folder containing the data folder
+    :param max_workers: the number of processes; defaults to the number of CPUs
+    :return: the statistics of the images in the data folder sorted by name
+    """
+    data_folder = os.path.join(project_folder, "data")
+    if not os.path.isdir(data_folder):
+        return _SCHEMA.empty_table().to_pandas()
+
+    extensions = tuple(f".{ext}" for ext in SUPPORTED_IMAGE_FILE_EXTENSIONS)
+    keys = dict()
+    with os.scandir(data_folder) as entries:
+        for entry in entries:
+            if entry.is_file() and entry.name.endswith(extensions):
+                file_stat = entry.stat()
+                keys[entry.name] = (file_stat.st_mtime_ns, file_stat.st_size)
+
+    saved_stats = load_image_stats(project_folder)
+    # the rows of the removed or changed images are dropped
+    is_fresh = np.asarray([keys.get(name) == (mtime_ns, file_size) for name, mtime_ns, file_size
+                           in saved_stats[_KEY_COLUMNS].itertuples(index=False)], dtype=bool)
+    fresh_stats = saved_stats[is_fresh] if len(saved_stats) else saved_stats
+    image_paths = [os.path.join(data_folder, name) for name in sorted(set(keys) - set(fresh_stats["name"]))]
+    if not image_paths and len(fresh_stats) == len(saved_stats):
+        return saved_stats.sort_values("name", ignore_index=True)
+
+    logger.info(f"Computing the statistics of {len(image_paths)} of {len(keys)} images in {data_folder}")
+    if len(image_paths) < PARALLEL_MIN_FILES or max_workers == 1:
+        results = [compute_image_stats(image_path) for image_path in image_paths]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(compute_image_stats, image_paths, chunksize=PARALLEL_CHUNK_SIZE))
+
+    rows = []
+    for image_path, result in zip(image_paths, results):
+        if result is None:
+            # only the key, so that the image is skipped until it changes
+            name = os.path.basename(image_path)
+            result = dict(zip(_KEY_COLUMNS, (name,) + keys[name]))
+        rows.append(result)
+    new_stats = pd.DataFrame(rows, columns=_SCHEMA.names)
+    image_stats = pd.concat([fresh_stats, new_stats], ignore_index=True) if len(new_stats) else fresh_stats
+    image_stats = image_stats.sort_values("name", ignore_index=True)
+    _save_image_stats(image_stats, get_stats_filename(project_folder))
+    return image_stats
@@ -0,0 +1,98 @@
+import json
+
+from src.common.logger import get_logger
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+logger = get_logger(__name__)
+
+"""
+.. module:: json_codec
+   :synopsis: pluggable JSON codec of the label files
+   The fastest available backend is used: orjson, msgspec, then the stdlib json as the fallback.
+   All the backends encode the objects with to_json (attrs classes) through the same default hook,
+   and the output is compact unless pretty printing is asked for (e.g., the state file of batch_convert).
+   dumps always returns UTF-8 bytes so that it can be written to a file as is.
+"""
+
+ORJSON = "orjson"
+MSGSPEC = "msgspec"
+STDLIB_JSON = "json"
+
+if orjson:
+    JSON_BACKEND = ORJSON
+elif msgspec:
+    JSON_BACKEND = MSGSPEC
+else:
+    JSON_BACKEND = STDLIB_JSON
+
+PRETTY_INDENT = 2
+
+
+def default(obj):
+    if hasattr(obj, 'to_json'):
+        return obj.to_json()
+    # numpy scalars and arrays
+    if hasattr(obj, 'tolist'):
+        return obj.tolist()
+    raise TypeError(f'Object of type {obj.__class__.__name__} is not JSON serializable')
+
+
+if msgspec:
+    _msgspec_encoder = msgspec.json.Encoder(enc_hook=default)
+    _msgspec_decoder = msgspec.json.Decoder()
+
+
+def dumps(obj, pretty=False, backend=JSON_BACKEND) -> bytes:
+    """
+    :param obj: object to encode
+    :param pretty: indent the output
+    :param backend: orjson, msgspec or json
+    :return: UTF-8 encoded JSON
+    """
+    if backend == ORJSON:
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+        if pretty:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=default, option=option)
+
+    if backend == MSGSPEC:
+        data = _msgspec_encoder.encode(obj)
+        return msgspec.json.format(data, indent=PRETTY_INDENT) if pretty else data
+
+    if pretty:
+        return json.dumps(obj, default=default, ensure_ascii=False, indent=PRETTY_INDENT).encode('utf-8')
+    return json.dumps(obj, default=default, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def loads(data, backend=JSON_BACKEND):
+    """
+    :param data: JSON bytes or str
+    :param backend: orjson, msgspec or json
+    :return: decoded object
+    """
+    if backend == ORJSON:
+        return orjson.loads(data)
+
+    if backend == MSGSPEC:
+        return _msgspec_decoder.decode(data)
+
+    return json.loads(data)
+
+
+def load_file(filename: str):
+    with open(filename, 'rb') as json_file:
+        return loads(json_file.read())
+
+
+def dump_file(obj, filename: str, pretty=False):
+    with open(filename, 'wb') as json_file:
+        json_file.write(dumps(obj, pretty=pretty))
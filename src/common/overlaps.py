@@ -0,0 +1,156 @@
+import numpy as np
+import shapely
+
+from src.common.logger import get_logger
+
+logger = get_logger(__name__)
+
+"""
+.. module:: overlaps
+   :synopsis: batched overlap calculation of label objects in an image
+   Overlaps are computed for all the object pairs of an image at once instead of pair by pair.
+   The overlap percent of a pair is the overlapping area over the larger of the two areas,
+   rounded to 2 decimal places, and only the pairs with an overlapping area > 0 are counted.
+
+   - bounding rectangles: NumPy broadcasting over the (N, 4) xtl, ytl, xbr, ybr array.
+     Crowded images (> DENSE_PAIR_LIMIT objects) go through a sweep-line on x first
+     so that only the pairs whose x ranges intersect are compared.
+   - shapes: boxes, polygons and splines are turned into shapely geometries and
+     the candidate pairs are found with an STRtree.
+"""
+
+# above this number of objects, the dense N x N matrix is replaced by the sweep-line candidates
+DENSE_PAIR_LIMIT = 256
+
+
+def _dense_candidate_pairs(count: int) -> (np.ndarray, np.ndarray):
+    return np.triu_indices(count, k=1)
+
+
+def _sweep_candidate_pairs(bboxes: np.ndarray) -> (np.ndarray, np.ndarray):
+    """
+    sweep-line over x: sort by xtl and pair each box with the following boxes that start before it ends
+    :param bboxes: (N, 4) bounding rectangles
+    :return: indices of the candidate pairs
+    """
+    order = np.argsort(bboxes[:, 0], kind='stable')
+    xtl_sorted = bboxes[order, 0]
+    xbr_sorted = bboxes[order, 2]
+
+    ranks = np.arange(len(order))
+    ends = np.searchsorted(xtl_sorted, xbr_sorted, side='right')
+    counts = np.maximum(ends - ranks - 1, 0)
+
+    first = np.repeat(ranks, counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    second = first + 1 + offsets
+
+    return order[first], order[second]
+
+
+def get_overlap_pairs(bboxes: np.ndarray) -> (np.ndarray, np.ndarray, np.ndarray, np.ndarray):
+    """
+    calculate the overlapping areas of all the bounding rectangle pairs
+    :param bboxes: (N, 4) xtl, ytl, xbr, ybr; rows with nan (objects without points) are ignored
+    :return: first and second object indices, overlapping areas and max areas of the overlapping pairs
+    """
+    bboxes = np.asarray(bboxes, dtype=np.float64)
+    valid_indices = np.flatnonzero(~np.isnan(bboxes).any(axis=1))
+    valid_bboxes = bboxes[valid_indices]
+
+    if len(valid_bboxes) > DENSE_PAIR_LIMIT:
+        first, second = _sweep_candidate_pairs(valid_bboxes)
+    else:
+        first, second = _dense_candidate_pairs(len(valid_bboxes))
+
+    a, b = valid_bboxes[first], valid_bboxes[second]
+    dx = np.minimum(a[:, 2], b[:, 2]) - np.maximum(a[:, 0], b[:, 0])
+    dy = np.minimum(a[:, 3], b[:, 3]) - np.maximum(a[:, 1], b[:, 1])
+    overlap_areas = dx * dy
+
+    is_overlapping = (dx >= 0) & (dy >= 0) & (overlap_areas > 0)
+    a, b = a[is_overlapping], b[is_overlapping]
+    area1 = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area2 = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+
+    return (valid_indices[first[is_overlapping]],
+            valid_indices[second[is_overlapping]],
+            overlap_areas[is_overlapping],
+            np.maximum(area1, area2))
+
+
+def to_overlap_percents(overlap_areas: np.ndarray, max_areas: np.ndarray) -> np.ndarray:
+    ratios = np.divide(overlap_areas, max_areas, out=np.zeros_like(overlap_areas), where=max_areas > 0)
+    # round the same way as format(ratio, '.2f') - np.round differs on the binary halves
+    return np.char.mod('%.2f', ratios).astype(np.float64) * 100
+
+
+def get_overlap_percents(bboxes: np.ndarray) -> np.ndarray:
+    """
+    :param bboxes: (N, 4) xtl, ytl, xbr, ybr of the objects of an image
+    :return: overlap percents of all the overlapping pairs
+    """
+    _, _, overlap_areas, max_areas = get_overlap_pairs(bboxes)
+    return to_overlap_percents(overlap_areas, max_areas)
+
+
+def to_geometry(label_object):
+    """
+    convert a label object into a shapely geometry
+    :param label_object: DataLabels.Object or one of its views
+    :return: box or polygon geometry; splines and boundaries are buffered by their widths (r)
+    """
+    points = label_object.points
+    if not points:
+        return None
+
+    if label_object.type == 'box':
+        return shapely.box(*points[0][:4])
+
+    coords = np.asarray(points, dtype=np.float64)
+    if label_object.type in ('spline', 'boundary'):
+        width = coords[:, 2].mean() if coords.shape[1] > 2 else 1.0
+        if len(coords) == 1:
+            return shapely.Point(coords[0, :2]).buffer(max(width / 2, 0.5))
+        return shapely.LineString(coords[:, :2]).buffer(max(width / 2, 0.5))
+
+    if len(coords) < 3:
+        return None
+    return shapely.make_valid(shapely.Polygon(coords[:, :2]))
+
+
+def get_shape_overlap_percents(label_objects) -> np.ndarray:
+    """
+    true shape overlaps of polygons, splines and boxes instead of their bounding rectangles
+    :param label_objects: objects of an image
+    :return: overlap percents of all the overlapping pairs
+    """
+    geometries = [to_geometry(label_object) for label_object in label_objects]
+    geometries = np.array([geometry for geometry in geometries if geometry is not None], dtype=object)
+    if len(geometries) < 2:
+        return np.zeros(0)
+
+    tree = shapely.STRtree(geometries)
+    first, second = tree.query(geometries, predicate='intersects')
+    is_pair = first < second
+    first, second = first[is_pair], second[is_pair]
+
+    overlap_areas = shapely.area(shapely.intersection(geometries[first], geometries[second]))
+    areas = shapely.area(geometries)
+    max_areas = np.maximum(areas[first], areas[second])
+
+    is_overlapping = overlap_areas > 0
+    return to_overlap_percents(overlap_areas[is_overlapping], max_areas[is_overlapping])
+
+
+def count_overlap_percents(overlap_areas: dict, overlap_percents: np.ndarray) -> dict:
+    """
+    add the overlap percents to the histogram
+    :param overlap_areas: key=overlap percent value=count
+    :param overlap_percents: overlap percents to add
+    :return: the updated overlap_areas
+    """
+    percents, counts = np.unique(overlap_percents, return_counts=True)
+    for percent, count in zip(percents.tolist(), counts.tolist()):
+        overlap_areas[percent] = overlap_areas.get(percent, 0) + count
+    return overlap_areas
@@ -0,0 +1,152 @@
+import base64
+import io
+import mmap
+import os
+from functools import lru_cache
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from src.common import json_codec
+from src.common.constants import SUPPORTED_IMAGE_FILE_EXTENSIONS
+from src.common.logger import get_logger
+
+logger = get_logger(__name__)
+
+"""
+.. module:: thumbnail_atlas
+   :synopsis: the thumbnails of a folder packed into a single file
+   The encoded thumbnails of a thumbnail folder (see thumbnails.THUMBNAIL_SIZES) are concatenated into
+   <folder>.atlas and their byte ranges are kept in <folder>.atlas.json:
+        {"version": "1", "folder_mtime_ns": ..., "names": ["a.jpg", ...], "offsets": [0, 4210, ...]}
+   The atlas is memory-mapped, so that a grid, a hover preview or the clustering slices one file
+   instead of opening a file per thumbnail, and the encoded bytes are served as they are (e.g., base64).
+   The thumbnails are replaced with os.replace, so the mtime of the folder tells whether the atlas is stale.
+"""
+
+ATLAS_VERSION = "1"
+ATLAS_EXT = ".atlas"
+INDEX_EXT = ".atlas.json"
+ATLAS_CACHE_SIZE = 16
+
+
+def _get_folder_key(thumbnails_folder: str) -> int:
+    return os.stat(thumbnails_folder).st_mtime_ns
+
+
+class ThumbnailAtlas:
+    def __init__(self, thumbnails_folder: str, names: list, offsets: np.ndarray, data):
+        self.thumbnails_folder = thumbnails_folder
+        self.names = names
+        self.offsets = offsets
+        self._data = data
+        self._name_index = {name: index for index, name in enumerate(names)}
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name: str):
+        return os.path.basename(name) in self._name_index
+
+    def get_bytes(self, name: str) -> bytes:
+        """
+        :param name: image filename without the folder
+        :return: the encoded thumbnail or None if the image has no thumbnail
+        """
+        index = self._name_index.get(os.path.basename(name))
+        if index is None:
+            return None
+        return self._data[self.offsets[index]:self.offsets[index + 1]]
+
+    def get_base64(self, name: str) -> str:
+        encoded = self.get_bytes(name)
+        return base64.b64encode(encoded).decode('utf-8') if encoded else ''
+
+    def get_image(self, name: str) -> Image:
+        encoded = self.get_bytes(name)
+        return Image.open(io.BytesIO(encoded)) if encoded else None
+
+    def get_array(self, name: str, size: tuple = None) -> np.ndarray:
+        """
+        :param name: image filename without the folder
+        :param size: (width, height) to resize to
+        :return: RGB image or None if the image has no thumbnail
+        """
+        encoded = self.get_bytes(name)
+        if not encoded:
+            return None
+        img = cv2.imdecode(np.frombuffer(encoded, dtype=np.uint8), cv2.IMREAD_COLOR)
+        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+        return cv2.resize(img, size) if size else img
+
+    @staticmethod
+    def get_atlas_filenames(thumbnails_folder: str) -> (str, str):
+        thumbnails_folder = os.path.normpath(thumbnails_folder)
+        return thumbnails_folder + ATLAS_EXT, thumbnails_folder + INDEX_EXT
+
+    @staticmethod
+    def build(thumbnails_folder: str) -> str:
+        """
+        pack the thumbnails of a folder into an atlas
+        :param thumbnails_folder: thumbnail folder
+        :return: atlas filename
+        """
+        atlas_filename, index_filename = ThumbnailAtlas.get_atlas_filenames(thumbnails_folder)
+        folder_mtime_ns = _get_folder_key(thumbnails_folder)
+
+        extensions = tuple(f".{ext}" for ext in SUPPORTED_IMAGE_FILE_EXTENSIONS)
+        with os.scandir(thumbnails_folder) as entries:
+            names = sorted(entry.name for entry in entries if entry.is_file() and entry.name.endswith(extensions))
+
+        offsets = [0]
+        with open(atlas_filename + ".tmp", 'wb') as atlas_file:
+            for name in names:
+                with open(os.path.join(thumbnails_folder, name), 'rb') as thumbnail_file:
+                    atlas_file.write(thumbnail_file.read())
+                offsets.append(atlas_file.tell())
+        os.replace(atlas_filename + ".tmp", atlas_filename)
+
+        index = {"version": ATLAS_VERSION, "folder_mtime_ns": folder_mtime_ns, "names": names, "offsets": offsets}
+        json_codec.dump_file(index, index_filename + ".tmp")
+        os.replace(index_filename + ".tmp", index_filename)
+        logger.info(f"Packed {len(names)} thumbnails into {atlas_filename} ({offsets[-1]} bytes)")
+        return atlas_filename
+
+    @staticmethod
+    def load(thumbnails_folder: str) -> 'ThumbnailAtlas':
+        """
+        :param thumbnails_folder: thumbnail folder
+        :return: ThumbnailAtlas of the folder, built first if it is missing or stale; None if there is no folder
+        """
+        if not os.path.isdir(thumbnails_folder):
+            return None
+        return _load_atlas(os.path.normpath(thumbnails_folder), _get_folder_key(thumbnails_folder))
+
+
+def _read_index(index_filename: str, folder_mtime_ns: int, atlas_size: int) -> dict:
+    try:
+        index = json_codec.load_file(index_filename)
+    except (OSError, ValueError):
+        return None
+    if index.get('version') != ATLAS_VERSION or index.get('folder_mtime_ns') != folder_mtime_ns or \
+            index['offsets'][-1] != atlas_size:
+        return None
+    return index
+
+
+@lru_cache(maxsize=ATLAS_CACHE_SIZE)
+def _load_atlas(thumbnails_folder: str, folder_mtime_ns: int) -> ThumbnailAtlas:
+    atlas_filename, index_filename = ThumbnailAtlas.get_atlas_filenames(thumbnails_folder)
+    atlas_size = os.path.getsize(atlas_filename) if os.path.exists(atlas_filename) else -1
+    index = _read_index(index_filename, folder_mtime_ns, atlas_size)
+    if index is None:
+        ThumbnailAtlas.build(thumbnails_folder)
+        index = json_codec.load_file(index_filename)
+
+    offsets = np.asarray(index['offsets'], dtype=np.int64)
+    data = b""
+    if offsets[-1] > 0:
+        with open(atlas_filename, 'rb') as atlas_file:
+            data = mmap.mmap(atlas_file.fileno(), 0, access=mmap.ACCESS_READ)
+    return ThumbnailAtlas(thumbnails_folder, index['names'], offsets, data)
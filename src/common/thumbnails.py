@@ -0,0 +1,133 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image
+
+from src.common.constants import SUPPORTED_IMAGE_FILE_EXTENSIONS
+from src.common.logger import get_logger
+
+logger = get_logger(__name__)
+
+"""
+.. module:: thumbnails
+   :synopsis: thumbnails of the data files of a project
+   Every image is decoded once for all the thumbnail sizes (THUMBNAIL_SIZES): JPEG images are decoded
+   at 1/2 to 1/8 scale with Image.draft as long as the result is still larger than the largest thumbnail,
+   and the smaller thumbnails are resized from the larger ones.
+   A thumbnail is regenerated only when it is older than its image, and the images are spread over a process pool.
+"""
+
+THUMBNAIL_SIZE = (128, 128)
+# thumbnail folder in the project folder -> the maximum (width, height)
+THUMBNAIL_SIZES = {
+    # the image grids
+    "thumbnails": THUMBNAIL_SIZE,
+    # the input of the image clustering
+    "thumbnails_cluster": (100, 100),
+    # the hover previews
+    "previews": (512, 512),
+}
+PARALLEL_MIN_FILES = 16
+PARALLEL_CHUNK_SIZE = 32
+
+
+def _is_up_to_date(output_path: str, image_mtime: float) -> bool:
+    try:
+        return os.path.getmtime(output_path) >= image_mtime
+    except OSError:
+        return False
+
+
+def make_thumbnails(image_path: str, output_sizes: dict) -> list:
+    """
+    create the thumbnails of an image in a single decode; the thumbnails newer than the image are kept
+    :param image_path: image filename
+    :param output_sizes: thumbnail filename -> the maximum (width, height)
+    :return: thumbnail filenames or None if the image cannot be read
+    """
+    try:
+        image_mtime = os.path.getmtime(image_path)
+        outputs = [(output_path, size) for output_path, size in output_sizes.items()
+                   if not _is_up_to_date(output_path, image_mtime)]
+        if not outputs:
+            return list(output_sizes)
+
+        # the largest thumbnail first, so that the next ones are resized from it
+        outputs.sort(key=lambda output: output[1][0] * output[1][1], reverse=True)
+        with Image.open(image_path) as image:
+            image_format = Image.registered_extensions().get(os.path.splitext(image_path)[1].lower(), image.format)
+            # a no-op for the formats other than JPEG
+            image.draft(image.mode, outputs[0][1])
+            thumbnail = image
+            for output_path, size in outputs:
+                thumbnail = thumbnail.copy()
+                thumbnail.thumbnail(size)
+                # replaced rather than overwritten so that the thumbnail atlas of the folder becomes stale
+                thumbnail.save(output_path + ".tmp", format=image_format)
+                os.replace(output_path + ".tmp", output_path)
+        return list(output_sizes)
+    except Exception as e:
+        logger.error(f"Error processing {os.path.basename(image_path)}: {str(e)}")
+        return None
+
+
+def make_thumbnail(image_path: str, output_path: str, thumbnail_size=THUMBNAIL_SIZE) -> str:
+    """
+    :param image_path: image filename
+    :param output_path: thumbnail filename
+    :param thumbnail_size: the maximum (width, height) of the thumbnail
+    :return: output_path or None if the image cannot be read
+    """
+    return output_path if make_thumbnails(image_path, {output_path: thumbnail_size}) else None
+
+
+def get_thumbnail_sizes(image_path: str, project_folder: str, thumbnail_sizes: dict = None) -> dict:
+    """
+    :param image_path: image filename
+    :param project_folder: project folder containing the thumbnail folders
+    :param thumbnail_sizes: thumbnail folder -> the maximum (width, height); THUMBNAIL_SIZES by default
+    :return: thumbnail filename -> the maximum (width, height)
+    """
+    thumbnail_sizes = thumbnail_sizes or THUMBNAIL_SIZES
+    filename = os.path.basename(image_path)
+    return {os.path.join(project_folder, folder, filename): size for folder, size in thumbnail_sizes.items()}
+
+
+def _make_thumbnails_star(args) -> list:
+    return make_thumbnails(*args)
+
+
+def generate_thumbnails(data_folder: str, output_folders: dict, max_workers: int = None) -> list:
+    """
+    create the thumbnails of the images in a folder across a process pool
+    :param data_folder: folder of the images
+    :param output_folders: thumbnail folder -> the maximum (width, height)
+    :param max_workers: the number of processes; defaults to the number of CPUs
+    :return: the images of which the thumbnails are up to date
+    """
+    for output_folder in output_folders:
+        os.makedirs(output_folder, exist_ok=True)
+
+    extensions = tuple(f".{ext}" for ext in SUPPORTED_IMAGE_FILE_EXTENSIONS)
+    jobs, image_paths = [], []
+    with os.scandir(data_folder) as entries:
+        for entry in entries:
+            if not entry.is_file() or not entry.name.endswith(extensions):
+                continue
+            image_paths.append(entry.path)
+            image_mtime = entry.stat().st_mtime
+            output_sizes = {os.path.join(output_folder, entry.name): size
+                            for output_folder, size in output_folders.items()}
+            # skip the up-to-date images without starting the process pool
+            if not all(_is_up_to_date(output_path, image_mtime) for output_path in output_sizes):
+                jobs.append((entry.path, output_sizes))
+
+    logger.info(f"Generating the thumbnails of {len(jobs)} of {len(image_paths)} images in {data_folder}")
+    if len(jobs) < PARALLEL_MIN_FILES or max_workers == 1:
+        results = [make_thumbnails(*job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(_make_thumbnails_star, jobs, chunksize=PARALLEL_CHUNK_SIZE))
+
+    failed = {job[0] for job, result in zip(jobs, results) if result is None}
+    return [image_path for image_path in sorted(image_paths) if image_path not in failed]
@@ -1,4 +1,4 @@
-import glob
+import fnmatch
 import json
 import os
 from pathlib import Path
@@ -6,8 +6,8 @@ from pathlib import Path
 import cv2
 import streamlit as st
 import streamlit_javascript as st_js
-from PIL import Image
 
+from . import image_probe, json_codec
 from .constants import SUPPORTED_IMAGE_FILE_EXTENSIONS
 
 # Convert bytes to a more human-readable format
@@ -30,8 +30,7 @@ def humanize_bytes(size):
 
 def from_file(filename, default_json="{}"):
     if os.path.exists(filename) and os.path.getsize(filename) > 0:
-        file = open(filename, 'r', encoding='utf-8')
-        return json.load(file)
+        return json_codec.load_file(filename)
 
     return json.loads(default_json)
 
@@ -39,19 +38,31 @@ def from_file(filename, default_json="{}"):
 def to_file(data, filename):
     """
     save data to path
+    :param data: str or bytes (e.g., encoded by json_codec.dumps)
     """
+    if isinstance(data, bytes):
+        with open(filename, 'wb') as json_file:
+            json_file.write(data)
+        return
+
     with open(filename, 'w', encoding="utf-8") as json_file:
         json_file.write(data)
 
 
 def glob_files(folder_path, patterns=SUPPORTED_IMAGE_FILE_EXTENSIONS):
-    matched = []
-    for pattern in patterns:
-        globbed = glob.glob(os.path.join(folder_path, '*.' + pattern))
-        if globbed:
-            matched.extend(globbed)
+    """
+    :param folder_path: folder
+    :param patterns: file extensions without the dot
+    :return: the files in the folder with the extensions, listed in a single scan of the folder
+    """
+    if not os.path.isdir(folder_path):
+        return []
 
-    return matched
+    extensions = tuple('.' + pattern for pattern in patterns)
+    with os.scandir(folder_path) as entries:
+        # glob skips the hidden files
+        return [os.path.join(folder_path, entry.name) for entry in entries
+                if not entry.name.startswith('.') and entry.name.endswith(extensions) and entry.is_file()]
 
 
 def generate_file_tree(folder_path, patterns):
@@ -62,9 +73,9 @@ def generate_file_tree(folder_path, patterns):
 
         file_info_to_display = dict()
         for pattern in patterns:
-            matched = glob.glob(os.path.join(root, pattern), recursive=True)
+            # match the files already listed by os.walk instead of globbing the folder again
+            matched = [file for file in fnmatch.filter(files, pattern) if not file.startswith('.')]
             if matched:
-                matched = [os.path.basename(full_path) for full_path in matched]
                 sub_folder = root.replace(folder_path, '')
                 if file_info_to_display.get(sub_folder):
                     file_info_to_display[sub_folder] += len(matched)
@@ -101,9 +112,8 @@ def step_size(value):
 
 
 def get_resolution(filename: str) -> (int, int):
-    with Image.open(filename) as img:
-        # Get the width and height of the image
-        width, height = img.size
+    # read from the image header without decoding the pixels
+    width, height = image_probe.get_image_size(filename)
 
     # width, height = 0, 0
     # # Read the image using opencv-python
@@ -0,0 +1,12 @@
+from src.common.convert_lib import to_aimmo_images
+from .reader_base import ReaderBase
+
+
+class AimmoReader(ReaderBase):
+    LABEL_FILE_EXTENSIONS = ['json']
+
+    def parse(self, label_files, data_files=None):
+        super().parse(label_files, data_files)
+
+        self.data_labels_dict['images'] = to_aimmo_images(label_files)
+        return self.data_labels_dict
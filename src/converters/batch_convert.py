@@ -0,0 +1,157 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from src.common import json_codec
+from src.common.logger import get_logger
+from src.converters.registry import convert_job, get_label_formats, get_reader_class
+
+logger = get_logger(__name__)
+
+"""
+.. module:: batch_convert
+   :synopsis: headless, parallel and resumable conversion of a directory tree
+   Converts all the label files under an input folder without going through the upload form:
+
+        python -m src.converters.batch_convert --format "CVAT BOX XML" --input /data/customer --output /data/converted
+
+   - a label file is a job for the formats with a label file per task (CVAT, COCO),
+     otherwise the label files of a folder are split into jobs of --chunk-size files (StVision, YOLO, GPR).
+   - the jobs run in a process pool and the throughput is reported as they complete.
+   - the completed jobs are recorded in <output>/.batch_convert.json together with the sizes and mtimes
+     of their label files, so that an interrupted conversion resumes with the remaining jobs.
+"""
+
+STATE_FILENAME = ".batch_convert.json"
+DEFAULT_CHUNK_SIZE = 5000
+
+
+def _get_inputs_key(label_files: list) -> list:
+    file_stats = [os.stat(label_file) for label_file in label_files]
+    return [len(label_files),
+            sum(file_stat.st_size for file_stat in file_stats),
+            max((file_stat.st_mtime_ns for file_stat in file_stats), default=0)]
+
+
+def find_jobs(format_type: str, input_folder: str, output_folder: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> list:
+    """
+    :param format_type: label format
+    :param input_folder: root folder of the label files
+    :param output_folder: root folder of the converted label files; the folder tree of the input is kept
+    :param chunk_size: the maximum number of label files per job for the formats with many label files per task
+    :return: (job key, label files, converted filename) of the jobs
+    """
+    reader_class = get_reader_class(format_type)
+    extensions = tuple(f".{ext}" for ext in reader_class.LABEL_FILE_EXTENSIONS)
+
+    jobs = []
+    for root, dirs, files in os.walk(input_folder):
+        dirs.sort()
+        label_files = [os.path.join(root, file) for file in sorted(files)
+                       if file.lower().endswith(extensions) and file != STATE_FILENAME]
+        if not label_files:
+            continue
+
+        rel_folder = os.path.relpath(root, input_folder)
+        if reader_class.FILE_PER_TASK:
+            for label_file in label_files:
+                key = os.path.relpath(label_file, input_folder)
+                converted_filename = os.path.join(output_folder, os.path.splitext(key)[0] + ".json")
+                jobs.append((key, [label_file], converted_filename))
+        else:
+            name = os.path.basename(os.path.abspath(input_folder)) if rel_folder == "." else rel_folder
+            chunks = [label_files[start:start + chunk_size] for start in range(0, len(label_files), chunk_size)]
+            for idx, chunk in enumerate(chunks):
+                key = f"{rel_folder}#{idx}"
+                suffix = f"-{idx}" if len(chunks) > 1 else ""
+                converted_filename = os.path.join(output_folder, f"{name}{suffix}.json")
+                jobs.append((key, chunk, converted_filename))
+    return jobs
+
+
+def _save_state(state_filename: str, state: dict):
+    json_codec.dump_file(state, state_filename + ".tmp", pretty=True)
+    os.replace(state_filename + ".tmp", state_filename)
+
+
+def _run_job(format_type: str, label_files: list, converted_filename: str) -> (str, int, float):
+    started = time.perf_counter()
+    os.makedirs(os.path.dirname(converted_filename), exist_ok=True)
+    # the jobs already run in parallel: convert each job in its own process only
+    convert_job(format_type, label_files, converted_filename, max_workers=1)
+    return converted_filename, len(label_files), time.perf_counter() - started
+
+
+def batch_convert(format_type: str, input_folder: str, output_folder: str, max_workers: int = None,
+                  chunk_size: int = DEFAULT_CHUNK_SIZE, restart=False) -> list:
+    """
+    :param format_type: label format
+    :param input_folder: root folder of the label files
+    :param output_folder: root folder of the converted label files
+    :param max_workers: the number of processes; defaults to the number of CPUs
+    :param chunk_size: the maximum number of label files per job
+    :param restart: ignore the completed jobs of the previous run
+    :return: converted label filenames
+    """
+    os.makedirs(output_folder, exist_ok=True)
+    state_filename = os.path.join(output_folder, STATE_FILENAME)
+    state = {} if restart else json_codec.load_file(state_filename) if os.path.exists(state_filename) else {}
+    state.setdefault('format', format_type)
+    completed = state.setdefault('completed', {})
+
+    jobs = find_jobs(format_type, input_folder, output_folder, chunk_size)
+    pending_jobs = []
+    for key, label_files, converted_filename in jobs:
+        done = completed.get(key)
+        if done and done['inputs'] == _get_inputs_key(label_files) and os.path.exists(done['output']):
+            continue
+        pending_jobs.append((key, label_files, converted_filename))
+
+    total_files = sum(len(label_files) for _, label_files, _ in pending_jobs)
+    logger.info(f"{len(jobs)} jobs found, {len(jobs) - len(pending_jobs)} already converted, "
+                f"{len(pending_jobs)} jobs ({total_files} label files) to convert")
+
+    started = time.perf_counter()
+    converted_files = 0
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(_run_job, format_type, label_files, converted_filename): (key, label_files)
+                   for key, label_files, converted_filename in pending_jobs}
+        for done_count, future in enumerate(as_completed(futures), start=1):
+            key, label_files = futures[future]
+            try:
+                converted_filename, file_count, elapsed = future.result()
+            except Exception as e:
+                logger.error(f"Failed to convert {key}: {str(e)}")
+                continue
+
+            completed[key] = {"output": converted_filename, "inputs": _get_inputs_key(label_files)}
+            _save_state(state_filename, state)
+
+            converted_files += file_count
+            total_elapsed = time.perf_counter() - started
+            logger.info(f"[{done_count}/{len(pending_jobs)}] {converted_filename}: {file_count} files in "
+                        f"{elapsed:.1f}s, {converted_files / max(total_elapsed, 1e-9):.1f} files/s overall")
+
+    total_elapsed = time.perf_counter() - started
+    print(f"Converted {converted_files} label files in {total_elapsed:.1f}s "
+          f"({converted_files / max(total_elapsed, 1e-9):.1f} files/s) into {output_folder}")
+    return [done['output'] for done in completed.values()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert the label files of a directory tree")
+    parser.add_argument("--format", required=True, choices=get_label_formats(), help="label format")
+    parser.add_argument("--input", required=True, help="root folder of the label files")
+    parser.add_argument("--output", required=True, help="root folder of the converted label files")
+    parser.add_argument("--workers", type=int, default=None, help="the number of processes")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE,
+                        help="the maximum number of label files per job")
+    parser.add_argument("--restart", action="store_true", help="convert all the jobs again")
+    args = parser.parse_args()
+
+    batch_convert(args.format, args.input, args.output, args.workers, args.chunk_size, args.restart)
+
+
+if __name__ == '__main__':
+    main()
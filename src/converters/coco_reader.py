@@ -0,0 +1,236 @@
+import mmap
+import os
+import tempfile
+from array import array
+
+import cv2
+import numpy as np
+
+from src.common import json_codec
+from src.common.logger import get_logger
+from .reader_base import ReaderBase
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+logger = get_logger(__name__)
+
+"""
+.. module:: coco_reader
+   :synopsis: single-pass COCO json conversion within bounded memory
+   The categories, images and annotations arrays are streamed with ijson when it is installed
+   (otherwise the file is loaded once with json_codec).
+   Each annotation is converted once into a box and its segmentation polygons (RLE masks are traced into
+   polygons) and spilled to a temporary file, recording only the image index and the byte range.
+   The spilled objects are then grouped by image with a stable argsort of the image indices and
+   written image by image, so only the image table and two integer arrays per annotation stay in memory.
+   The output is the ADQ label format that convert_COCO_to_Form used to write.
+"""
+
+COCO_ARRAYS = ('categories', 'images', 'annotations')
+
+
+def _decode_rle_counts(counts: str) -> list:
+    """
+    decode the compressed RLE counts of COCO (the same encoding as pycocotools)
+    :param counts: compressed counts string
+    :return: run lengths
+    """
+    decoded = []
+    position = 0
+    while position < len(counts):
+        value, shift, more = 0, 0, True
+        while more:
+            char = ord(counts[position]) - 48
+            value |= (char & 0x1f) << (5 * shift)
+            more = char & 0x20
+            position += 1
+            shift += 1
+            if not more and (char & 0x10):
+                value |= -1 << (5 * shift)
+        if len(decoded) > 2:
+            value += decoded[-2]
+        decoded.append(value)
+    return decoded
+
+
+def rle_to_polygons(rle: dict) -> list:
+    """
+    :param rle: {"size": [height, width], "counts": list or compressed string}
+    :return: polygons as [x1, y1, x2, y2, ...] lists
+    """
+    height, width = rle['size']
+    counts = rle['counts']
+    if isinstance(counts, str):
+        counts = _decode_rle_counts(counts)
+
+    counts = np.asarray(counts, dtype=np.int64)
+    values = np.arange(len(counts), dtype=np.int64) % 2
+    # the masks are column-major
+    mask = np.repeat(values, counts)[:height * width].astype(np.uint8)
+    mask = np.pad(mask, (0, height * width - len(mask))).reshape(width, height).T
+
+    contours, _ = cv2.findContours(np.ascontiguousarray(mask), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    return [contour.reshape(-1).tolist() for contour in contours if len(contour) >= 3]
+
+
+def _to_position(values) -> str:
+    return ', '.join(str(value) for value in values)
+
+
+def _to_objects(annotation: dict, label: str, group_id: int) -> list:
+    """
+    convert an annotation into a box and its segmentation polygons sharing the same group_id
+    """
+    objects = list()
+    bbox = annotation.get('bbox')
+    if bbox:
+        x, y, w, h = bbox
+        objects.append({
+            'label': label,
+            'type': 'box',
+            'occluded': "0",
+            'z_order': "0",
+            'group_id': str(group_id),
+            'position': _to_position([x, y, x + w, y + h])
+        })
+
+    segmentation = annotation.get('segmentation') or []
+    polygons = rle_to_polygons(segmentation) if isinstance(segmentation, dict) else segmentation
+    for polygon in polygons:
+        # keep the numbers as they are (e.g., 1 instead of 1.0)
+        points = zip(polygon[0::2], polygon[1::2])
+        objects.append({
+            'label': label,
+            'type': 'polygon',
+            'occluded': "0",
+            'z_order': "0",
+            'group_id': str(group_id),
+            'position': ';'.join(f"{x},{y}" for x, y in points)
+        })
+    return objects
+
+
+class COCOReader(ReaderBase):
+    FILE_PER_TASK = True
+    LABEL_FILE_EXTENSIONS = ['json']
+
+    @staticmethod
+    def _iter_items(label_file: str, array_name: str):
+        with open(label_file, 'rb') as json_file:
+            yield from ijson.items(json_file, f"{array_name}.item", use_float=True)
+
+    @staticmethod
+    def iter_arrays(label_file: str) -> tuple:
+        """
+        :param label_file: COCO json filename
+        :return: iterators over the categories, the images and the annotations
+        """
+        if ijson:
+            return tuple(COCOReader._iter_items(label_file, array_name) for array_name in COCO_ARRAYS)
+        # the file is parsed once and the three arrays are read from the same dictionary
+        coco_dict = json_codec.load_file(label_file)
+        return tuple(iter(coco_dict.get(array_name, [])) for array_name in COCO_ARRAYS)
+
+    def parse(self, label_files, data_files=None):
+        super().parse(label_files, data_files)
+
+        images = list()
+        for label_file in label_files:
+            with tempfile.TemporaryDirectory() as temp_folder:
+                converted_filename = os.path.join(temp_folder, "coco.json")
+                self.convert([label_file], converted_filename)
+                images.extend(json_codec.load_file(converted_filename)['images'])
+
+        self.data_labels_dict['images'] = images
+        return self.data_labels_dict
+
+    def convert(self, label_files: list, converted_filename: str, data_files: list = None,
+                max_workers: int = None) -> str:
+        """
+        convert a COCO json file to an ADQ label file
+        :param label_files: [COCO json filename]
+        :param converted_filename: label filename to save
+        :param data_files: image filenames
+        :param max_workers: not used: the conversion is a single pass
+        :return: converted_filename
+        """
+        label_file = label_files[0]
+        header = super().parse(label_files, data_files)
+        coco_categories, coco_images, coco_annotations = COCOReader.iter_arrays(label_file)
+        label_dict = {category['id']: category['name'] for category in coco_categories}
+
+        images = list()
+        image_index_dict = dict()
+        for coco_image in coco_images:
+            image_index_dict[coco_image['id']] = len(images)
+            images.append({
+                'image_id': str(coco_image['id']),
+                'name': str(coco_image['file_name']),
+                'width': str(coco_image['width']),
+                'height': str(coco_image['height']),
+                'objects': []
+            })
+
+        folder = os.path.dirname(os.path.abspath(converted_filename))
+        with tempfile.TemporaryFile(dir=folder) as spill_file:
+            # spill the objects of each annotation as a json array
+            image_indices, offsets = array('q'), array('q', [0])
+            for group_id, annotation in enumerate(coco_annotations):
+                image_index = image_index_dict.get(annotation['image_id'])
+                if image_index is None:
+                    logger.warning(f"Skipping annotation {annotation.get('id')} of unknown image "
+                                   f"{annotation['image_id']}")
+                    continue
+
+                objects = _to_objects(annotation, label_dict.get(annotation['category_id'], ""), group_id)
+                spill_file.write(json_codec.dumps(objects))
+                image_indices.append(image_index)
+                offsets.append(spill_file.tell())
+            spill_file.flush()
+
+            image_indices = np.frombuffer(image_indices, dtype=np.int64)
+            offsets = np.frombuffer(offsets, dtype=np.int64)
+            # group the annotations by image while keeping their order
+            order = np.argsort(image_indices, kind='stable')
+            bounds = np.searchsorted(image_indices[order], np.arange(len(images) + 1))
+
+            spilled = mmap.mmap(spill_file.fileno(), 0, access=mmap.ACCESS_READ) if offsets[-1] > 0 else b""
+            try:
+                self._write(converted_filename, header, images, spilled, offsets, order, bounds)
+            finally:
+                if isinstance(spilled, mmap.mmap):
+                    spilled.close()
+
+        logger.info(f"converted {len(image_indices)} annotations of {len(images)} images into {converted_filename}")
+        return converted_filename
+
+    @staticmethod
+    def _write(converted_filename: str, header: dict, images: list, spilled, offsets: np.ndarray,
+               order: np.ndarray, bounds: np.ndarray):
+        json_header = json_codec.dumps(dict(header, images=[]))
+        # drop the closing "[]}" to append the images
+        json_header = json_header[:json_header.rindex(b"[")]
+
+        with open(converted_filename + ".tmp", 'wb') as json_file:
+            json_file.write(json_header + b"[")
+            for image_index, image in enumerate(images):
+                if image_index > 0:
+                    json_file.write(b",")
+                json_image = json_codec.dumps(image)
+                # splice the spilled object arrays into "objects":[]
+                json_file.write(json_image[:json_image.rindex(b"[")] + b"[")
+                first = True
+                for annotation_index in order[bounds[image_index]:bounds[image_index + 1]]:
+                    start, end = offsets[annotation_index], offsets[annotation_index + 1]
+                    objects = spilled[start + 1:end - 1]
+                    if objects:
+                        if not first:
+                            json_file.write(b",")
+                        json_file.write(objects)
+                        first = False
+                json_file.write(b"]}")
+            json_file.write(b"]}")
+        os.replace(converted_filename + ".tmp", converted_filename)
@@ -1,74 +1,128 @@
 import xml.etree.ElementTree as ET
 
+from src.common import json_codec
+from src.common.logger import get_logger
+from src.models.adq_labels import AdqLabels
+from src.models.data_labels import DataLabels
 from .reader_base import ReaderBase
 
+logger = get_logger(__name__)
+
 BO_SHAPE_TYPES = ['box', 'polygon', 'polyline', 'points', 'face', 'body', 'leftHand', 'rightHand']
 
 
 class CVATReader(ReaderBase):
+    FILE_PER_TASK = True
+    LABEL_FILE_EXTENSIONS = ['xml']
+
+    @staticmethod
+    def _parse_object(el_object: ET.Element) -> dict:
+        object_type = el_object.tag
+        object_dict = dict()
+        object_dict['label'] = el_object.attrib['label']
+        object_dict['type'] = object_type
+        object_dict['occluded'] = el_object.attrib.get('occluded', "0")
+        object_dict['z_order'] = el_object.attrib.get('z_order', "0")
+        object_dict['group_id'] = el_object.attrib.get('group_id', "")
+
+        if object_type == 'box':
+            object_dict['position'] = "{}, {}, {}, {}".format(el_object.attrib['xtl'],
+                                                              el_object.attrib['ytl'],
+                                                              el_object.attrib['xbr'],
+                                                              el_object.attrib['ybr'])
+        else:
+            object_dict['position'] = el_object.attrib['points']
+
+        attributes = list()
+        for each_attr in el_object:
+            if each_attr.tag == 'attribute':
+                attributes_dict = dict()
+                attributes_dict['attribute_name'] = each_attr.attrib['name']
+                attributes_dict['attribute_value'] = each_attr.text
+                attributes.append(attributes_dict)
+
+        object_dict['attributes'] = attributes
+        return object_dict
+
+    @staticmethod
+    def _parse_image(el_image: ET.Element) -> dict:
+        image_dict = dict()
+        image_dict['image_id'] = el_image.attrib['id']
+        image_dict['name'] = el_image.attrib['name']
+        image_dict['width'] = el_image.attrib['width']
+        image_dict['height'] = el_image.attrib['height']
+
+        # a single pass over the children, dispatched on the tag.
+        # the objects are still grouped in the order of BO_SHAPE_TYPES
+        objects_by_type = {object_type: [] for object_type in BO_SHAPE_TYPES}
+        for el_object in el_image:
+            objects = objects_by_type.get(el_object.tag)
+            if objects is not None:
+                objects.append(CVATReader._parse_object(el_object))
+
+        image_dict['objects'] = [object_dict for object_type in BO_SHAPE_TYPES
+                                 for object_dict in objects_by_type[object_type]]
+        return image_dict
+
+    @staticmethod
+    def iter_images(label_file: str):
+        """
+        stream the images of a CVAT xml file; the elements are cleared as soon as they are consumed
+        so that the memory does not grow with the size of the file
+        :param label_file: CVAT xml filename
+        :return: a generator of image dictionaries
+        """
+        root = None
+        depth = 0
+        for event, element in ET.iterparse(label_file, events=('start', 'end')):
+            if event == 'start':
+                if root is None:
+                    if element.tag != 'annotations':
+                        raise Exception(label_file + 'is not a supported CVAT format.')
+                    root = element
+                depth += 1
+                continue
+
+            depth -= 1
+            # direct children of <annotations>: <version>, <meta>, <image>...
+            if depth == 1:
+                if element.tag == 'image':
+                    yield CVATReader._parse_image(element)
+                element.clear()
+                root.clear()
+
     def parse(self, label_files, data_files=None):
         super().parse(label_files, data_files)
 
         for label_file in label_files:
-            xml_structure = ET.parse(label_file)
-
-            root_info = xml_structure.getroot()
-            if root_info.tag != 'annotations':
-                raise Exception(label_file + 'is not a supported CVAT format.')
-
-            images = list()
-            el_images = root_info.findall('image')
-            for el_image in el_images:
-                image_dict = dict()
-                image_dict['image_id'] = el_image.attrib['id']
-                image_dict['name'] = el_image.attrib['name']
-                image_dict['width'] = el_image.attrib['width']
-                image_dict['height'] = el_image.attrib['height']
-
-                objects_list = list()
-                for object_type in BO_SHAPE_TYPES:
-                    el_objects = el_image.findall(object_type)
-                    for el_object in el_objects:
-                        object_dict = dict()
-                        object_dict['label'] = el_object.attrib['label']
-                        object_dict['type'] = object_type
-
-                        try:
-                            object_dict['occluded'] = el_object.attrib['occluded']
-                        except KeyError:
-                            object_dict['occluded'] = "0"
-
-                        try:
-                            object_dict['z_order'] = el_object.attrib['z_order']
-                        except KeyError:
-                            object_dict['z_order'] = "0"
-
-                        try:
-                            object_dict['group_id'] = el_object.attrib['group_id']
-                        except KeyError:
-                            object_dict['group_id'] = ""
-
-                        if object_type == 'box':
-                            object_dict['position'] = "{}, {}, {}, {}".format(el_object.attrib['xtl'],
-                                                                              el_object.attrib['ytl'],
-                                                                              el_object.attrib['xbr'],
-                                                                              el_object.attrib['ybr'])
-                        else:
-                            object_dict['position'] = el_object.attrib['points']
-
-                        attributes = list()
-                        el_attributes = el_object.findall('attribute')
-                        for each_attr in el_attributes:
-                            attributes_dict = dict()
-                            attributes_dict['attribute_name'] = each_attr.attrib['name']
-                            attributes_dict['attribute_value'] = each_attr.text
-                            attributes.append(attributes_dict)
-
-                        object_dict['attributes'] = attributes
-                        objects_list.append(object_dict)
-
-                image_dict['objects'] = objects_list
-                images.append(image_dict)
-
-            self.data_labels_dict['images'] = images
+            self.data_labels_dict['images'] = list(CVATReader.iter_images(label_file))
         return self.data_labels_dict
+
+    @staticmethod
+    def iter_encoded_images(label_files: list):
+        """
+        :param label_files: CVAT xml filenames
+        :return: a generator of the images encoded as DataLabels.Image json, one image in memory at a time
+        """
+        for label_file in label_files:
+            for image_dict in CVATReader.iter_images(label_file):
+                data_labels_image = DataLabels.Image.from_adq_image(AdqLabels.Image.from_json(image_dict))
+                yield json_codec.dumps(data_labels_image)
+
+    def convert(self, label_files: list, converted_filename: str, data_files: list = None,
+                max_workers: int = None) -> str:
+        """
+        convert the xml files straight to a label file without building the whole label dictionary,
+        so that the memory stays flat for large exports; the files of a batch are converted in a process pool
+        (see batch_convert) rather than the images of a file
+        :param label_files: CVAT xml filenames
+        :param converted_filename: label filename to save
+        :param data_files: image filenames
+        :param max_workers: not used
+        :return: converted_filename
+        """
+        logger.info(f"parsing {label_files}")
+        header = super().parse(label_files, data_files)
+        DataLabels.save_encoded_images(converted_filename, header, CVATReader.iter_encoded_images(label_files))
+        return converted_filename
+
@@ -0,0 +1,12 @@
+from src.common.convert_lib import to_gpr_images
+from .reader_base import ReaderBase
+
+
+class GprReader(ReaderBase):
+    LABEL_FILE_EXTENSIONS = ['json']
+
+    def parse(self, label_files, data_files=None):
+        super().parse(label_files, data_files)
+
+        self.data_labels_dict['images'] = to_gpr_images(label_files, data_files)
+        return self.data_labels_dict
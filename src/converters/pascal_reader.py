@@ -0,0 +1,12 @@
+from src.common.convert_lib import to_pascal_images
+from .reader_base import ReaderBase
+
+
+class PascalReader(ReaderBase):
+    LABEL_FILE_EXTENSIONS = ['xml']
+
+    def parse(self, label_files, data_files=None):
+        super().parse(label_files, data_files)
+
+        self.data_labels_dict['images'] = to_pascal_images(label_files)
+        return self.data_labels_dict
@@ -1,10 +1,17 @@
 from abc import ABC
 
+from src.common import json_codec
+
 CONVERT_ID = "96E7D8C8-44E4-4055-8487-85B3208E51A2"
 CONVERT_VERSION = "0.1"
 
 
 class ReaderBase(ABC):
+    # True if every label file is converted into a label file of its own (i.e., a task),
+    # False if all the label files (e.g., one per image) are converted into a single label file
+    FILE_PER_TASK = False
+    LABEL_FILE_EXTENSIONS = []
+
     def __init__(self):
         self.data_labels_dict = {}
 
@@ -13,3 +20,16 @@ class ReaderBase(ABC):
         self.data_labels_dict['twconverted'] = CONVERT_ID
         self.data_labels_dict['template_version'] = CONVERT_VERSION
         return self.data_labels_dict
+
+    def convert(self, label_files: list, converted_filename: str, data_files: list = None,
+                max_workers: int = None) -> str:
+        """
+        convert the label files to a label file
+        :param label_files: label filenames
+        :param converted_filename: label filename to save
+        :param data_files: image filenames
+        :param max_workers: the number of processes the reader may use; 1 converts in the current process
+        :return: converted_filename
+        """
+        json_codec.dump_file(self.parse(label_files, data_files), converted_filename)
+        return converted_filename
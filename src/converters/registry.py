@@ -0,0 +1,97 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from src.common.constants import (
+    AIMMO_JSON,
+    COCO_JSON,
+    CVAT_XML,
+    GPR_JSON,
+    PASCAL_VOC_XML,
+    STRADVISION_XML,
+    SUPERBAI_JSON,
+    YOLO_V5_TXT
+)
+from .aimmo_reader import AimmoReader
+from .coco_reader import COCOReader
+from .cvat_reader import CVATReader
+from .gpr_reader import GprReader
+from .pascal_reader import PascalReader
+from .reader_base import ReaderBase
+from .stvision_reader import StVisionReader
+from .superbai_reader import SuperbAIReader
+from .yolo_reader import YoloReader
+
+"""
+.. module:: registry
+   :synopsis: label format -> reader
+   Every label format is converted by a ReaderBase subclass through ReaderBase.convert, so that the
+   upload form (pages/tasks.py) and the batch conversion CLI (converters/batch_convert.py) share the same readers.
+   Register a new format with register_reader.
+"""
+
+_READERS = {
+    CVAT_XML: CVATReader,
+    STRADVISION_XML: StVisionReader,
+    GPR_JSON: GprReader,
+    YOLO_V5_TXT: YoloReader,
+    COCO_JSON: COCOReader,
+    PASCAL_VOC_XML: PascalReader,
+    SUPERBAI_JSON: SuperbAIReader,
+    AIMMO_JSON: AimmoReader,
+}
+
+
+def register_reader(format_type: str, reader_class: type):
+    _READERS[format_type] = reader_class
+
+
+def get_label_formats() -> list:
+    return list(_READERS.keys())
+
+
+def get_reader_class(format_type: str) -> type:
+    reader_class = _READERS.get(format_type)
+    if reader_class is None:
+        raise ValueError(f"{format_type} is not a supported label format: {get_label_formats()}")
+    return reader_class
+
+
+def get_reader(format_type: str) -> ReaderBase:
+    return get_reader_class(format_type)()
+
+
+def convert_job(format_type: str, label_files: list, converted_filename: str, data_files: list = None,
+                max_workers: int = None) -> str:
+    """
+    convert the label files of a job (a task); runs in the worker processes
+    """
+    return get_reader(format_type).convert(label_files, converted_filename, data_files, max_workers)
+
+
+def convert_label_files(format_type: str, label_files: list, save_folder: str, data_files: list = None,
+                        max_workers: int = None) -> list:
+    """
+    convert the uploaded label files to anno-<index>.json
+    :param format_type: label format
+    :param label_files: label filenames
+    :param save_folder: folder to save the label files in
+    :param data_files: image filenames
+    :param max_workers: the number of processes; defaults to the number of CPUs
+    :return: converted label filenames
+    """
+    reader_class = get_reader_class(format_type)
+    if not reader_class.FILE_PER_TASK:
+        converted_filename = os.path.join(save_folder, "anno-0.json")
+        return [convert_job(format_type, label_files, converted_filename, data_files, max_workers)]
+
+    converted_filenames = [os.path.join(save_folder, f"anno-{idx}.json") for idx in range(len(label_files))]
+    if len(label_files) <= 1:
+        return [convert_job(format_type, [label_file], converted_filename, data_files, 1)
+                for label_file, converted_filename in zip(label_files, converted_filenames)]
+
+    # one label file per process
+    max_workers = min(max_workers or os.cpu_count() or 1, len(label_files))
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(convert_job, format_type, [label_file], converted_filename, data_files, 1)
+                   for label_file, converted_filename in zip(label_files, converted_filenames)]
+        return [future.result() for future in futures]
@@ -1,10 +1,19 @@
 import os
 import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
 
+from src.common import json_codec
+from src.models.data_labels import DataLabels
 from .reader_base import ReaderBase
 
+# below this number of files, parsing in the current process is faster than starting the processes
+PARALLEL_MIN_FILES = 64
+PARALLEL_CHUNK_SIZE = 256
+
 
 class StVisionReader(ReaderBase):
+    LABEL_FILE_EXTENSIONS = ['xml']
+
     @staticmethod
     def _parse_points(element: ET.Element) -> list:
         points = []
@@ -44,78 +53,125 @@ class StVisionReader(ReaderBase):
 
         return attributes_dict
 
+    @staticmethod
+    def parse_file(image_id: int, xml_file: str) -> dict:
+        """
+        :param image_id: index of the image
+        :param xml_file: StVision xml filename of the image
+        :return: image dictionary
+        """
+        xml_structure = ET.parse(xml_file)
+
+        cur_img = dict()
+        cur_img['image_id'] = str(image_id)
+        cur_img['name'] = os.path.splitext(os.path.basename(xml_file))[0] + '.jpg'
+
+        root = xml_structure.getroot()
+        image_width = int(root.get('imageWidth'))
+        image_height = int(root.get('imageHeight'))
+        cur_img['width'] = image_width
+        cur_img['height'] = image_height
+
+        label_objects = []
+        # Find the VP element
+        el_vanishing_point = root.find('VP')
+        if el_vanishing_point is not None and el_vanishing_point.get('hasVP'):
+            vanishing_point_dict = dict()
+            vanishing_point_dict['label'] = 'VP'
+            vanishing_point_dict['type'] = 'VP'
+            # Extract the VP coordinates
+            x_ratio = float(el_vanishing_point.get('x_ratio'))
+            y_ratio = float(el_vanishing_point.get('y_ratio'))
+            # Convert to image coordinates and save it as a polygon point
+            vanishing_point_dict['points'] = [[image_width * x_ratio, image_height * y_ratio]]
+
+            # Add as an object (i.e., an annotation)
+            label_objects.append(vanishing_point_dict)
+
+        # Polygons, Boundarys, and Splines
+        el_splines = root.find('Splines')
+        if el_splines:
+            for el_spline in el_splines.findall('Spline'):
+                spline_dict = dict()
+                spline_dict['label'] = el_spline.tag.lower()
+                spline_dict['type'] = el_spline.tag.lower()
+                # sort the control points by y as they can be out of order
+                spline_dict['points'] = sorted(StVisionReader._parse_points(el_spline),
+                                               key=lambda p: p[1])
+                spline_dict['attributes'] = StVisionReader._parse_attributes_occlusions(el_spline)
+                label_objects.append(spline_dict)
+
+        el_polygons = root.find('Polygons')
+        if el_polygons:
+            for el_polygon in el_polygons.findall('Polygon'):
+                polygon_dict = dict()
+                polygon_dict['label'] = el_polygon.tag.lower()
+                polygon_dict['type'] = el_polygon.tag.lower()
+                polygon_dict['points'] = StVisionReader._parse_points(el_polygon)
+                polygon_dict['attributes'] = StVisionReader._parse_attributes(el_polygon)
+
+                label_objects.append(polygon_dict)
+
+        el_boundaries = root.find('Boundarys')
+        if el_boundaries:
+            for el_boundary in el_boundaries.findall('Boundary'):
+                boundary_dict = dict()
+                boundary_dict['label'] = el_boundary.tag.lower()
+                boundary_dict['type'] = el_boundary.tag.lower()
+                boundary_dict['points'] = sorted(StVisionReader._parse_points(el_boundary),
+                                                 key=lambda p: p[1])
+                boundary_dict['attributes'] = StVisionReader._parse_attributes_occlusions(el_boundary)
+                label_objects.append(boundary_dict)
+
+        cur_img['objects'] = label_objects
+        return cur_img
+
     def parse(self, label_files, data_files=None):
         super().parse(label_files, data_files)
 
         images = list()
         for image_id, xml_file in enumerate(label_files):
-            xml_structure = ET.parse(xml_file)
-
-            cur_img = dict()
-            cur_img['image_id'] = str(image_id)
-            cur_img['name'] = os.path.splitext(os.path.basename(xml_file))[0] + '.jpg'
-
-            root = xml_structure.getroot()
-            image_width = int(root.get('imageWidth'))
-            image_height = int(root.get('imageHeight'))
-            cur_img['width'] = image_width
-            cur_img['height'] = image_height
-
-            label_objects = []
-            # Find the VP element
-            el_vanishing_point = root.find('VP')
-            if el_vanishing_point is not None and el_vanishing_point.get('hasVP'):
-                vanishing_point_dict = dict()
-                vanishing_point_dict['label'] = 'VP'
-                vanishing_point_dict['type'] = 'VP'
-                # Extract the VP coordinates
-                x_ratio = float(el_vanishing_point.get('x_ratio'))
-                y_ratio = float(el_vanishing_point.get('y_ratio'))
-                # Convert to image coordinates and save it as a polygon point
-                vanishing_point_dict['points'] = [[image_width * x_ratio, image_height * y_ratio]]
-
-                # Add as an object (i.e., an annotation)
-                label_objects.append(vanishing_point_dict)
-
-            # Polygons, Boundarys, and Splines
-            el_splines = root.find('Splines')
-            if el_splines:
-                for el_spline in el_splines.findall('Spline'):
-                    spline_dict = dict()
-                    spline_dict['label'] = el_spline.tag.lower()
-                    spline_dict['type'] = el_spline.tag.lower()
-                    # sort the control points by y as they can be out of order
-                    spline_dict['points'] = sorted(StVisionReader._parse_points(el_spline),
-                                                   key=lambda p: p[1])
-                    spline_dict['attributes'] = StVisionReader._parse_attributes_occlusions(el_spline)
-                    label_objects.append(spline_dict)
-
-            el_polygons = root.find('Polygons')
-            if el_polygons:
-                for el_polygon in el_polygons.findall('Polygon'):
-                    polygon_dict = dict()
-                    polygon_dict['label'] = el_polygon.tag.lower()
-                    polygon_dict['type'] = el_polygon.tag.lower()
-                    polygon_dict['points'] = StVisionReader._parse_points(el_polygon)
-                    polygon_dict['attributes'] = StVisionReader._parse_attributes(el_polygon)
-
-                    label_objects.append(polygon_dict)
-
-            el_boundaries = root.find('Boundarys')
-            if el_boundaries:
-                for el_boundary in el_boundaries.findall('Boundary'):
-                    boundary_dict = dict()
-                    boundary_dict['label'] = el_boundary.tag.lower()
-                    boundary_dict['type'] = el_boundary.tag.lower()
-                    boundary_dict['points'] = sorted(StVisionReader._parse_points(el_boundary),
-                                                     key=lambda p: p[1])
-                    boundary_dict['attributes'] = StVisionReader._parse_attributes_occlusions(el_boundary)
-                    label_objects.append(boundary_dict)
-
-            cur_img['objects'] = label_objects
-            images.append(cur_img)
+            images.append(StVisionReader.parse_file(image_id, xml_file))
 
         self.data_labels_dict['images'] = images
         return self.data_labels_dict
 
-
+    @staticmethod
+    def iter_encoded_images(label_files: list, max_workers: int = None):
+        """
+        parse the xml files across a process pool
+        :param label_files: StVision xml filenames, one per image
+        :param max_workers: the number of processes; defaults to the number of CPUs, 1 parses in the current process
+        :return: a generator of the images encoded as DataLabels.Image json, in the order of label_files
+        """
+        if len(label_files) < PARALLEL_MIN_FILES or max_workers == 1:
+            for image_id, xml_file in enumerate(label_files):
+                yield _parse_encoded_image(image_id, xml_file)
+            return
+
+        max_workers = max_workers or os.cpu_count() or 1
+        chunk_size = max(1, min(PARALLEL_CHUNK_SIZE, len(label_files) // (max_workers * 4)))
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            # map yields the results in order while the later chunks are still being parsed
+            yield from executor.map(_parse_encoded_image, range(len(label_files)), label_files,
+                                    chunksize=chunk_size)
+
+    def convert(self, label_files: list, converted_filename: str, data_files: list = None,
+                max_workers: int = None) -> str:
+        """
+        convert the xml files straight to a label file without building the whole label dictionary
+        :param label_files: StVision xml filenames, one per image
+        :param converted_filename: label filename to save
+        :param data_files: image filenames
+        :param max_workers: the number of processes; defaults to the number of CPUs
+        :return: converted_filename
+        """
+        header = super().parse(label_files, data_files)
+        DataLabels.save_encoded_images(converted_filename, header,
+                                       StVisionReader.iter_encoded_images(label_files, max_workers))
+        return converted_filename
+
+
+def _parse_encoded_image(image_id: int, xml_file: str) -> bytes:
+    # runs in the worker processes: the validation and encoding are done there as well
+    return json_codec.dumps(DataLabels.Image.from_json(StVisionReader.parse_file(image_id, xml_file)))
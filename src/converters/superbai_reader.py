@@ -0,0 +1,34 @@
+import os
+
+from src.common import image_probe
+from src.common.convert_lib import to_superbai_images
+from .reader_base import ReaderBase
+
+
+class SuperbAIReader(ReaderBase):
+    LABEL_FILE_EXTENSIONS = ['json']
+
+    @staticmethod
+    def fill_image_sizes(images: list, label_files: list, data_files: list = None):
+        """
+        the Superb AI labels have no image size: read it from the image headers
+        :param images: image dictionaries of the label files
+        :param label_files: Superb AI json filenames, one per image
+        :param data_files: image filenames; the images are looked up next to the label files if None
+        """
+        data_files_dict = {os.path.basename(data_file): data_file for data_file in data_files or []}
+        image_files = [data_files_dict.get(image['name'], os.path.join(os.path.dirname(label_file), image['name']))
+                       for image, label_file in zip(images, label_files)]
+        found = [(image, image_file) for image, image_file in zip(images, image_files) if os.path.exists(image_file)]
+        image_sizes = image_probe.get_image_sizes([image_file for _, image_file in found])
+        for (image, _), (width, height) in zip(found, image_sizes):
+            image['width'] = str(width)
+            image['height'] = str(height)
+
+    def parse(self, label_files, data_files=None):
+        super().parse(label_files, data_files)
+
+        images = to_superbai_images(label_files)
+        SuperbAIReader.fill_image_sizes(images, label_files, data_files)
+        self.data_labels_dict['images'] = images
+        return self.data_labels_dict
@@ -0,0 +1,43 @@
+import os
+
+from src.common import json_codec
+from src.common.constants import SUPPORTED_IMAGE_FILE_EXTENSIONS
+from src.common.convert_lib import to_yolo_images
+from .reader_base import ReaderBase
+
+
+class YoloReader(ReaderBase):
+    LABEL_FILE_EXTENSIONS = ['txt']
+
+    @staticmethod
+    def find_image_file(label_file: str) -> str:
+        """
+        find the image of a YOLO label file: <root>/labels/x.txt -> <root>/x.jpg or <root>/images/x.jpg
+        :param label_file: YOLO txt filename
+        :return: image filename or None
+        """
+        stem = os.path.splitext(os.path.basename(label_file))[0]
+        root = os.path.dirname(os.path.dirname(label_file))
+        for folder in [root, os.path.join(root, "images"), os.path.dirname(label_file)]:
+            for ext in SUPPORTED_IMAGE_FILE_EXTENSIONS:
+                for image_file in [os.path.join(folder, f"{stem}.{ext}"), os.path.join(folder, f"{stem}.{ext.upper()}")]:
+                    if os.path.exists(image_file):
+                        return image_file
+        return None
+
+    def parse(self, label_files, data_files=None, max_workers: int = None):
+        super().parse(label_files, data_files)
+
+        if not data_files:
+            # the label files without an image are skipped
+            pairs = [(label_file, YoloReader.find_image_file(label_file)) for label_file in label_files]
+            label_files = [label_file for label_file, data_file in pairs if data_file]
+            data_files = [data_file for _, data_file in pairs if data_file]
+
+        self.data_labels_dict['images'] = to_yolo_images(label_files, data_files, max_workers)
+        return self.data_labels_dict
+
+    def convert(self, label_files: list, converted_filename: str, data_files: list = None,
+                max_workers: int = None) -> str:
+        json_codec.dump_file(self.parse(label_files, data_files, max_workers), converted_filename)
+        return converted_filename
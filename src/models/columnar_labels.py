@@ -0,0 +1,512 @@
+import copy
+import os
+from collections.abc import Sequence
+
+import attr
+import numpy as np
+
+import src.common.utils as utils
+from src.common.logger import get_logger
+from src.models.adq_labels import AdqLabels
+from src.models.data_labels import DataLabels, create_attrs_object
+from src.models.label_journal import LabelJournal
+
+logger = get_logger(__name__)
+
+"""
+.. module:: columnar_labels
+   :synopsis: a columnar (NumPy-backed) store of DataLabels
+   All the objects of a label file are kept in contiguous arrays instead of DataLabels.Object instances:
+        image_index     int32       index of the image the object belongs to
+        label_ids       int32       index into labels
+        type_ids        int16       index into types
+        bboxes          float32     (N, 4) xtl, ytl, xbr, ybr (nan if the object has no points)
+        point_offsets   int64       (N + 1) offsets into coords
+        point_dims      int8        the number of values per point (2: x, y 3: x, y, r 4: a box)
+        point_flags     int8        POINTS_NONE if the points are null, POINTS_INT if all the values are ints
+        coords          float64     flat coordinate buffer of all the points
+        error_ids       int16       index into error_codes (-1 if there is no verification result)
+
+    The points that the columns cannot give back as they are (points of different lengths, ints mixed with floats,
+    values that are not numbers) are kept as they are in irregular_points; the columns then keep only what
+    the bounding rectangles need, so that to_data_labels() reproduces the label file exactly.
+
+    Image and Object are light-weight views over the columns so that the existing callers
+    that walk data_labels.images[i].objects[j] keep working without materializing the whole file.
+    The views are read-only. Use to_data_labels() to get an editable DataLabels.
+"""
+
+NO_ERROR_ID = -1
+POINTS_NONE = 1
+POINTS_INT = 2
+
+
+class _LazySequence(Sequence):
+    """A read-only sequence that creates the element views on access"""
+    def __init__(self, count: int, factory):
+        self._count = count
+        self._factory = factory
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._factory(i) for i in range(*index.indices(self._count))]
+
+        if index < 0:
+            index += self._count
+        if index < 0 or index >= self._count:
+            raise IndexError(index)
+        return self._factory(index)
+
+
+def _flatten_points(points) -> (int, int, list, bool):
+    """
+    :param points: points of an object, e.g., [[x, y], ...], [[x, y, r], ...] or [[xtl, ytl, xbr, ybr]]
+    :return: (the number of values per point, point flags, flat values, True if the points can be rebuilt
+        from them as they are); only x and y are kept of the points of different lengths
+        and nothing of the points that are not numbers
+    """
+    if points is None:
+        return 0, POINTS_NONE, [], True
+
+    try:
+        dim = len(points[0]) if points else 0
+        is_regular = all(len(point) == dim for point in points)
+        if not is_regular:
+            if any(len(point) < 2 for point in points):
+                return 0, 0, [], False
+            dim = 2
+        values = [value for point in points for value in point[:dim]]
+    except (TypeError, KeyError, IndexError):
+        return 0, 0, [], False
+
+    value_types = set(map(type, values))
+    if not value_types <= {int, float}:
+        return 0, 0, [], False
+    flags = POINTS_INT if value_types == {int} else 0
+    is_exact = is_regular and len(value_types) <= 1 and (dim > 0 or not points)
+    return dim, flags, values, is_exact
+
+
+def _index_of(value, values: list, index_dict: dict) -> int:
+    index = index_dict.get(value)
+    if index is None:
+        index = len(values)
+        index_dict[value] = index
+        values.append(value)
+    return index
+
+
+@attr.s(slots=True, frozen=False)
+class ColumnarDataLabels:
+    twconverted = attr.ib(default=None)
+    mode = attr.ib(default="annotation")
+    template_version = attr.ib(default="0.1")
+
+    # image columns
+    image_ids = attr.ib(factory=list)
+    image_names = attr.ib(factory=list)
+    image_widths = attr.ib(factory=lambda: np.zeros(0, dtype=np.int32))
+    image_heights = attr.ib(factory=lambda: np.zeros(0, dtype=np.int32))
+    # objects of image i are object_offsets[i]:object_offsets[i + 1]
+    object_offsets = attr.ib(factory=lambda: np.zeros(1, dtype=np.int64))
+
+    # object columns
+    image_index = attr.ib(factory=lambda: np.zeros(0, dtype=np.int32))
+    labels = attr.ib(factory=list)
+    label_ids = attr.ib(factory=lambda: np.zeros(0, dtype=np.int32))
+    types = attr.ib(factory=list)
+    type_ids = attr.ib(factory=lambda: np.zeros(0, dtype=np.int16))
+    bboxes = attr.ib(factory=lambda: np.zeros((0, 4), dtype=np.float32))
+    point_offsets = attr.ib(factory=lambda: np.zeros(1, dtype=np.int64))
+    point_dims = attr.ib(factory=lambda: np.zeros(0, dtype=np.int8))
+    point_flags = attr.ib(factory=lambda: np.zeros(0, dtype=np.int8))
+    coords = attr.ib(factory=lambda: np.zeros(0, dtype=np.float64))
+    error_codes = attr.ib(factory=list)
+    error_ids = attr.ib(factory=lambda: np.zeros(0, dtype=np.int16))
+
+    # sparse per-object python values: attributes are free-form and verification results carry comments
+    attributes = attr.ib(factory=list)
+    verification_results = attr.ib(factory=dict)
+    irregular_points = attr.ib(factory=dict)
+
+    @property
+    def images(self) -> Sequence:
+        return _LazySequence(len(self.image_names), lambda index: ColumnarDataLabels.Image(self, index))
+
+    @property
+    def object_count(self) -> int:
+        return len(self.label_ids)
+
+    def to_json(self):
+        return {
+            "twconverted": self.twconverted,
+            "mode": self.mode,
+            "template_version": self.template_version,
+            "images": list(self.images)
+        }
+
+    def to_data_labels(self, validate=True) -> DataLabels:
+        """
+        :param validate: validate every object; the columns are built from validated or saved labels
+        :return: an editable DataLabels with all the objects materialized
+        """
+        return create_attrs_object(
+            DataLabels, validate,
+            twconverted=self.twconverted,
+            mode=self.mode,
+            template_version=self.template_version,
+            images=[image.to_data_labels_image(validate) for image in self.images]
+        )
+
+    def save(self, filename: str):
+        self.to_data_labels().save(filename)
+
+    def get_class_labels(self):
+        """
+        :return: all class labels
+        """
+        return {self.labels[label_id] for label_id in np.unique(self.label_ids)}
+
+    def get_class_label_counts(self) -> dict:
+        """
+        :return: key=class label value=the number of objects
+        """
+        counts = np.bincount(self.label_ids, minlength=len(self.labels))
+        return {label: int(count) for label, count in zip(self.labels, counts) if count > 0}
+
+    def get_error_counts(self) -> dict:
+        """
+        :return: key=error code value=the number of objects
+        """
+        error_ids = self.error_ids[self.error_ids != NO_ERROR_ID]
+        counts = np.bincount(error_ids, minlength=len(self.error_codes))
+        return {error_code: int(count) for error_code, count in zip(self.error_codes, counts) if count > 0}
+
+    def get_verification_result_sum(self) -> int:
+        return int(np.count_nonzero(self.error_ids != NO_ERROR_ID))
+
+    def get_bounding_rectangles(self, image_index: int = None) -> np.ndarray:
+        """
+        :param image_index: if given, only the objects of the image are returned
+        :return: (N, 4) xtl, ytl, xbr, ybr of all objects; rows of objects without points are nan
+        """
+        if image_index is None:
+            return self.bboxes
+
+        start, end = self.object_offsets[image_index], self.object_offsets[image_index + 1]
+        return self.bboxes[start:end]
+
+    def get_points(self, object_index: int) -> list:
+        """
+        :return: the points of the object as they are in the label file
+        """
+        points = self.irregular_points.get(object_index)
+        if points is not None:
+            return copy.deepcopy(points)
+
+        flags = int(self.point_flags[object_index])
+        if flags & POINTS_NONE:
+            return None
+        start, end = self.point_offsets[object_index], self.point_offsets[object_index + 1]
+        if start == end:
+            return []
+
+        dim = int(self.point_dims[object_index])
+        values = self.coords[start:end]
+        if flags & POINTS_INT:
+            values = values.astype(np.int64)
+        return values.reshape(-1, dim).tolist()
+
+    def _compute_bboxes(self):
+        """
+        compute bounding rectangles of all objects in one go.
+        boxes keep their own coordinates; the rest take min/max of the truncated x and y values
+        the same way as DataLabels.Object.get_bounding_rectangle does.
+        """
+        count = len(self.label_ids)
+        bboxes = np.full((count, 4), np.nan, dtype=np.float32)
+        if count == 0:
+            self.bboxes = bboxes
+            return
+
+        dims = self.point_dims.astype(np.int64)
+        starts = self.point_offsets[:-1]
+        lengths = self.point_offsets[1:] - starts
+        n_points = np.floor_divide(lengths, dims, out=np.zeros_like(lengths), where=dims > 0)
+
+        box_type_id = self.types.index('box') if 'box' in self.types else -1
+        is_box = (self.type_ids == box_type_id) & (lengths >= 4)
+        box_starts = starts[is_box]
+        bboxes[is_box] = self.coords[box_starts[:, None] + np.arange(4)]
+
+        is_shape = ~is_box & (self.type_ids != box_type_id) & (n_points > 0) & (dims >= 2)
+        shape_indices = np.flatnonzero(is_shape)
+        if len(shape_indices) > 0:
+            shape_n_points = n_points[shape_indices]
+            segment_starts = np.concatenate(([0], np.cumsum(shape_n_points)[:-1]))
+            point_rank = np.arange(shape_n_points.sum()) - np.repeat(segment_starts, shape_n_points)
+            point_positions = (np.repeat(starts[shape_indices], shape_n_points) +
+                               point_rank * np.repeat(dims[shape_indices], shape_n_points))
+
+            xs = np.trunc(self.coords[point_positions])
+            ys = np.trunc(self.coords[point_positions + 1])
+            bboxes[shape_indices, 0] = np.minimum.reduceat(xs, segment_starts)
+            bboxes[shape_indices, 1] = np.minimum.reduceat(ys, segment_starts)
+            bboxes[shape_indices, 2] = np.maximum.reduceat(xs, segment_starts)
+            bboxes[shape_indices, 3] = np.maximum.reduceat(ys, segment_starts)
+
+        self.bboxes = bboxes
+
+    @staticmethod
+    def from_json(json_dict):
+        """
+        build the columns straight from a DataLabels json dictionary without creating DataLabels objects
+        :param json_dict: DataLabels json dictionary
+        :return: ColumnarDataLabels
+        """
+        columnar_labels = ColumnarDataLabels(twconverted=json_dict['twconverted'],
+                                             mode=json_dict['mode'],
+                                             template_version=json_dict['template_version'])
+        label_dict, type_dict, error_dict = {}, {}, {}
+        object_offsets = [0]
+        image_widths, image_heights = [], []
+        image_index, label_ids, type_ids, error_ids = [], [], [], []
+        point_offsets, point_dims, point_flags, coords = [0], [], [], []
+
+        for idx, json_image in enumerate(json_dict['images']):
+            columnar_labels.image_ids.append(json_image['image_id'])
+            columnar_labels.image_names.append(json_image['name'])
+            image_widths.append(json_image['width'])
+            image_heights.append(json_image['height'])
+
+            for json_obj in json_image['objects']:
+                object_index = len(label_ids)
+                image_index.append(idx)
+                label_ids.append(_index_of(json_obj['label'], columnar_labels.labels, label_dict))
+                type_ids.append(_index_of(json_obj['type'], columnar_labels.types, type_dict))
+
+                points = json_obj.get('points')
+                dim, flags, values, is_exact = _flatten_points(points)
+                if not is_exact:
+                    columnar_labels.irregular_points[object_index] = copy.deepcopy(points)
+                coords.extend(values)
+                point_dims.append(dim)
+                point_flags.append(flags)
+                point_offsets.append(len(coords))
+
+                columnar_labels.attributes.append(json_obj.get('attributes'))
+                verification_result = json_obj.get('verification_result')
+                if verification_result is not None:
+                    # kept even if it is empty so that the object is written back as it is
+                    columnar_labels.verification_results[object_index] = verification_result
+                if verification_result:
+                    error_ids.append(_index_of(verification_result.get('error_code', ""),
+                                               columnar_labels.error_codes, error_dict))
+                else:
+                    error_ids.append(NO_ERROR_ID)
+
+            object_offsets.append(len(label_ids))
+
+        columnar_labels.image_widths = np.asarray(image_widths, dtype=np.int32)
+        columnar_labels.image_heights = np.asarray(image_heights, dtype=np.int32)
+        columnar_labels.object_offsets = np.asarray(object_offsets, dtype=np.int64)
+        columnar_labels.image_index = np.asarray(image_index, dtype=np.int32)
+        columnar_labels.label_ids = np.asarray(label_ids, dtype=np.int32)
+        columnar_labels.type_ids = np.asarray(type_ids, dtype=np.int16)
+        columnar_labels.error_ids = np.asarray(error_ids, dtype=np.int16)
+        columnar_labels.point_offsets = np.asarray(point_offsets, dtype=np.int64)
+        columnar_labels.point_dims = np.asarray(point_dims, dtype=np.int8)
+        columnar_labels.point_flags = np.asarray(point_flags, dtype=np.int8)
+        columnar_labels.coords = np.asarray(coords, dtype=np.float64)
+        columnar_labels._compute_bboxes()
+
+        return columnar_labels
+
+    @staticmethod
+    def from_data_labels(data_labels: DataLabels):
+        json_dict = data_labels.to_json()
+        json_dict['images'] = [dict(image.to_json(), objects=[obj.to_json() for obj in image.objects])
+                               for image in data_labels.images]
+        return ColumnarDataLabels.from_json(json_dict)
+
+    @staticmethod
+    def load(filename: str) -> 'ColumnarDataLabels':
+        """
+        :param filename: label filename
+        :return: ColumnarDataLabels object
+        """
+        # label_sidecar depends on this module
+        from src.models.label_sidecar import load_sidecar, save_sidecar
+
+        columnar_labels = load_sidecar(filename)
+        if columnar_labels is not None:
+            entries, _ = LabelJournal(filename).read_entries()
+            if not entries:
+                return columnar_labels
+            data_labels = columnar_labels.to_data_labels()
+            LabelJournal.apply_entries(data_labels.images, entries, DataLabels.Image.from_json)
+            return ColumnarDataLabels.from_data_labels(data_labels)
+
+        json_labels = utils.from_file(filename)
+        if json_labels:
+            entries, _ = LabelJournal(filename).read_entries()
+            if json_labels.get('images') and type(json_labels.get('images')[0]['height']) == int:
+                if not entries:
+                    # create the missing sidecar of a converted label file for the next time
+                    columnar_labels = ColumnarDataLabels.from_json(json_labels)
+                    try:
+                        save_sidecar(filename, columnar_labels)
+                    except OSError as e:
+                        logger.warning(f"Cannot save the sidecar of {filename}: {str(e)}")
+                    return columnar_labels
+                LabelJournal.apply_entries(json_labels['images'], entries)
+                return ColumnarDataLabels.from_json(json_labels)
+            else:
+                data_labels = DataLabels.from_adq_labels(AdqLabels.from_json(json_labels))
+                LabelJournal.apply_entries(data_labels.images, entries, DataLabels.Image.from_json)
+                return ColumnarDataLabels.from_data_labels(data_labels)
+        else:
+            logger.error("label file {} does not exist!".format(filename))
+
+    @staticmethod
+    def iter_load(label_files_dict: dict):
+        """
+        load label files one at a time so that only one of them is in memory
+        :param label_files_dict: label files with key=folder value=label filename
+        :return: a generator of (label filename, ColumnarDataLabels)
+        """
+        if label_files_dict and len(label_files_dict.items()) > 0:
+            for folder, label_files in label_files_dict.items():
+                for label_file in label_files:
+                    yield label_file, ColumnarDataLabels.load(os.path.join(folder, label_file))
+
+    @staticmethod
+    def load_from_dict(label_files_dict: dict) -> dict:
+        """
+        :param label_files_dict: label files with key=folder value=label filename
+        :return: a dictionary with key=label filename value=ColumnarDataLabels
+        """
+        return dict(ColumnarDataLabels.iter_load(label_files_dict))
+
+    @attr.s(slots=True, frozen=True)
+    class Image:
+        """A read-only view of an image in ColumnarDataLabels"""
+        store = attr.ib()
+        index = attr.ib()
+
+        @property
+        def image_id(self) -> str:
+            return self.store.image_ids[self.index]
+
+        @property
+        def name(self) -> str:
+            return self.store.image_names[self.index]
+
+        @property
+        def width(self) -> int:
+            return int(self.store.image_widths[self.index])
+
+        @property
+        def height(self) -> int:
+            return int(self.store.image_heights[self.index])
+
+        @property
+        def object_range(self) -> (int, int):
+            return int(self.store.object_offsets[self.index]), int(self.store.object_offsets[self.index + 1])
+
+        @property
+        def objects(self) -> Sequence:
+            start, end = self.object_range
+            return _LazySequence(end - start, lambda index: ColumnarDataLabels.Object(self.store, start + index))
+
+        def to_json(self):
+            return {
+                "image_id": self.image_id,
+                "name": self.name,
+                "width": self.width,
+                "height": self.height,
+                "objects": list(self.objects)
+            }
+
+        def to_data_labels_image(self, validate=True) -> DataLabels.Image:
+            """
+            :param validate: validate every object
+            :return: an editable DataLabels.Image of this image only
+            """
+            return create_attrs_object(
+                DataLabels.Image, validate,
+                image_id=self.image_id,
+                name=self.name,
+                width=self.width,
+                height=self.height,
+                objects=[create_attrs_object(DataLabels.Object, validate,
+                                             label=obj.label,
+                                             type=obj.type,
+                                             points=obj.points,
+                                             attributes=obj.attributes,
+                                             verification_result=obj.verification_result)
+                         for obj in self.objects])
+
+        def get_class_labels(self):
+            start, end = self.object_range
+            return {self.store.labels[label_id] for label_id in np.unique(self.store.label_ids[start:end])}
+
+        def get_class_label_stats(self):
+            start, end = self.object_range
+            label_ids, counts = np.unique(self.store.label_ids[start:end], return_counts=True)
+            return {self.store.labels[label_id]: int(count) for label_id, count in zip(label_ids, counts)}
+
+    @attr.s(slots=True, frozen=True)
+    class Object:
+        """A read-only view of an object in ColumnarDataLabels"""
+        store = attr.ib()
+        index = attr.ib()
+
+        @property
+        def label(self) -> str:
+            return self.store.labels[self.store.label_ids[self.index]]
+
+        @property
+        def type(self) -> str:
+            return self.store.types[self.store.type_ids[self.index]]
+
+        @property
+        def points(self) -> list:
+            return self.store.get_points(self.index)
+
+        @property
+        def attributes(self):
+            return self.store.attributes[self.index]
+
+        @property
+        def verification_result(self):
+            return self.store.verification_results.get(self.index)
+
+        def to_json(self):
+            return {
+                "label": self.label,
+                "type": self.type,
+                "points": self.points,
+                "attributes": self.attributes,
+                "verification_result": self.verification_result,
+            }
+
+        @staticmethod
+        def get_bounding_rectangle(label_object) -> list:
+            """
+            get the rectangle of the object from the bounding rectangle column
+            :param label_object: ColumnarDataLabels.Object or DataLabels.Object
+            :return: xtl,ytl, xbr,ybr
+            """
+            if not isinstance(label_object, ColumnarDataLabels.Object):
+                return DataLabels.Object.get_bounding_rectangle(label_object)
+
+            bbox = label_object.store.bboxes[label_object.index]
+            if np.isnan(bbox[0]):
+                return None
+            if label_object.type == 'box':
+                return label_object.points[0]
+            return [int(value) for value in bbox]
@@ -1,16 +1,34 @@
-import json
 import math
 import os
 
 import attr
 
 import src.common.utils as utils
+from src.common import json_codec
 from src.common.logger import get_logger
 from src.models.adq_labels import AdqLabels
+from src.models.label_journal import COMPACT_JOURNAL_SIZE, LabelJournal
 
 logger = get_logger(__name__)
 
 
+def create_attrs_object(cls, validate: bool = True, **values):
+    """
+    create an attrs object, optionally without running its validators (e.g., for a label file written by
+    DataLabels.save). unlike attr.validators.disabled(), it leaves the validation of the other threads on.
+    :param cls: attrs class
+    :param validate: run the validators
+    :param values: all the attributes of the object
+    :return: cls object
+    """
+    if validate:
+        return cls(**values)
+    obj = cls.__new__(cls)
+    for name, value in values.items():
+        object.__setattr__(obj, name, value)
+    return obj
+
+
 @attr.s(slots=True, frozen=False)
 class DataLabels:
     twconverted = attr.ib(default=None, validator=attr.validators.instance_of(str))
@@ -27,8 +45,94 @@ class DataLabels:
         }
 
     def save(self, filename: str):
-        json_data = json.dumps(self.to_json(), default=utils.default, ensure_ascii=False, indent=2)
-        utils.to_file(json_data, filename)
+        """
+        :param filename: label filename; the json is written compact
+        """
+        utils.to_file(json_codec.dumps(self), filename)
+        # the whole file is up-to-date now
+        LabelJournal(filename).clear()
+        DataLabels.save_sidecar(filename, self)
+
+    @staticmethod
+    def save_encoded_images(filename: str, header: dict, encoded_images):
+        """
+        write a label file from the images that are already encoded one by one (e.g., by worker processes)
+        without holding all of them in memory
+        :param filename: label filename
+        :param header: twconverted, mode and template_version
+        :param encoded_images: iterable of DataLabels.Image json bytes in order
+        """
+        json_header = json_codec.dumps({
+            "twconverted": header.get('twconverted'),
+            "mode": header.get('mode'),
+            "template_version": header.get('template_version'),
+            "images": []
+        })
+        # drop the closing "[]}" to append the images
+        json_header = json_header[:json_header.rindex(b"[")]
+
+        with open(filename + ".tmp", 'wb') as json_file:
+            json_file.write(json_header + b"[")
+            for idx, encoded_image in enumerate(encoded_images):
+                if idx > 0:
+                    json_file.write(b",")
+                json_file.write(encoded_image)
+            json_file.write(b"]}")
+        os.replace(filename + ".tmp", filename)
+        LabelJournal(filename).clear()
+
+    @staticmethod
+    def save_sidecar(filename: str, data_labels: 'DataLabels'):
+        """
+        regenerate the binary sidecar of the label file; the label file must be saved first
+        :param filename: label filename
+        :param data_labels: the labels saved in the label file
+        """
+        # columnar_labels depends on this module
+        from src.models.columnar_labels import ColumnarDataLabels
+        from src.models.label_sidecar import remove_sidecar, save_sidecar
+
+        try:
+            save_sidecar(filename, ColumnarDataLabels.from_data_labels(data_labels))
+        except Exception as e:
+            logger.warning(f"Cannot save the sidecar of {filename}: {str(e)}")
+            remove_sidecar(filename)
+
+    @staticmethod
+    def save_image_to_journal(filename: str, image_index: int, image_to_save: 'DataLabels.Image'):
+        """
+        append only the edited image to the journal of the label file instead of rewriting the whole file.
+        the journal is compacted into the label file in the background once it grows big enough.
+        :param filename: label filename
+        :param image_index: index of the image
+        :param image_to_save: edited image
+        """
+        journal = LabelJournal(filename)
+        journal.append(image_index, image_to_save)
+        if journal.get_size() > COMPACT_JOURNAL_SIZE:
+            journal.compact_in_background(lambda: DataLabels.compact_journal(filename))
+
+    @staticmethod
+    def compact_journal(filename: str):
+        """
+        apply the journal to the label file and drop the compacted entries
+        :param filename: label filename
+        """
+        journal = LabelJournal(filename)
+        entries, consumed_size = journal.read_entries()
+        if not entries:
+            return
+
+        # the label file is rewritten from the json itself, never from its cache
+        data_labels = DataLabels.load(filename, replay_journal=False, use_sidecar=False)
+        LabelJournal.apply_entries(data_labels.images, entries, DataLabels.Image.from_json)
+
+        # write to a temporary file first so that readers never see a partially written label file
+        utils.to_file(json_codec.dumps(data_labels), filename + ".tmp")
+        os.replace(filename + ".tmp", filename)
+        journal.truncate(consumed_size)
+        DataLabels.save_sidecar(filename, data_labels)
+        logger.info(f"compacted {len(entries)} journal entries into {filename}")
 
     def save_image(self, image_to_save: 'DataLabels.Image'):
         for idx, image in enumerate(self.images):
@@ -50,19 +154,21 @@ class DataLabels:
     def get_verification_result_sum(self):
         verification_result_sum = 0
         for image in self.images:
-            for obj in image.objects:
-                verification_result = obj.verification_result
-                if verification_result:
-                    verification_result_sum += 1
+            verification_result_sum += image.get_verification_result_sum()
         return verification_result_sum
 
     @staticmethod
-    def from_json(json_dict):
-        return DataLabels(
+    def from_json(json_dict, validate=True):
+        """
+        :param json_dict: DataLabels json dictionary
+        :param validate: validate every object; skipped for the label files written by DataLabels.save
+        """
+        return create_attrs_object(
+            DataLabels, validate,
             twconverted=json_dict['twconverted'],
             mode=json_dict['mode'],
             template_version=json_dict['template_version'],
-            images=[DataLabels.Image.from_json(json_image) for json_image in json_dict['images']]
+            images=[DataLabels.Image.from_json(json_image, validate) for json_image in json_dict['images']]
         )
 
     @staticmethod
@@ -75,21 +181,36 @@ class DataLabels:
         )
 
     @staticmethod
-    def load(filename: str) -> 'DataLabels':
+    def load(filename: str, replay_journal=True, use_sidecar=True) -> 'DataLabels':
         """
         :param filename: label filename
+        :param replay_journal: apply the edits in the journal that are not compacted yet
+        :param use_sidecar: read the up-to-date sidecar instead of parsing the json
         :return: DartLabels object
         """
-        json_labels = utils.from_file(filename)
+        # columnar_labels depends on this module
+        from src.models.label_sidecar import load_sidecar
+
+        # an up-to-date sidecar saves parsing the whole json
+        columnar_labels = load_sidecar(filename) if use_sidecar else None
+        json_labels = utils.from_file(filename) if columnar_labels is None else None
         # check if it is already in DartLabels format
         # TODO: find a better way of checking the format
-        if json_labels:
-            if json_labels.get('images') and type(json_labels.get('images')[0]['height']) == int:
-                return DataLabels.from_json(json_labels)
+        if columnar_labels is not None or json_labels:
+            if columnar_labels is not None:
+                data_labels = columnar_labels.to_data_labels(validate=False)
+            elif json_labels.get('images') and type(json_labels.get('images')[0]['height']) == int:
+                # the label file was written by DataLabels.save: skip validating every object
+                data_labels = DataLabels.from_json(json_labels, validate=False)
             else:
                 adq_labels = AdqLabels.from_json(json_labels)
                 # convert to dart label format for easier processing
-                return DataLabels.from_adq_labels(adq_labels)
+                data_labels = DataLabels.from_adq_labels(adq_labels)
+
+            if replay_journal:
+                entries, _ = LabelJournal(filename).read_entries()
+                LabelJournal.apply_entries(data_labels.images, entries, DataLabels.Image.from_json)
+            return data_labels
         else:
             logger.error("label file {} does not exist!".format(filename))
 
@@ -140,6 +261,9 @@ class DataLabels:
                 class_labels.add(obj.label)
             return class_labels
 
+        def get_verification_result_sum(self):
+            return sum(1 for obj in self.objects if obj.verification_result)
+
 
         def get_class_label_stats(self):
             class_labels = dict()
@@ -152,13 +276,14 @@ class DataLabels:
             return class_labels
 
         @staticmethod
-        def from_json(json_dict):
-            return DataLabels.Image(
+        def from_json(json_dict, validate=True):
+            return create_attrs_object(
+                DataLabels.Image, validate,
                 image_id=json_dict['image_id'],
                 name=json_dict['name'],
                 width=json_dict['width'],
                 height=json_dict['height'],
-                objects=[DataLabels.Object.from_json(json_obj) for json_obj in json_dict['objects']]
+                objects=[DataLabels.Object.from_json(json_obj, validate) for json_obj in json_dict['objects']]
             )
 
         @staticmethod
@@ -214,13 +339,14 @@ class DataLabels:
             }
 
         @staticmethod
-        def from_json(json_dict):
-            return DataLabels.Object(label=json_dict['label'],
-                                     type=json_dict['type'],
-                                     points=json_dict.get('points', None),
-                                     attributes=json_dict.get('attributes', None),
-                                     verification_result=json_dict.get('verification_result', None)
-                                     )
+        def from_json(json_dict, validate=True):
+            return create_attrs_object(DataLabels.Object, validate,
+                                       label=json_dict['label'],
+                                       type=json_dict['type'],
+                                       points=json_dict.get('points', None),
+                                       attributes=json_dict.get('attributes', None),
+                                       verification_result=json_dict.get('verification_result', None)
+                                       )
 
         @staticmethod
         def from_adq_object(adq_object: AdqLabels.Object):
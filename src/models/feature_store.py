@@ -0,0 +1,249 @@
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+import cv2
+import numpy as np
+
+from src.common import json_codec
+from src.common.logger import get_logger
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = get_logger(__name__)
+
+"""
+.. module:: feature_store
+   :synopsis: compact feature vectors of the images of a project in a memory-mapped matrix
+   Every image is reduced to a float32 vector of FEATURE_DIM values (see compute_image_features):
+        RGB histogram           4x4x4 bins, square-rooted so that the block has a unit norm
+        luma                    8x8 downsampled luma, scaled so that the block has a norm of at most 1
+        gradient orientations   8 bins in 2x2 cells weighted by the gradient magnitude, with a unit norm
+   The vectors are appended to <project>/features/<store name>.f32, a raw row-major matrix that is
+   memory-mapped, and the rows are indexed in <project>/features/<store name>.json:
+        {"version": "1", "dim": 160, "row_count": ..., "rows": {"a.jpg": [row, mtime_ns, size], ...}}
+   Only the new or changed images are decoded, across a process pool, and the rows are written in batches,
+   so that the memory does not grow with the number of images.
+   The rows of the removed or changed images are dropped when they take more than half of the matrix.
+   The updates of a store are serialized by a lock per store within the process and by an flock on
+   <store name>.lock across the processes, and the index is read again under the lock, so that
+   two sessions updating the same store never truncate the rows of each other.
+"""
+
+FEATURES_FOLDER = "features"
+FEATURES_VERSION = "1"
+FEATURE_IMAGE_SIZE = 32
+HISTOGRAM_BINS = 4
+LUMA_SIZE = 8
+ORIENTATION_BINS = 8
+ORIENTATION_CELLS = 2
+FEATURE_DIM = HISTOGRAM_BINS ** 3 + LUMA_SIZE ** 2 + ORIENTATION_BINS * ORIENTATION_CELLS ** 2
+WRITE_BATCH_SIZE = 1024
+PARALLEL_MIN_FILES = 64
+PARALLEL_CHUNK_SIZE = 64
+
+_locks = dict()
+_locks_lock = threading.Lock()
+
+
+def _get_lock(matrix_filename: str) -> threading.Lock:
+    with _locks_lock:
+        return _locks.setdefault(os.path.abspath(matrix_filename), threading.Lock())
+
+
+def compute_image_features(img: np.ndarray) -> np.ndarray:
+    """
+    :param img: RGB image
+    :return: float32 feature vector of FEATURE_DIM values
+    """
+    img = cv2.resize(img, (FEATURE_IMAGE_SIZE, FEATURE_IMAGE_SIZE), interpolation=cv2.INTER_AREA)
+
+    histogram = cv2.calcHist([img], [0, 1, 2], None, [HISTOGRAM_BINS] * 3, [0, 256] * 3).reshape(-1)
+    histogram = np.sqrt(histogram / max(histogram.sum(), 1))
+
+    gray = cv2.cvtColor(img, cv2.COLOR_RGB2GRAY).astype(np.float32) / 255
+    luma = cv2.resize(gray, (LUMA_SIZE, LUMA_SIZE), interpolation=cv2.INTER_AREA).reshape(-1) / LUMA_SIZE
+
+    magnitude, angle = cv2.cartToPolar(cv2.Sobel(gray, cv2.CV_32F, 1, 0), cv2.Sobel(gray, cv2.CV_32F, 0, 1))
+    # unsigned orientations
+    orientation_bins = (angle % np.pi / np.pi * ORIENTATION_BINS).astype(np.int32) % ORIENTATION_BINS
+    cell_size = FEATURE_IMAGE_SIZE // ORIENTATION_CELLS
+    orientations = []
+    for y in range(0, FEATURE_IMAGE_SIZE, cell_size):
+        for x in range(0, FEATURE_IMAGE_SIZE, cell_size):
+            orientations.append(np.bincount(orientation_bins[y:y + cell_size, x:x + cell_size].reshape(-1),
+                                            weights=magnitude[y:y + cell_size, x:x + cell_size].reshape(-1),
+                                            minlength=ORIENTATION_BINS))
+    orientations = np.concatenate(orientations)
+    orientations /= max(np.linalg.norm(orientations), 1e-6)
+
+    return np.concatenate([histogram, luma, orientations]).astype(np.float32)
+
+
+def _compute_file_features(image_path: str) -> np.ndarray:
+    try:
+        img = cv2.imread(image_path, cv2.IMREAD_COLOR)
+        if img is None:
+            logger.error(f"Cannot read {os.path.basename(image_path)}")
+            return None
+        return compute_image_features(cv2.cvtColor(img, cv2.COLOR_BGR2RGB))
+    except Exception as e:
+        logger.error(f"Error computing the features of {os.path.basename(image_path)}: {str(e)}")
+        return None
+
+
+class FeatureStore:
+    def __init__(self, project_folder: str, name: str = "images"):
+        """
+        :param project_folder: ADQ_WORKING_FOLDER/<project>
+        :param name: name of the store, e.g., a store per image folder
+        """
+        self.features_folder = os.path.join(project_folder, FEATURES_FOLDER)
+        self.matrix_filename = os.path.join(self.features_folder, f"{name}.f32")
+        self.index_filename = os.path.join(self.features_folder, f"{name}.json")
+        self.lock_filename = os.path.join(self.features_folder, f"{name}.lock")
+        self.row_count = 0
+        # image name -> [row, mtime_ns, size]
+        self.rows = dict()
+        self._load_index()
+
+    @contextmanager
+    def _lock(self):
+        """
+        serialize the updates of the store across the threads and the processes
+        """
+        with _get_lock(self.matrix_filename):
+            os.makedirs(self.features_folder, exist_ok=True)
+            with open(self.lock_filename, 'a') as lock_file:
+                if fcntl:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    if fcntl:
+                        fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _load_index(self):
+        self.row_count = 0
+        self.rows = dict()
+        if not os.path.exists(self.index_filename):
+            return
+        try:
+            index = json_codec.load_file(self.index_filename)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Cannot read {self.index_filename}: {str(e)}")
+            return
+        if index.get('version') == FEATURES_VERSION and index.get('dim') == FEATURE_DIM:
+            self.row_count = index['row_count']
+            self.rows = index['rows']
+
+    def _save_index(self):
+        index = {"version": FEATURES_VERSION, "dim": FEATURE_DIM, "row_count": self.row_count, "rows": self.rows}
+        json_codec.dump_file(index, self.index_filename + ".tmp")
+        os.replace(self.index_filename + ".tmp", self.index_filename)
+
+    def get_model_filename(self, model_name: str) -> str:
+        """
+        :return: filename of a model fitted on the features of the store
+        """
+        return os.path.splitext(self.matrix_filename)[0] + f".{model_name}.joblib"
+
+    @property
+    def features(self) -> np.ndarray:
+        """
+        :return: read-only memory-mapped matrix of row_count x FEATURE_DIM
+        """
+        if self.row_count == 0:
+            return np.empty((0, FEATURE_DIM), dtype=np.float32)
+        return np.memmap(self.matrix_filename, dtype=np.float32, mode='r', shape=(self.row_count, FEATURE_DIM))
+
+    def _append(self, image_keys: dict, image_paths: list, max_workers: int = None):
+        os.makedirs(self.features_folder, exist_ok=True)
+        if len(image_paths) < PARALLEL_MIN_FILES or max_workers == 1:
+            executor = None
+            results = map(_compute_file_features, image_paths)
+        else:
+            executor = ProcessPoolExecutor(max_workers=max_workers)
+            results = executor.map(_compute_file_features, image_paths, chunksize=PARALLEL_CHUNK_SIZE)
+
+        try:
+            with open(self.matrix_filename, 'ab') as matrix_file:
+                # drop the rows written after the index was last saved
+                matrix_file.truncate(self.row_count * FEATURE_DIM * 4)
+                batch = []
+                for image_path, features in zip(image_paths, results):
+                    if features is None:
+                        continue
+                    self.rows[os.path.basename(image_path)] = [self.row_count + len(batch)] + \
+                        list(image_keys[image_path])
+                    batch.append(features)
+                    if len(batch) == WRITE_BATCH_SIZE:
+                        matrix_file.write(np.stack(batch).tobytes())
+                        self.row_count += len(batch)
+                        batch = []
+                if batch:
+                    matrix_file.write(np.stack(batch).tobytes())
+                    self.row_count += len(batch)
+        finally:
+            if executor:
+                executor.shutdown()
+
+    def _compact(self):
+        """
+        rewrite the matrix with only the rows in use
+        """
+        features = self.features
+        names = sorted(self.rows, key=lambda name: self.rows[name][0])
+        with open(self.matrix_filename + ".tmp", 'wb') as matrix_file:
+            for start in range(0, len(names), WRITE_BATCH_SIZE):
+                batch_names = names[start:start + WRITE_BATCH_SIZE]
+                batch_rows = [self.rows[name][0] for name in batch_names]
+                matrix_file.write(np.ascontiguousarray(features[batch_rows]).tobytes())
+        del features
+        os.replace(self.matrix_filename + ".tmp", self.matrix_filename)
+        for row, name in enumerate(names):
+            self.rows[name][0] = row
+        logger.info(f"Compacted {self.matrix_filename} from {self.row_count} to {len(names)} rows")
+        self.row_count = len(names)
+
+    def update(self, image_paths: list, max_workers: int = None) -> (list, np.ndarray):
+        """
+        compute the features of the new or changed images
+        :param image_paths: image filenames; the images are identified by their names without the folder
+        :param max_workers: the number of processes; defaults to the number of CPUs
+        :return: (the image filenames with features, their rows in features)
+        """
+        image_keys = dict()
+        for image_path in image_paths:
+            file_stat = os.stat(image_path)
+            image_keys[image_path] = (file_stat.st_mtime_ns, file_stat.st_size)
+
+        with self._lock():
+            # another session may have updated the store since the index was loaded
+            self._load_index()
+            return self._update(image_keys, image_paths, max_workers)
+
+    def _update(self, image_keys: dict, image_paths: list, max_workers: int = None) -> (list, np.ndarray):
+        new_paths = [image_path for image_path in image_paths
+                     if self.rows.get(os.path.basename(image_path), [None])[1:] != list(image_keys[image_path])]
+        if new_paths:
+            logger.info(f"Computing the features of {len(new_paths)} of {len(image_paths)} images")
+            self._append(image_keys, new_paths, max_workers)
+
+        # drop the removed images
+        names = {os.path.basename(image_path) for image_path in image_paths}
+        removed_names = [name for name in self.rows if name not in names]
+        for name in removed_names:
+            del self.rows[name]
+        if self.row_count > 2 * len(self.rows):
+            self._compact()
+        if new_paths or removed_names:
+            self._save_index()
+
+        image_paths = [image_path for image_path in image_paths if os.path.basename(image_path) in self.rows]
+        rows = np.asarray([self.rows[os.path.basename(image_path)][0] for image_path in image_paths], dtype=np.int64)
+        return image_paths, rows
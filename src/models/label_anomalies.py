@@ -0,0 +1,131 @@
+import os
+
+import numpy as np
+import pandas as pd
+from sklearn.decomposition import PCA
+from sklearn.neighbors import NearestNeighbors
+
+from src.common.logger import get_logger
+from src.models.columnar_labels import ColumnarDataLabels
+from src.models.label_crops import load_label_features
+
+logger = get_logger(__name__)
+
+"""
+.. module:: label_anomalies
+   :synopsis: anomaly scores of the label objects against the other objects of their class
+   Every object is described by the feature vector of its crop (see feature_store.compute_image_features)
+   and by its geometry relative to the image: log width, log height, log aspect ratio,
+   area ratio and the center. The geometry is standardized per class and weighted by GEOMETRY_WEIGHT.
+   Per class, the vectors are projected to ANOMALY_DIMS dimensions (randomized PCA) and indexed in a KD-tree
+   of at most ANOMALY_MAX_INDEX objects (a random sample of the larger classes).
+   The score of an object is the mean distance to its ANOMALY_NEIGHBORS nearest peers divided by
+   the median of the class, so that the scores of different classes are comparable:
+   about 1 for a typical object, higher for an object unlike the rest of its class.
+   The classes with ANOMALY_NEIGHBORS objects or fewer are not scored.
+"""
+
+ANOMALY_NEIGHBORS = 10
+ANOMALY_DIMS = 8
+ANOMALY_MAX_INDEX = 20000
+GEOMETRY_WEIGHT = 0.5
+GEOMETRY_COLUMNS = ["log_width", "log_height", "log_aspect_ratio", "area_ratio", "center_x", "center_y"]
+ANOMALY_COLUMNS = ["task_id", "label_filename", "object_index", "image_index", "image_name", "label", "score"]
+
+
+def get_geometry_features(data_labels: ColumnarDataLabels, object_indices: np.ndarray) -> np.ndarray:
+    """
+    :return: (N, len(GEOMETRY_COLUMNS)) geometry of the objects relative to their images
+    """
+    bboxes = data_labels.bboxes[object_indices].astype(np.float64)
+    image_index = data_labels.image_index[object_indices]
+    image_widths = np.maximum(data_labels.image_widths[image_index], 1).astype(np.float64)
+    image_heights = np.maximum(data_labels.image_heights[image_index], 1).astype(np.float64)
+
+    widths = np.maximum(bboxes[:, 2] - bboxes[:, 0], 1)
+    heights = np.maximum(bboxes[:, 3] - bboxes[:, 1], 1)
+    return np.stack([
+        np.log(widths),
+        np.log(heights),
+        np.log(widths / heights),
+        widths * heights / (image_widths * image_heights),
+        (bboxes[:, 0] + bboxes[:, 2]) / 2 / image_widths,
+        (bboxes[:, 1] + bboxes[:, 3]) / 2 / image_heights,
+    ], axis=1)
+
+
+def score_class(features: np.ndarray, n_neighbors: int = ANOMALY_NEIGHBORS, seed: int = 0) -> np.ndarray:
+    """
+    :param features: (N, D) vectors of the objects of a class
+    :param n_neighbors: the number of peers to compare with
+    :param seed: seed of the projection and the sampling
+    :return: (N,) scores; nan if the class has n_neighbors objects or fewer
+    """
+    count = len(features)
+    if count <= n_neighbors:
+        return np.full(count, np.nan, dtype=np.float32)
+
+    rng = np.random.default_rng(seed)
+    if features.shape[1] > ANOMALY_DIMS and count > ANOMALY_DIMS:
+        pca = PCA(n_components=ANOMALY_DIMS, svd_solver="randomized", random_state=seed)
+        # fitted on a sample so that the fit does not grow with the class
+        pca.fit(features[rng.choice(count, min(count, ANOMALY_MAX_INDEX), replace=False)])
+        features = pca.transform(features)
+
+    is_indexed = np.ones(count, dtype=bool)
+    if count > ANOMALY_MAX_INDEX:
+        is_indexed[:] = False
+        is_indexed[rng.choice(count, ANOMALY_MAX_INDEX, replace=False)] = True
+    index = NearestNeighbors(n_neighbors=n_neighbors + 1, algorithm="kd_tree", n_jobs=-1)
+    index.fit(features[is_indexed])
+
+    # the nearest neighbour of an indexed object is itself
+    distances, _ = index.kneighbors(features)
+    distances = np.where(is_indexed[:, None], distances[:, 1:], distances[:, :-1])
+    scores = distances.mean(axis=1)
+    return (scores / max(np.median(scores), 1e-6)).astype(np.float32)
+
+
+def score_label_anomalies(data_folder: str, label_files: list, cache_folder: str) -> pd.DataFrame:
+    """
+    :param data_folder: folder of the images
+    :param label_files: [(task id, label filename)]
+    :param cache_folder: folder of the feature vectors of the label files (see label_crops.load_label_features)
+    :return: the objects ranked by the score in descending order (see ANOMALY_COLUMNS)
+    """
+    class_vectors, class_rows = dict(), dict()
+    rows = []
+    for task_id, label_filename in label_files:
+        data_labels = ColumnarDataLabels.load(label_filename)
+        if not data_labels or len(data_labels.image_index) == 0:
+            continue
+
+        features, object_indices = load_label_features(data_folder, label_filename, data_labels, cache_folder)
+        geometry = get_geometry_features(data_labels, object_indices)
+        label_ids = data_labels.label_ids[object_indices]
+        for label_id in np.unique(label_ids):
+            is_label = label_ids == label_id
+            label = data_labels.labels[label_id]
+            class_vectors.setdefault(label, []).append((np.asarray(features[is_label]), geometry[is_label]))
+            class_rows.setdefault(label, []).append(len(rows) + np.flatnonzero(is_label))
+
+        image_index = data_labels.image_index[object_indices]
+        image_names = [os.path.basename(data_labels.image_names[index]) for index in image_index]
+        rows.extend(zip([task_id] * len(object_indices), [label_filename] * len(object_indices),
+                        object_indices.tolist(), image_index.tolist(), image_names,
+                        [data_labels.labels[label_id] for label_id in label_ids]))
+
+    scores = np.full(len(rows), np.nan, dtype=np.float32)
+    for label, vectors in class_vectors.items():
+        features = np.concatenate([class_features for class_features, _ in vectors])
+        geometry = np.concatenate([class_geometry for _, class_geometry in vectors])
+        # standardized and weighted so that the geometry block has a norm of about GEOMETRY_WEIGHT
+        geometry = (geometry - geometry.mean(axis=0)) / np.maximum(geometry.std(axis=0), 1e-6)
+        geometry *= GEOMETRY_WEIGHT / np.sqrt(len(GEOMETRY_COLUMNS))
+        class_features = np.hstack([features, geometry.astype(np.float32)])
+        logger.info(f"Scoring {len(class_features)} objects of {label}")
+        scores[np.concatenate(class_rows[label])] = score_class(class_features)
+
+    anomalies = pd.DataFrame(rows, columns=ANOMALY_COLUMNS[:-1])
+    anomalies["score"] = scores
+    return anomalies.sort_values("score", ascending=False, na_position="last", ignore_index=True)
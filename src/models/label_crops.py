@@ -0,0 +1,264 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from src.common import json_codec
+from src.common.logger import get_logger
+from src.models.columnar_labels import ColumnarDataLabels
+from src.models.feature_store import FEATURE_DIM, compute_image_features
+from src.models.label_journal import get_label_file_key
+
+logger = get_logger(__name__)
+
+"""
+.. module:: label_crops
+   :synopsis: the crops of the label objects, extracted in memory
+   Every source image is decoded once for all its objects, and the crops are views of the decoded image
+   (no copy into a full-size buffer) that are resized or turned into feature vectors straight into
+   a preallocated matrix. The images are decoded in CROP_MAX_WORKERS threads (OpenCV releases the GIL).
+   The crops of a label file can be kept in a crop atlas, <atlas folder>/<label filename>.crops.npy,
+   a (N, height, width, 3) uint8 matrix that is memory-mapped when it is loaded, with its index
+   <label filename>.crops.json:
+        {"version": "2", "size": [50, 50], "source_key": [...], "object_indices": [...]}
+   The atlas is used as long as the source key, the mtime and size of the label file and of its journal
+   (see label_journal.get_label_file_key), matches: a journaled review changes the objects of the label file.
+   The feature vectors of the crops are kept the same way in <label filename>.features.npy.
+"""
+
+CROP_SIZE = (50, 50)
+CROP_MAX_WORKERS = 4
+CROP_ATLAS_VERSION = "2"
+CROP_ATLAS_EXT = ".crops.npy"
+FEATURES_EXT = ".features.npy"
+
+
+def get_crop_boxes(bboxes: np.ndarray, width: int, height: int) -> (np.ndarray, np.ndarray):
+    """
+    :param bboxes: (N, 4) xtl, ytl, xbr, ybr; nan if the object has no points
+    :param width: image width
+    :param height: image height
+    :return: ((N, 4) int boxes clipped to the image, (N,) True if the box is not empty)
+    """
+    bboxes = np.nan_to_num(np.asarray(bboxes, dtype=np.float64).reshape(-1, 4), nan=-1)
+    boxes = np.empty(bboxes.shape, dtype=np.int64)
+    boxes[:, [0, 2]] = np.clip(bboxes[:, [0, 2]], 0, width).astype(np.int64)
+    boxes[:, [1, 3]] = np.clip(bboxes[:, [1, 3]], 0, height).astype(np.int64)
+    is_valid = (boxes[:, 2] > boxes[:, 0]) & (boxes[:, 3] > boxes[:, 1])
+    return boxes, is_valid
+
+
+def get_crop(img: np.ndarray, bbox) -> np.ndarray:
+    """
+    :param img: image
+    :param bbox: xtl, ytl, xbr, ybr
+    :return: view of the image in the box or None if the box is empty
+    """
+    boxes, is_valid = get_crop_boxes([bbox], img.shape[1], img.shape[0])
+    if not is_valid[0]:
+        return None
+    x, y, x_end, y_end = boxes[0]
+    return img[y:y_end, x:x_end]
+
+
+def iter_image_crops(img: np.ndarray, bboxes: np.ndarray):
+    """
+    :param img: image
+    :param bboxes: (N, 4) xtl, ytl, xbr, ybr
+    :return: a generator of (index of the box, view of the image in the box) of the non-empty boxes
+    """
+    boxes, is_valid = get_crop_boxes(bboxes, img.shape[1], img.shape[0])
+    for index in np.flatnonzero(is_valid):
+        x, y, x_end, y_end = boxes[index]
+        yield int(index), img[y:y_end, x:x_end]
+
+
+def read_rgb_image(image_path: str) -> np.ndarray:
+    """
+    :return: RGB image or None if the image cannot be read
+    """
+    img = cv2.imread(image_path, cv2.IMREAD_COLOR)
+    if img is not None:
+        return cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    # e.g., gif
+    try:
+        with Image.open(image_path) as image:
+            return np.asarray(image.convert("RGB"))
+    except Exception as e:
+        logger.warning(f"Cannot read {image_path}: {str(e)}")
+        return None
+
+
+def _group_by_image(data_labels: ColumnarDataLabels, object_indices) -> list:
+    """
+    :return: [(image index, object indices of the image)] in the order of the objects
+    """
+    if object_indices is None:
+        object_indices = np.arange(len(data_labels.image_index), dtype=np.int64)
+    object_indices = np.sort(np.asarray(object_indices, dtype=np.int64))
+    if len(object_indices) == 0:
+        return []
+
+    # the objects are stored image by image
+    image_index = data_labels.image_index[object_indices]
+    groups = np.split(object_indices, np.flatnonzero(np.diff(image_index)) + 1)
+    return [(int(data_labels.image_index[group[0]]), group) for group in groups]
+
+
+def _extract(data_folder: str, data_labels: ColumnarDataLabels, object_indices, func, shape: tuple, dtype,
+             max_workers: int) -> (np.ndarray, np.ndarray):
+    """
+    :param func: called with the crop of each object and returns an array of shape
+    :return: (the results of the objects with a crop, their object indices)
+    """
+    image_objects = _group_by_image(data_labels, object_indices)
+
+    def _read_image_crops(image_objects_item):
+        image_index, indices = image_objects_item
+        image_path = os.path.join(data_folder, os.path.basename(data_labels.image_names[image_index]))
+        img = read_rgb_image(image_path) if os.path.exists(image_path) else None
+        if img is None:
+            logger.warning(f"Skipping the objects of {image_path}")
+            return indices[:0], []
+        crops = list(iter_image_crops(img, data_labels.bboxes[indices]))
+        return indices[[index for index, _ in crops]], [func(crop) for _, crop in crops]
+
+    total_count = sum(len(indices) for _, indices in image_objects)
+    results = np.empty((total_count,) + tuple(shape), dtype=dtype)
+    result_indices = np.empty(total_count, dtype=np.int64)
+    count = 0
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="label_crops") as executor:
+        for indices, image_results in executor.map(_read_image_crops, image_objects):
+            for result in image_results:
+                results[count] = result
+                count += 1
+            result_indices[count - len(indices):count] = indices
+    return results[:count], result_indices[:count]
+
+
+def extract_label_crops(data_folder: str, data_labels: ColumnarDataLabels, size: tuple = CROP_SIZE,
+                        object_indices=None, max_workers: int = CROP_MAX_WORKERS) -> (np.ndarray, np.ndarray):
+    """
+    :param data_folder: folder of the images
+    :param data_labels: labels
+    :param size: (width, height) of the crops
+    :param object_indices: objects to crop; all the objects if None
+    :param max_workers: the number of threads decoding the images
+    :return: ((N, height, width, 3) RGB crops, (N,) object indices) of the objects with a non-empty crop
+    """
+    return _extract(data_folder, data_labels, object_indices,
+                    lambda crop: cv2.resize(crop, size, interpolation=cv2.INTER_AREA),
+                    (size[1], size[0], 3), np.uint8, max_workers)
+
+
+def extract_label_features(data_folder: str, data_labels: ColumnarDataLabels, object_indices=None,
+                           max_workers: int = CROP_MAX_WORKERS) -> (np.ndarray, np.ndarray):
+    """
+    :return: ((N, FEATURE_DIM) feature vectors, (N,) object indices) of the objects with a non-empty crop
+    """
+    return _extract(data_folder, data_labels, object_indices, compute_image_features,
+                    (FEATURE_DIM,), np.float32, max_workers)
+
+
+def get_crop_names(data_labels: ColumnarDataLabels, object_indices: np.ndarray) -> list:
+    """
+    :return: <label>-<index of the object in the image>-<image name> of the objects
+    """
+    names = []
+    for object_index in object_indices:
+        image_index = data_labels.image_index[object_index]
+        names.append(f"{data_labels.labels[data_labels.label_ids[object_index]]}-"
+                     f"{object_index - data_labels.object_offsets[image_index]}-"
+                     f"{os.path.basename(data_labels.image_names[image_index])}")
+    return names
+
+
+def get_crop_atlas_filenames(atlas_folder: str, label_filename: str, ext: str = CROP_ATLAS_EXT) -> (str, str):
+    atlas_filename = os.path.join(atlas_folder, os.path.basename(label_filename)) + ext
+    return atlas_filename, os.path.splitext(atlas_filename)[0] + ".json"
+
+
+def _save_object_matrix(atlas_filename: str, index_filename: str, source_key: tuple, matrix: np.ndarray,
+                        object_indices: np.ndarray, **index_fields):
+    os.makedirs(os.path.dirname(atlas_filename), exist_ok=True)
+    with open(atlas_filename + ".tmp", 'wb') as atlas_file:
+        np.save(atlas_file, np.ascontiguousarray(matrix))
+    os.replace(atlas_filename + ".tmp", atlas_filename)
+
+    index = {"version": CROP_ATLAS_VERSION, "object_indices": object_indices.tolist(),
+             "source_key": list(source_key), **index_fields}
+    json_codec.dump_file(index, index_filename + ".tmp")
+    os.replace(index_filename + ".tmp", index_filename)
+
+
+def _load_object_matrix(atlas_filename: str, index_filename: str, source_key: tuple,
+                        **index_fields) -> (np.ndarray, np.ndarray):
+    if not os.path.exists(atlas_filename) or not os.path.exists(index_filename):
+        return None, None
+
+    try:
+        index = json_codec.load_file(index_filename)
+        expected = {"version": CROP_ATLAS_VERSION, "source_key": list(source_key), **index_fields}
+        if any(index.get(key) != value for key, value in expected.items()):
+            return None, None
+        matrix = np.load(atlas_filename, mmap_mode='r')
+    except (OSError, ValueError) as e:
+        logger.warning(f"Cannot read {atlas_filename}: {str(e)}")
+        return None, None
+    return matrix, np.asarray(index['object_indices'], dtype=np.int64)
+
+
+def save_crop_atlas(atlas_folder: str, label_filename: str, crops: np.ndarray, object_indices: np.ndarray,
+                    source_key: tuple = None):
+    """
+    :param atlas_folder: folder of the crop atlases
+    :param label_filename: label file of the crops
+    :param crops: (N, height, width, 3) crops
+    :param object_indices: (N,) object indices of the crops
+    :param source_key: the state of the label file the crops were extracted from; the current one if None
+    """
+    _save_object_matrix(*get_crop_atlas_filenames(atlas_folder, label_filename),
+                        source_key or get_label_file_key(label_filename), crops, object_indices,
+                        size=[crops.shape[2], crops.shape[1]])
+
+
+def load_crop_atlas(atlas_folder: str, label_filename: str, size: tuple = CROP_SIZE,
+                    source_key: tuple = None) -> (np.ndarray, np.ndarray):
+    """
+    :param source_key: the state of the label file the crops must be extracted from; the current one if None
+    :return: (memory-mapped crops, object indices) or (None, None) if there is no up-to-date atlas
+    """
+    return _load_object_matrix(*get_crop_atlas_filenames(atlas_folder, label_filename),
+                               source_key or get_label_file_key(label_filename), size=list(size))
+
+
+def load_label_crops(data_folder: str, label_filename: str, data_labels: ColumnarDataLabels, atlas_folder: str,
+                     size: tuple = CROP_SIZE) -> (np.ndarray, np.ndarray):
+    """
+    :return: the crops of all the objects from the crop atlas of the label file; extracted and saved if it is stale
+    """
+    # taken before the extraction so that an edit journaled meanwhile makes the atlas stale
+    source_key = get_label_file_key(label_filename)
+    crops, object_indices = load_crop_atlas(atlas_folder, label_filename, size, source_key)
+    if crops is None:
+        crops, object_indices = extract_label_crops(data_folder, data_labels, size)
+        save_crop_atlas(atlas_folder, label_filename, crops, object_indices, source_key)
+    return crops, object_indices
+
+
+def load_label_features(data_folder: str, label_filename: str, data_labels: ColumnarDataLabels,
+                        cache_folder: str) -> (np.ndarray, np.ndarray):
+    """
+    :return: the feature vectors of all the objects from the cache of the label file; extracted and saved
+        if it is stale
+    """
+    matrix_filename, index_filename = get_crop_atlas_filenames(cache_folder, label_filename, FEATURES_EXT)
+    source_key = get_label_file_key(label_filename)
+    features, object_indices = _load_object_matrix(matrix_filename, index_filename, source_key, dim=FEATURE_DIM)
+    if features is None:
+        features, object_indices = extract_label_features(data_folder, data_labels)
+        _save_object_matrix(matrix_filename, index_filename, source_key, features, object_indices,
+                            dim=FEATURE_DIM)
+    return features, object_indices
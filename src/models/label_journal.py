@@ -0,0 +1,147 @@
+import os
+import threading
+
+from src.common import json_codec
+from src.common.logger import get_logger
+
+logger = get_logger(__name__)
+
+"""
+.. module:: label_journal
+   :synopsis: append-only edit journal of a label file
+   Instead of rewriting the whole label file on every review, the edited image is appended
+   to <label filename>.journal as a JSON line:
+        {"image_index": 3, "image": {"image_id": "3", "name": "...", "objects": [...]}}
+   Loading a label file replays the journal on top of it (the last entry of an image wins),
+   and the journal is compacted into the label file in a background thread once it grows
+   beyond COMPACT_JOURNAL_SIZE.
+"""
+
+JOURNAL_EXT = ".journal"
+COMPACT_JOURNAL_SIZE = 1024 * 1024
+
+_locks = dict()
+_locks_lock = threading.Lock()
+_compacting = set()
+
+
+def _get_lock(journal_filename: str) -> threading.Lock:
+    with _locks_lock:
+        return _locks.setdefault(os.path.abspath(journal_filename), threading.Lock())
+
+
+def get_label_file_key(label_filename: str) -> tuple:
+    """
+    :param label_filename: label filename
+    :return: (mtime_ns, size) of the label file and of its journal, e.g., to invalidate the caches of
+        the label file; the journaled edits leave the label file as it is but change the key
+    """
+    file_stat = os.stat(label_filename)
+    journal_filename = label_filename + JOURNAL_EXT
+    journal_stat = os.stat(journal_filename) if os.path.exists(journal_filename) else None
+    return (file_stat.st_mtime_ns, file_stat.st_size,
+            journal_stat.st_mtime_ns if journal_stat else 0, journal_stat.st_size if journal_stat else 0)
+
+
+class LabelJournal:
+    def __init__(self, label_filename: str):
+        self.label_filename = label_filename
+        self.journal_filename = label_filename + JOURNAL_EXT
+        self.lock = _get_lock(self.journal_filename)
+
+    def append(self, image_index: int, image):
+        """
+        :param image_index: index of the image in the label file
+        :param image: DataLabels.Image or its json dictionary
+        """
+        entry = json_codec.dumps({"image_index": image_index, "image": image})
+        with self.lock:
+            with open(self.journal_filename, 'ab') as journal_file:
+                journal_file.write(entry + b"\n")
+
+    def get_size(self) -> int:
+        if os.path.exists(self.journal_filename):
+            return os.path.getsize(self.journal_filename)
+        return 0
+
+    def read_entries(self) -> (list, int):
+        """
+        :return: (image_index, image json dictionary) entries and the number of bytes read
+        """
+        with self.lock:
+            if not os.path.exists(self.journal_filename):
+                return [], 0
+            with open(self.journal_filename, 'rb') as journal_file:
+                data = journal_file.read()
+
+        entries = []
+        # a line without a newline is still being written
+        complete = data[:data.rfind(b"\n") + 1]
+        for line in complete.splitlines():
+            if line.strip():
+                entry = json_codec.loads(line)
+                entries.append((entry['image_index'], entry['image']))
+        return entries, len(complete)
+
+    def truncate(self, consumed_size: int):
+        """
+        drop the entries that were compacted into the label file, keeping the ones appended meanwhile
+        :param consumed_size: the number of bytes compacted
+        """
+        with self.lock:
+            if not os.path.exists(self.journal_filename):
+                return
+            with open(self.journal_filename, 'rb') as journal_file:
+                remaining = journal_file.read()[consumed_size:]
+            if remaining:
+                with open(self.journal_filename, 'wb') as journal_file:
+                    journal_file.write(remaining)
+            else:
+                os.remove(self.journal_filename)
+
+    def clear(self):
+        with self.lock:
+            if os.path.exists(self.journal_filename):
+                os.remove(self.journal_filename)
+
+    @staticmethod
+    def apply_entries(images: list, entries: list, from_json=lambda json_image: json_image):
+        """
+        replace the images with their journaled versions
+        :param images: images of the label file (DataLabels.Image or json dictionaries)
+        :param entries: (image_index, image json dictionary) entries
+        :param from_json: converts an image json dictionary into the type of images
+        """
+        def _get_name(image):
+            return image['name'] if isinstance(image, dict) else image.name
+
+        for image_index, json_image in entries:
+            if not (0 <= image_index < len(images) and _get_name(images[image_index]) == json_image['name']):
+                image_index = next((idx for idx, image in enumerate(images)
+                                    if _get_name(image) == json_image['name']), None)
+                if image_index is None:
+                    logger.error(f"Cannot find a matching image {json_image['name']}")
+                    continue
+            images[image_index] = from_json(json_image)
+
+    def compact_in_background(self, compact):
+        """
+        run the compaction in a background thread unless one is already running for this label file
+        :param compact: function that compacts the journal into the label file
+        """
+        key = os.path.abspath(self.journal_filename)
+        with _locks_lock:
+            if key in _compacting:
+                return
+            _compacting.add(key)
+
+        def _run():
+            try:
+                compact()
+            except Exception as e:
+                logger.error(f"Error compacting {self.journal_filename}: {str(e)}")
+            finally:
+                with _locks_lock:
+                    _compacting.discard(key)
+
+        threading.Thread(target=_run, daemon=True).start()
@@ -0,0 +1,205 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from src.common.constants import ErrorType
+from src.common.logger import get_logger
+from src.common.overlaps import (
+    count_overlap_percents,
+    get_overlap_percents,
+    get_shape_overlap_percents
+)
+from src.models.columnar_labels import ColumnarDataLabels, NO_ERROR_ID
+
+logger = get_logger(__name__)
+
+"""
+.. module:: label_metrics
+   :synopsis: single-pass aggregation of label metrics
+   LabelMetrics consumes label files one at a time (see ColumnarDataLabels.iter_load)
+   and updates the class, error, dimension and overlap accumulators incrementally.
+   The per-image table is emitted as Arrow record batches of batch_size rows so that
+   only the accumulators and the finished batches are kept, not the label files.
+"""
+
+IMAGE_TABLE_COLUMNS = ['filename', 'total_classes', 'class_names']
+ERROR_COLUMNS = [error_type.description for error_type in ErrorType]
+
+
+class LabelMetrics:
+    def __init__(self, use_shapes=False, batch_size=1024):
+        """
+        :param use_shapes: compute overlaps of the actual shapes instead of the bounding rectangles
+        :param batch_size: the number of image rows per record batch
+        """
+        self.use_shapes = use_shapes
+        self.batch_size = batch_size
+
+        self.class_labels = dict()
+        self.errors = dict()
+        self.overlap_areas = dict()
+        self.dimensions = dict()
+
+        # dynamic columns of the image table in the order of their first appearance
+        self._class_columns = dict()
+        self._error_columns = dict()
+        self._rows = []
+        self._record_batches = []
+
+    def add_labels(self, data_labels: ColumnarDataLabels):
+        for image_index in range(len(data_labels.images)):
+            self.add_image(data_labels, image_index)
+
+    def add_image(self, data_labels: ColumnarDataLabels, image_index: int):
+        image = data_labels.images[image_index]
+        start, end = image.object_range
+
+        # class counts
+        label_ids, first_seen, label_counts = np.unique(data_labels.label_ids[start:end],
+                                                        return_index=True, return_counts=True)
+        order = np.argsort(first_seen)
+        class_counts = {data_labels.labels[label_id]: int(count)
+                        for label_id, count in zip(label_ids[order], label_counts[order])}
+        for label, count in class_counts.items():
+            self.class_labels[label] = self.class_labels.get(label, 0) + count
+            self._class_columns.setdefault(label)
+
+        # error counts
+        error_ids = data_labels.error_ids[start:end]
+        error_ids, error_id_counts = np.unique(error_ids[error_ids != NO_ERROR_ID], return_counts=True)
+        error_counts = {data_labels.error_codes[error_id]: int(count)
+                        for error_id, count in zip(error_ids, error_id_counts)}
+        for error_code, count in error_counts.items():
+            self.errors[error_code] = self.errors.get(error_code, 0) + count
+            self._error_columns.setdefault(error_code)
+
+        # dimensions
+        bboxes = data_labels.get_bounding_rectangles(image_index)
+        has_points = ~np.isnan(bboxes).any(axis=1)
+        if has_points.any():
+            widths = np.round(bboxes[has_points, 2].astype(np.float64) - bboxes[has_points, 0], 2)
+            heights = np.round(bboxes[has_points, 3].astype(np.float64) - bboxes[has_points, 1], 2)
+            labels = [data_labels.labels[label_id] for label_id in data_labels.label_ids[start:end][has_points]]
+            self.dimensions.setdefault(image.name, []).extend(zip(widths.tolist(), heights.tolist(), labels))
+
+        # overlaps
+        if self.use_shapes:
+            overlap_percents = get_shape_overlap_percents(image.objects)
+        else:
+            overlap_percents = get_overlap_percents(bboxes)
+        count_overlap_percents(self.overlap_areas, overlap_percents)
+
+        row = {
+            'filename': image.name,
+            'total_classes': len(class_counts),
+            'class_names': ", ".join(class_counts.keys())
+        }
+        row.update(class_counts)
+        row.update(error_counts)
+        self._rows.append(row)
+        if len(self._rows) >= self.batch_size:
+            self._flush()
+
+    def _get_columns(self) -> list:
+        other_error_columns = [error_code for error_code in self._error_columns if error_code not in ERROR_COLUMNS]
+        count_columns = [label for label in self._class_columns if label not in ERROR_COLUMNS]
+        return IMAGE_TABLE_COLUMNS + count_columns + other_error_columns + ERROR_COLUMNS
+
+    def _flush(self):
+        if not self._rows:
+            return
+
+        columns = self._get_columns()
+        arrays = {column: [row.get(column, 0) for row in self._rows] for column in columns}
+        self._record_batches.append(pa.RecordBatch.from_pydict(arrays))
+        self._rows = []
+
+    def get_record_batches(self) -> list:
+        """
+        :return: record batches of the image table; batches made earlier may lack the columns found later
+        """
+        self._flush()
+        return self._record_batches
+
+    def get_errors(self) -> dict:
+        """
+        :return: error counts including all the error types
+        """
+        errors = dict(self.errors)
+        for error_code in ERROR_COLUMNS:
+            errors.setdefault(error_code, 0)
+        return errors
+
+    def to_table(self) -> pa.Table:
+        """
+        :return: the image table with the columns of all the batches
+        """
+        record_batches = self.get_record_batches()
+        columns = self._get_columns()
+        if not record_batches:
+            return pa.table({column: pa.array([], type=pa.string() if column in ['filename', 'class_names']
+                                                else pa.int64())
+                             for column in columns})
+
+        aligned_batches = []
+        for record_batch in record_batches:
+            arrays = [record_batch.column(column) if column in record_batch.schema.names
+                      else pa.array(np.zeros(record_batch.num_rows, dtype=np.int64))
+                      for column in columns]
+            aligned_batches.append(pa.RecordBatch.from_arrays(arrays, names=columns))
+
+        return pa.Table.from_batches(aligned_batches)
+
+    def to_data_frame(self) -> pd.DataFrame:
+        return self.to_table().to_pandas()
+
+    def merge(self, other: 'LabelMetrics'):
+        """
+        merge the partial aggregates of another LabelMetrics (e.g., of another task) into this one
+        :param other: LabelMetrics to merge
+        """
+        for label, count in other.class_labels.items():
+            self.class_labels[label] = self.class_labels.get(label, 0) + count
+        for error_code, count in other.errors.items():
+            self.errors[error_code] = self.errors.get(error_code, 0) + count
+        for overlap_percent, count in other.overlap_areas.items():
+            self.overlap_areas[overlap_percent] = self.overlap_areas.get(overlap_percent, 0) + count
+        for image_name, dimensions in other.dimensions.items():
+            self.dimensions.setdefault(image_name, []).extend(dimensions)
+
+        for label in other._class_columns:
+            self._class_columns.setdefault(label)
+        for error_code in other._error_columns:
+            self._error_columns.setdefault(error_code)
+
+        self._flush()
+        self._record_batches.extend(other.get_record_batches())
+
+    def to_json(self):
+        return {
+            "use_shapes": self.use_shapes,
+            "class_labels": self.class_labels,
+            "errors": self.errors,
+            # json keys are strings
+            "overlap_areas": [[overlap_percent, count] for overlap_percent, count in self.overlap_areas.items()],
+            "dimensions": self.dimensions,
+            "class_columns": list(self._class_columns),
+            "error_columns": list(self._error_columns),
+            "image_table": self.to_table().to_pydict()
+        }
+
+    @staticmethod
+    def from_json(json_dict):
+        label_metrics = LabelMetrics(use_shapes=json_dict['use_shapes'])
+        label_metrics.class_labels = json_dict['class_labels']
+        label_metrics.errors = json_dict['errors']
+        label_metrics.overlap_areas = {overlap_percent: count for overlap_percent, count in json_dict['overlap_areas']}
+        label_metrics.dimensions = {image_name: [tuple(dimension) for dimension in dimensions]
+                                    for image_name, dimensions in json_dict['dimensions'].items()}
+        label_metrics._class_columns = dict.fromkeys(json_dict['class_columns'])
+        label_metrics._error_columns = dict.fromkeys(json_dict['error_columns'])
+
+        image_table = json_dict['image_table']
+        if image_table and len(image_table['filename']) > 0:
+            label_metrics._record_batches.append(pa.RecordBatch.from_pydict(image_table))
+        return label_metrics
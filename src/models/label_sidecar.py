@@ -0,0 +1,148 @@
+import os
+
+import numpy as np
+import pyarrow as pa
+
+from src.common import json_codec
+from src.common.logger import get_logger
+from src.models.columnar_labels import ColumnarDataLabels, _LazySequence
+
+logger = get_logger(__name__)
+
+"""
+.. module:: label_sidecar
+   :synopsis: binary sidecar of the converted label files
+   The columns of ColumnarDataLabels are saved next to the label file as <label filename>.arrow,
+   an Arrow IPC file with a single row whose cells are the whole columns:
+        numeric columns     list<int/float>     memory-mapped and read without copying
+        string columns      list<string>        labels, types, error codes, image ids and names
+        attributes          list<binary>        json per object, decoded only when the object is accessed
+        verification_results    binary          json (they are sparse)
+        irregular_points        binary          json of the points kept as they are (see columnar_labels)
+   The mtime and size of the label file are kept in the schema metadata, and the sidecar is used
+   only as long as they match. The JSON stays the interchange format; the sidecar is just a cache
+   that is regenerated whenever the label file is saved.
+"""
+
+SIDECAR_EXT = ".arrow"
+SIDECAR_VERSION = "3"
+
+_NUMERIC_COLUMNS = {
+    "image_widths": pa.int32(),
+    "image_heights": pa.int32(),
+    "object_offsets": pa.int64(),
+    "image_index": pa.int32(),
+    "label_ids": pa.int32(),
+    "type_ids": pa.int16(),
+    "bboxes": pa.float32(),
+    "point_offsets": pa.int64(),
+    "point_dims": pa.int8(),
+    "point_flags": pa.int8(),
+    "coords": pa.float64(),
+    "error_ids": pa.int16(),
+}
+_STRING_COLUMNS = ["image_ids", "image_names", "labels", "types", "error_codes"]
+_HEADER_FIELDS = ["twconverted", "mode", "template_version"]
+
+
+def get_sidecar_filename(label_filename: str) -> str:
+    return label_filename + SIDECAR_EXT
+
+
+def _get_source_key(label_filename: str) -> dict:
+    file_stat = os.stat(label_filename)
+    return {
+        b"version": SIDECAR_VERSION.encode(),
+        b"source_mtime_ns": str(file_stat.st_mtime_ns).encode(),
+        b"source_size": str(file_stat.st_size).encode(),
+    }
+
+
+def save_sidecar(label_filename: str, columnar_labels: ColumnarDataLabels):
+    """
+    save the columns of the label file next to it
+    :param label_filename: label filename that the sidecar belongs to; it must be saved already
+    :param columnar_labels: the labels of the label file
+    """
+    arrays, names = [], []
+    for name, value_type in _NUMERIC_COLUMNS.items():
+        values = np.ascontiguousarray(getattr(columnar_labels, name)).reshape(-1)
+        arrays.append(pa.array([pa.array(values, type=value_type)], type=pa.list_(value_type)))
+        names.append(name)
+    for name in _STRING_COLUMNS:
+        arrays.append(pa.array([[str(value) for value in getattr(columnar_labels, name)]],
+                               type=pa.list_(pa.string())))
+        names.append(name)
+    arrays.append(pa.array([[json_codec.dumps(attributes) for attributes in columnar_labels.attributes]],
+                           type=pa.list_(pa.binary())))
+    names.append("attributes")
+    arrays.append(pa.array([json_codec.dumps(columnar_labels.verification_results)], type=pa.binary()))
+    names.append("verification_results")
+    arrays.append(pa.array([json_codec.dumps(columnar_labels.irregular_points)], type=pa.binary()))
+    names.append("irregular_points")
+
+    metadata = _get_source_key(label_filename)
+    for field in _HEADER_FIELDS:
+        value = getattr(columnar_labels, field)
+        if value is not None:
+            metadata[field.encode()] = str(value).encode()
+
+    record_batch = pa.RecordBatch.from_arrays(arrays, names=names).replace_schema_metadata(metadata)
+
+    # write to a temporary file first so that the sidecar is never read half-written
+    sidecar_filename = get_sidecar_filename(label_filename)
+    with pa.OSFile(sidecar_filename + ".tmp", 'wb') as sink:
+        with pa.ipc.new_file(sink, record_batch.schema) as writer:
+            writer.write_batch(record_batch)
+    os.replace(sidecar_filename + ".tmp", sidecar_filename)
+
+
+def load_sidecar(label_filename: str) -> ColumnarDataLabels:
+    """
+    :param label_filename: label filename
+    :return: ColumnarDataLabels from the sidecar or None if there is no up-to-date sidecar
+    """
+    sidecar_filename = get_sidecar_filename(label_filename)
+    if not os.path.exists(sidecar_filename) or not os.path.exists(label_filename):
+        return None
+
+    try:
+        record_batch = pa.ipc.open_file(pa.memory_map(sidecar_filename, 'r')).get_batch(0)
+    except (pa.ArrowInvalid, OSError) as e:
+        logger.warning(f"Cannot read {sidecar_filename}: {str(e)}")
+        return None
+
+    metadata = record_batch.schema.metadata or {}
+    source_key = _get_source_key(label_filename)
+    if any(metadata.get(key) != value for key, value in source_key.items()):
+        return None
+
+    columnar_labels = ColumnarDataLabels(**{field: metadata[field.encode()].decode() if field.encode() in metadata
+                                            else None
+                                            for field in _HEADER_FIELDS})
+    for name in _NUMERIC_COLUMNS:
+        # zero-copy views on the memory-mapped file
+        values = record_batch.column(name).values.to_numpy(zero_copy_only=True)
+        setattr(columnar_labels, name, values)
+    columnar_labels.bboxes = columnar_labels.bboxes.reshape(-1, 4)
+    for name in _STRING_COLUMNS:
+        setattr(columnar_labels, name, record_batch.column(name).values.to_pylist())
+    attributes = record_batch.column("attributes").values
+    columnar_labels.attributes = _LazySequence(len(attributes),
+                                               lambda index: json_codec.loads(attributes[index].as_py()))
+    columnar_labels.verification_results = {
+        int(object_index): verification_result for object_index, verification_result
+        in json_codec.loads(record_batch.column("verification_results")[0].as_py()).items()
+    }
+    columnar_labels.irregular_points = {
+        int(object_index): points for object_index, points
+        in json_codec.loads(record_batch.column("irregular_points")[0].as_py()).items()
+    }
+
+    return columnar_labels
+
+
+def remove_sidecar(label_filename: str):
+    sidecar_filename = get_sidecar_filename(label_filename)
+    if os.path.exists(sidecar_filename):
+        os.remove(sidecar_filename)
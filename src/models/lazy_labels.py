@@ -0,0 +1,98 @@
+from collections.abc import Sequence
+
+from src.common.logger import get_logger
+from src.models.columnar_labels import ColumnarDataLabels
+from src.models.data_labels import DataLabels
+from src.models.label_journal import LabelJournal
+from src.models.label_sidecar import load_sidecar
+
+logger = get_logger(__name__)
+
+"""
+.. module:: lazy_labels
+   :synopsis: random-access loading of a label file for the viewer
+   LazyDataLabels opens the memory-mapped sidecar of a label file (see label_sidecar) and
+   materializes a DataLabels.Image only when images[i] is accessed,
+   so that showing image N does not parse the objects of all the other images.
+   The sidecar gives back the points exactly as they are in the json (see columnar_labels.irregular_points),
+   so an image edited and journaled by the viewer keeps the values of the objects that were not touched.
+   The edits are kept per image index on top of the sidecar (the journal of the label file is
+   replayed the same way), and saving an image only appends that image to the journal.
+"""
+
+
+class _LazyImages(Sequence):
+    """DataLabels.Image of the label file created on access; replaced images are kept as they are"""
+    def __init__(self, columnar_labels: ColumnarDataLabels):
+        self._columnar_labels = columnar_labels
+        self._images = dict()
+
+    def __len__(self):
+        return len(self._columnar_labels.image_names)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+
+        if index < 0:
+            index += len(self)
+        image = self._images.get(index)
+        if image is None:
+            image = self._columnar_labels.images[index].to_data_labels_image()
+            self._images[index] = image
+        return image
+
+    def __setitem__(self, index, image: DataLabels.Image):
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError(index)
+        self._images[index] = image
+
+
+class LazyDataLabels:
+    def __init__(self, filename: str, columnar_labels: ColumnarDataLabels):
+        self.filename = filename
+        self.images = _LazyImages(columnar_labels)
+        self._image_names = list(columnar_labels.image_names)
+
+    @property
+    def image_names(self) -> list:
+        return self._image_names
+
+    def __len__(self):
+        return len(self.images)
+
+    def save_image(self, image_index: int, image_to_save: DataLabels.Image):
+        """
+        replace the image and append only the image to the journal of the label file
+        :param image_index: index of the image
+        :param image_to_save: edited image
+        """
+        if self._image_names[image_index] != image_to_save.name:
+            image_index = self._image_names.index(image_to_save.name) \
+                if image_to_save.name in self._image_names else None
+            if image_index is None:
+                logger.error(f"Cannot find a matching image {image_to_save.name}")
+                return
+
+        self.images[image_index] = image_to_save
+        DataLabels.save_image_to_journal(self.filename, image_index, image_to_save)
+
+    @staticmethod
+    def load(filename: str) -> 'LazyDataLabels':
+        """
+        :param filename: label filename
+        :return: LazyDataLabels or None if the label file does not exist
+        """
+        columnar_labels = load_sidecar(filename)
+        if columnar_labels is None:
+            # parses the label file once and creates the sidecar for the next time
+            columnar_labels = ColumnarDataLabels.load(filename)
+            # the journal is already replayed by ColumnarDataLabels.load
+            return LazyDataLabels(filename, columnar_labels) if columnar_labels is not None else None
+
+        lazy_labels = LazyDataLabels(filename, columnar_labels)
+        entries, _ = LabelJournal(filename).read_entries()
+        LabelJournal.apply_entries(lazy_labels.images, entries, DataLabels.Image.from_json)
+        return lazy_labels
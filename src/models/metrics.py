@@ -3,14 +3,16 @@ import os
 
 import altair as alt
 import cv2
+import joblib
 import numpy as np
 import pandas as pd
 from altair import Tooltip
-from sklearn.cluster import KMeans
-from sklearn.decomposition import PCA
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.decomposition import PCA, IncrementalPCA
 
 from src.common.charts import display_chart
 from src.common.logger import get_logger
+from src.models.feature_store import FEATURES_VERSION, FeatureStore, compute_image_features
 
 import plotly.express as px
 import streamlit as st
@@ -18,39 +20,133 @@ import streamlit as st
 
 logger = get_logger(__name__)
 
+CLUSTER_BATCH_SIZE = 4096
+CLUSTER_EPOCHS = 3
+
+
+def get_image_features(images) -> np.ndarray:
+    """
+    :param images: RGB images
+    :return: compact feature vectors of the images instead of the raw pixels
+    """
+    return np.stack([compute_image_features(img) for img in images])
 
-def cluster_images(images: list, n_clusters=5):
-    X = np.array(images)
-    X = X.reshape(X.shape[0], -1)
 
-    kmeans = KMeans(n_clusters=n_clusters)
-    kmeans.fit(X)
+def cluster_features(features: np.ndarray, n_clusters=5):
+    kmeans = MiniBatchKMeans(n_clusters=n_clusters, batch_size=CLUSTER_BATCH_SIZE, n_init=3, random_state=0)
+    kmeans.fit(features)
 
     return kmeans.labels_
 
 
-def reduce_features(images: list, n_components=2):
+def project_features(features: np.ndarray, n_components=2):
     # Perform dimensionality reduction for plotting
-    flattened_images = np.array(images).reshape(len(images), -1)
-    pca = PCA(n_components=n_components)
-    return pca.fit_transform(flattened_images)
+    pca = PCA(n_components=n_components, svd_solver="randomized", random_state=0)
+    return pca.fit_transform(features)
+
+
+def cluster_images(images: list, n_clusters=5):
+    return cluster_features(get_image_features(images), n_clusters)
+
+
+def reduce_features(images: list, n_components=2):
+    return project_features(get_image_features(images), n_components)
+
+
+def _split_rows(rows: np.ndarray, batch_size: int = CLUSTER_BATCH_SIZE) -> list:
+    # batches of similar sizes, so that the last batch is not smaller than the number of components
+    return np.array_split(rows, max(len(rows) // batch_size, 1))
+
+
+def fit_clusters(features: np.ndarray, rows: np.ndarray, n_clusters=5,
+                 n_components=2) -> (MiniBatchKMeans, IncrementalPCA):
+    """
+    fit the clusters and the projection for plotting batch by batch, so that the memory does not grow with the rows
+    :param features: memory-mapped feature matrix (see FeatureStore.features)
+    :param rows: rows of features to fit on
+    :param n_clusters: the number of clusters
+    :param n_components: the number of dimensions of the projection
+    :return: (clusters, projection)
+    """
+    kmeans = MiniBatchKMeans(n_clusters=n_clusters, batch_size=CLUSTER_BATCH_SIZE, n_init=3, random_state=0)
+    pca = IncrementalPCA(n_components=n_components)
+    if len(rows) <= CLUSTER_BATCH_SIZE:
+        batch = features[np.sort(rows)]
+        kmeans.fit(batch)
+        pca.fit(batch)
+        return kmeans, pca
+
+    shuffled_rows = np.random.default_rng(0).permutation(rows)
+    for epoch in range(CLUSTER_EPOCHS):
+        for batch_rows in _split_rows(shuffled_rows):
+            # sorted to read the memory-mapped matrix sequentially
+            batch = features[np.sort(batch_rows)]
+            kmeans.partial_fit(batch)
+            if epoch == 0:
+                pca.partial_fit(batch)
+    return kmeans, pca
+
+
+def assign_clusters(features: np.ndarray, rows: np.ndarray, kmeans: MiniBatchKMeans,
+                    pca: IncrementalPCA) -> (np.ndarray, np.ndarray):
+    """
+    :return: (cluster labels, projected features) of the rows with the fitted clusters and projection
+    """
+    cluster_labels = np.empty(len(rows), dtype=np.int32)
+    reduced_features = np.empty((len(rows), pca.n_components_), dtype=np.float32)
+    for start in range(0, len(rows), CLUSTER_BATCH_SIZE):
+        batch = features[rows[start:start + CLUSTER_BATCH_SIZE]]
+        cluster_labels[start:start + len(batch)] = kmeans.predict(batch)
+        reduced_features[start:start + len(batch)] = pca.transform(batch)
+    return cluster_labels, reduced_features
+
+
+def get_image_clusters(feature_store: FeatureStore, rows: np.ndarray, n_clusters=5,
+                       refit=False) -> (np.ndarray, np.ndarray):
+    """
+    assign the images to the clusters fitted before, so that new images do not require fitting again
+    :param feature_store: features of the images
+    :param rows: rows of the images in the feature store
+    :param n_clusters: the number of clusters
+    :param refit: fit the clusters on the current images even if they were fitted before
+    :return: (cluster labels, projected features for plotting)
+    """
+    model_filename = feature_store.get_model_filename("clusters")
+    model = None
+    if not refit and os.path.exists(model_filename):
+        model = joblib.load(model_filename)
+        if model.get('version') != FEATURES_VERSION or model['kmeans'].n_clusters != n_clusters:
+            model = None
+
+    if model is None:
+        logger.info(f"Fitting {n_clusters} clusters on {len(rows)} images")
+        kmeans, pca = fit_clusters(feature_store.features, rows, n_clusters)
+        model = {"version": FEATURES_VERSION, "kmeans": kmeans, "pca": pca}
+        joblib.dump(model, model_filename)
+
+    return assign_clusters(feature_store.features, rows, model['kmeans'], model['pca'])
 
 
 def plot_image_clusters(project_id: str, title: str, filenames: list, images: list, cluster_labels, reduced_features):
+    """
+    :param images: RGB images of the filenames or None not to keep their thumbnails in the chart data
+    """
     # Verify lengths of arrays
-    assert len(filenames) == len(images) == len(cluster_labels), "Array lengths do not match"
+    assert len(filenames) == len(cluster_labels) and (images is None or len(images) == len(filenames)), \
+        "Array lengths do not match"
 
     # Create a DataFrame with reduced features, cluster labels, and filenames
     filenames = [os.path.basename(filenames[i]) for i in range(len(filenames))]
     df = pd.DataFrame(
         {'PC1': reduced_features[:, 0], 'PC2': reduced_features[:, 1], 'Cluster': cluster_labels, 'Filename': filenames})
 
-    # Generate thumbnail images and encode them as base64
-    thumbnail_images = [cv2.resize(img, (100, 100)) for img in images]
-    encoded_images = [base64.b64encode(cv2.imencode('.png', img)[1]).decode() for img in thumbnail_images]
+    if images is not None:
+        # Generate thumbnail images and encode them as base64
+        thumbnail_images = [cv2.resize(img, (100, 100)) for img in images]
+        encoded_images = [base64.b64encode(cv2.imencode('.png', img)[1]).decode() for img in thumbnail_images]
 
-    # Add base64 encoded images to the DataFrame
-    df['Thumbnail'] = encoded_images
+        # Add base64 encoded images to the DataFrame
+        df['Thumbnail'] = encoded_images
 
     ## Create Altair scatter plot
     #scatter_plot = alt.Chart(df).mark_circle(size=60).encode(
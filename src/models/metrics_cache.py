@@ -0,0 +1,133 @@
+import hashlib
+import os
+
+import src.common.utils as utils
+from src.common import json_codec
+from src.common.logger import get_logger
+from src.models.columnar_labels import ColumnarDataLabels
+from src.models.label_journal import get_label_file_key
+from src.models.label_metrics import LabelMetrics
+
+logger = get_logger(__name__)
+
+"""
+.. module:: metrics_cache
+   :synopsis: persistent per-task cache of label metrics
+   The partial aggregates (LabelMetrics) of each label file are saved under
+   ADQ_WORKING_FOLDER/<project>/metrics_cache/<label filename>.json together with the key of the label file:
+        path, mtime, size, the content hash and the (mtime_ns, size) of its journal
+   A cached entry is used as long as the mtime and size are the same and the journal did not change:
+   the reviews are appended to the journal and leave the label file as it is (see label_journal).
+   If they changed but the content hash is the same (e.g., the file was touched or copied), the key is refreshed.
+   Otherwise, the entry is recomputed.
+"""
+
+METRICS_CACHE_FOLDER = "metrics_cache"
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def _hash_file(filename: str) -> str:
+    file_hash = hashlib.sha1()
+    with open(filename, 'rb') as file:
+        for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b''):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+
+def _get_mode(use_shapes: bool) -> str:
+    return "shapes" if use_shapes else "rectangles"
+
+
+class MetricsCache:
+    def __init__(self, project_folder: str):
+        """
+        :param project_folder: ADQ_WORKING_FOLDER/<project>
+        """
+        self._cache_folder = os.path.join(project_folder, METRICS_CACHE_FOLDER)
+
+    def _get_cache_filename(self, label_filename: str) -> str:
+        return os.path.join(self._cache_folder, os.path.basename(label_filename) + ".json")
+
+    @staticmethod
+    def _get_journal_key(label_filename: str) -> list:
+        return list(get_label_file_key(label_filename)[2:])
+
+    def _is_fresh(self, cached: dict, label_filename: str) -> bool:
+        key = cached.get('key')
+        if not key or key['path'] != os.path.abspath(label_filename):
+            return False
+        if key.get('journal') != self._get_journal_key(label_filename):
+            return False
+
+        file_stat = os.stat(label_filename)
+        if key['mtime'] == file_stat.st_mtime and key['size'] == file_stat.st_size:
+            return True
+
+        if key['size'] == file_stat.st_size and key['hash'] == _hash_file(label_filename):
+            # the content is the same: just refresh the key
+            cached['key'] = self._get_key(label_filename, key['hash'])
+            self._save(label_filename, cached)
+            return True
+        return False
+
+    @staticmethod
+    def _get_key(label_filename: str, file_hash: str = None) -> dict:
+        file_stat = os.stat(label_filename)
+        return {
+            "path": os.path.abspath(label_filename),
+            "mtime": file_stat.st_mtime,
+            "size": file_stat.st_size,
+            "hash": file_hash if file_hash else _hash_file(label_filename),
+            "journal": MetricsCache._get_journal_key(label_filename)
+        }
+
+    def _save(self, label_filename: str, cached: dict):
+        os.makedirs(self._cache_folder, exist_ok=True)
+        utils.to_file(json_codec.dumps(cached), self._get_cache_filename(label_filename))
+
+    def get(self, label_filename: str, use_shapes=False) -> LabelMetrics:
+        """
+        :param label_filename: label filename
+        :param use_shapes: overlaps of shapes or bounding rectangles
+        :return: cached LabelMetrics of the label file or None if it is missing or stale
+        """
+        cached = utils.from_file(self._get_cache_filename(label_filename))
+        if not cached or not os.path.exists(label_filename) or not self._is_fresh(cached, label_filename):
+            return None
+
+        metrics = cached['metrics'].get(_get_mode(use_shapes))
+        if metrics:
+            return LabelMetrics.from_json(metrics)
+
+    def put(self, label_filename: str, label_metrics: LabelMetrics):
+        cached = utils.from_file(self._get_cache_filename(label_filename))
+        if not cached or not self._is_fresh(cached, label_filename):
+            cached = {"key": self._get_key(label_filename), "metrics": {}}
+
+        cached['metrics'][_get_mode(label_metrics.use_shapes)] = label_metrics.to_json()
+        self._save(label_filename, cached)
+
+    def invalidate(self, label_filename: str):
+        cache_filename = self._get_cache_filename(label_filename)
+        if os.path.exists(cache_filename):
+            os.remove(cache_filename)
+
+    def get_or_compute(self, label_filename: str, use_shapes=False) -> LabelMetrics:
+        """
+        :param label_filename: label filename
+        :param use_shapes: overlaps of shapes or bounding rectangles
+        :return: LabelMetrics of the label file; computed and cached if not cached yet
+        """
+        label_metrics = self.get(label_filename, use_shapes)
+        if label_metrics:
+            return label_metrics
+
+        data_labels = ColumnarDataLabels.load(label_filename)
+        if not data_labels:
+            return None
+
+        logger.info(f"computing label metrics of {label_filename}")
+        label_metrics = LabelMetrics(use_shapes=use_shapes)
+        label_metrics.add_labels(data_labels)
+        self.put(label_filename, label_metrics)
+        return label_metrics
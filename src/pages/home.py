@@ -1,10 +1,11 @@
 import os.path
-from PIL import Image
 import pandas as pd
 import streamlit as st
 
 import src.api.api_base
 import src.common.utils as utils
+from src.common import thumbnails
+from src.common.file_catalog import get_file_catalog
 from src.api.api_base import ApiBase
 from src.api.api_local import ApiLocal
 from src.api.api_remote import ApiRemote
@@ -117,50 +118,43 @@ def select_task(project_id: int, label="Select task") -> Task:
 
 
 def generate_thumbnails(folder_path, thumbnail_size=(128, 128), output_folder="thumbnails"):
-    os.makedirs(output_folder, exist_ok=True)
+    generated = thumbnails.generate_thumbnails(folder_path, {output_folder: thumbnail_size})
+    return [os.path.join(output_folder, os.path.basename(image_path)) for image_path in generated]
 
-    thumbnail_filenames = []
-    for filename in os.listdir(folder_path):
-        if any(filename.endswith(ext) for ext in SUPPORTED_IMAGE_FILE_EXTENSIONS):
-            image_path = os.path.join(folder_path, filename)
-            output_path = os.path.join(output_folder, filename)
 
-            try:
-                with Image.open(image_path) as image:
-                    image.thumbnail(thumbnail_size)
-                    image.save(output_path)
-                    thumbnail_filenames.append(output_path)
-            except Exception as e:
-                logger.error(f"Error processing {filename}: {str(e)}")
+# project folder -> generation of its catalog when its thumbnails were last generated
+_thumbnails_generations = dict()
 
-    return thumbnail_filenames
 
-
-def get_data_files(folder, is_thumbnails=False):
+def get_data_files(folder, is_thumbnails=False, thumbnails_name="thumbnails"):
     """
     returns a diction of data_filenames or thumbnails
     :param folder: folder name
     :param is_thumbnails: returns thumbnails if true
+    :param thumbnails_name: thumbnail folder (see thumbnails.THUMBNAIL_SIZES)
     :return: data_files by default; returns thumbnails if true
     """
     data_files = dict()
-    data_folder = os.path.join(folder, "data")
-    thumbnails_folder = os.path.join(folder, "thumbnails")
+    # the files are listed from the catalog of the project rather than globbed on every rerun
+    catalog = get_file_catalog(folder)
+    data_folder = "data"
 
     if is_thumbnails:
-        if not os.path.exists(thumbnails_folder):
-            generate_thumbnails(data_folder, output_folder=thumbnails_folder)
-        else:
-            entries = os.scandir(thumbnails_folder)
-            if not any(entries):
-                generate_thumbnails(data_folder, output_folder=thumbnails_folder)
-
-        data_folder = thumbnails_folder
-    
-    data_filenames = utils.glob_files(data_folder,
-                                      SUPPORTED_IMAGE_FILE_EXTENSIONS)
-    data_filenames.sort()
-    data_files["."] = data_filenames
+        # an image added, removed or replaced under the same name changes the generation of the catalog;
+        # generate_thumbnails then recreates only the thumbnails older than their images
+        thumbnails_key = os.path.normpath(folder)
+        if _thumbnails_generations.get(thumbnails_key) != catalog.generation and \
+                os.path.isdir(os.path.join(folder, data_folder)):
+            # all the sizes are created in a single decode of each image
+            thumbnails.generate_thumbnails(os.path.join(folder, data_folder),
+                                           {os.path.join(folder, name): size
+                                            for name, size in thumbnails.THUMBNAIL_SIZES.items()})
+            catalog = get_file_catalog(folder)
+            _thumbnails_generations[thumbnails_key] = catalog.generation
+
+        data_folder = thumbnails_name
+
+    data_files["."] = catalog.list_files(data_folder, SUPPORTED_IMAGE_FILE_EXTENSIONS)
 
     return data_files
 
@@ -0,0 +1,144 @@
+import os.path
+
+import numpy as np
+import streamlit as st
+
+from src.common.logger import get_logger
+from src.common.thumbnail_atlas import ThumbnailAtlas
+from src.models.columnar_labels import NO_ERROR_ID, ColumnarDataLabels
+from src.models.label_journal import get_label_file_key
+
+logger = get_logger(__name__)
+
+"""
+.. module:: image_grid
+   :synopsis: paginated image grid
+   Only the page on screen is rendered: its thumbnails are sliced from the thumbnail atlas
+   (or read from the data folder when there is no atlas) and a full-size image is read only when it is opened.
+   The images can be filtered by class label and by verification errors of the label files, and
+   "Jump to image" moves to the page of an image.
+"""
+
+GRID_COLUMNS = 5
+GRID_PAGE_SIZES = [20, 50, 100, 200]
+ALL_CLASSES = "All classes"
+
+
+@st.cache_data(max_entries=64)
+def _get_label_filters(label_filename: str, label_file_key: tuple) -> (dict, set):
+    """
+    :param label_filename: label filename
+    :param label_file_key: the state of the label file and its journal to invalidate the cache
+        (see label_journal.get_label_file_key)
+    :return: (key=class label value=set of image names, image names with verification errors)
+    """
+    data_labels = ColumnarDataLabels.load(label_filename)
+    if data_labels is None:
+        return dict(), set()
+
+    # the grid lists the files of the data folder
+    image_names = np.asarray([os.path.basename(name) for name in data_labels.image_names], dtype=object)
+    class_images = dict()
+    for label_id, label in enumerate(data_labels.labels):
+        image_indices = np.unique(data_labels.image_index[data_labels.label_ids == label_id])
+        if len(image_indices) > 0:
+            class_images[label] = set(image_names[image_indices])
+
+    error_indices = np.unique(data_labels.image_index[data_labels.error_ids != NO_ERROR_ID])
+    return class_images, set(image_names[error_indices])
+
+
+def get_label_filters(label_files: dict) -> (dict, set):
+    """
+    :param label_files: label files with key=folder value=label filename
+    :return: (key=class label value=set of image names, image names with verification errors) of all the label files
+    """
+    class_images, error_images = dict(), set()
+    for folder, filenames in (label_files or {}).items():
+        for filename in filenames:
+            label_filename = os.path.join(folder, filename)
+            if not os.path.exists(label_filename):
+                continue
+            file_class_images, file_error_images = _get_label_filters(label_filename,
+                                                                      get_label_file_key(label_filename))
+            for label, names in file_class_images.items():
+                class_images.setdefault(label, set()).update(names)
+            error_images.update(file_error_images)
+    return class_images, error_images
+
+
+def _jump_to_image(key: str, image_names: list):
+    name = st.session_state[f"{key}_jump"].strip()
+    if not name:
+        return
+    if name not in image_names:
+        st.session_state[f"{key}_not_found"] = name
+        return
+
+    page_size = st.session_state[f"{key}_page_size"]
+    st.session_state[f"{key}_page"] = image_names.index(name) // page_size + 1
+    st.session_state[f"{key}_selected"] = name
+
+
+def _reset_page(key: str):
+    st.session_state[f"{key}_page"] = 1
+
+
+def _select_image(key: str, name: str):
+    st.session_state[f"{key}_selected"] = name
+
+
+def show_image_grid(image_names: list, data_folder: str, atlas: ThumbnailAtlas = None, label_files: dict = None,
+                    key: str = "image_grid", num_columns: int = GRID_COLUMNS):
+    """
+    :param image_names: image filenames without the folder
+    :param data_folder: folder of the full-size images
+    :param atlas: thumbnails of the images; the full-size images are shown scaled down if None
+    :param label_files: label files with key=folder value=label filename to filter the images with
+    :param key: unique key of the grid in the page
+    :param num_columns: the number of columns
+    """
+    if label_files:
+        class_images, error_images = get_label_filters(label_files)
+        col1, col2 = st.columns(2)
+        selected_class = col1.selectbox("Class", [ALL_CLASSES] + sorted(class_images.keys()),
+                                        key=f"{key}_class", on_change=_reset_page, args=(key,))
+        only_errors = col2.checkbox("Only images with errors", key=f"{key}_errors",
+                                    on_change=_reset_page, args=(key,))
+        if selected_class != ALL_CLASSES:
+            image_names = [name for name in image_names if name in class_images[selected_class]]
+        if only_errors:
+            image_names = [name for name in image_names if name in error_images]
+
+    col1, col2, col3 = st.columns([1, 1, 2])
+    page_size = col1.selectbox("Images per page", GRID_PAGE_SIZES, key=f"{key}_page_size",
+                               on_change=_reset_page, args=(key,))
+    page_count = max((len(image_names) + page_size - 1) // page_size, 1)
+    page_key = f"{key}_page"
+    if st.session_state.get(page_key, 1) > page_count:
+        st.session_state[page_key] = page_count
+    page = col2.number_input(f"Page (1-{page_count})", min_value=1, max_value=page_count, step=1, key=page_key)
+    col3.text_input("Jump to image", key=f"{key}_jump", on_change=_jump_to_image, args=(key, image_names))
+
+    not_found = st.session_state.pop(f"{key}_not_found", None)
+    if not_found:
+        st.warning(f"{not_found} is not found")
+
+    start = (page - 1) * page_size
+    page_names = image_names[start:start + page_size]
+    st.caption(f"{start + 1 if page_names else 0}-{start + len(page_names)} of {len(image_names)} images")
+
+    columns = st.columns(num_columns)
+    for i, name in enumerate(page_names):
+        with columns[i % num_columns]:
+            thumbnail = atlas.get_bytes(name) if atlas else None
+            st.image(thumbnail if thumbnail is not None else os.path.join(data_folder, name), width=100)
+            truncated_name = name[:20] + "..." if len(name) > 20 else name
+            st.button(truncated_name, key=f"{key}_{start + i}", on_click=_select_image, args=(key, name))
+
+    # the full-size image is read only when it is opened
+    selected_name = st.session_state.get(f"{key}_selected")
+    if selected_name:
+        full_size_filename = os.path.join(data_folder, selected_name)
+        if os.path.exists(full_size_filename):
+            st.image(full_size_filename, caption=f"Full-size Image: {selected_name}")
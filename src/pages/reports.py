@@ -1,5 +1,3 @@
-from collections import namedtuple
-
 import altair as alt
 import pandas as pd
 import shapely
@@ -42,8 +40,12 @@ from src.common.charts import (
     plot_file_info,
     show_download_charts_button
 )
+from src.common.file_catalog import get_file_catalog
+from src.common.image_stats import update_image_stats
 from src.common.logger import get_logger
-from src.models.data_labels import DataLabels
+from src.common.thumbnail_atlas import ThumbnailAtlas
+from src.models.label_metrics import LabelMetrics
+from src.models.metrics_cache import MetricsCache
 from .home import (
     is_authenticated,
     get_data_files,
@@ -51,21 +53,19 @@ from .home import (
     login,
     logout,
     select_project)
-from src.pages.reviews import load_thumbnail
 
 logger = get_logger(__name__)
 
-Rectangle = namedtuple('Rectangle', 'xmin ymin xmax ymax')
-
 
 def show_file_metrics():
     selected_project = select_project()
     if selected_project:
 
-        data_files = get_data_files(selected_project.dir_name, is_thumbnails=True)
-        #chart_aspect_ratios, chart_brightness = plot_aspect_ratios_brightness("### Aspect ratios",
-                                                                              #data_files)
-        chart_files_ctime, chart_file_sizes, table_files_ctime = plot_file_info("Data files info", data_files)
+        # the cached charts are keyed on the generation of the file catalog instead of the file lists
+        catalog = get_file_catalog(selected_project.dir_name)
+        chart_files_ctime, chart_file_sizes, table_files_ctime = plot_file_info("Data files info",
+                                                                                catalog.project_folder,
+                                                                                catalog.generation)
 
         col1, col2 = st.columns(2)
         if chart_files_ctime:
@@ -93,9 +93,10 @@ def show_file_metrics():
 def show_image_metrics():
     selected_project = select_project()
     if selected_project:
-        data_files = get_data_files(selected_project.dir_name, is_thumbnails=True)
+        # only the new or changed images are decoded
+        image_stats = update_image_stats(selected_project.dir_name).drop(columns="color_histogram")
         chart_aspect_ratios, chart_brightness, table_aspect_ratios, table_brightness  = plot_aspect_ratios_brightness("### Aspect ratios",
-                                                                              data_files)
+                                                                              image_stats)
         col1, col2 = st.columns(2)
         if chart_aspect_ratios:
             display_chart(selected_project.id, "aspect_ratios", chart_aspect_ratios, table_aspect_ratios, column=col1)
@@ -107,146 +108,24 @@ def show_image_metrics():
         st.write("No image data")
 
 
-def get_label_metrics(label_files_dict: dict) -> (dict, dict, dict, dict):
-    label_objects_dict = DataLabels.load_from_dict(label_files_dict)
-
-    class_labels = dict()
-    overlap_areas = dict()
-    dimensions = dict()
-    errors = dict()
-    error_columns = set()
-    class_columns = set()
+def get_label_metrics(label_files_dict: dict, use_shapes=False) -> (dict, dict, dict, dict):
+    label_metrics = LabelMetrics(use_shapes=use_shapes)
+    for project_folder, label_files in label_files_dict.items():
+        # only the tasks whose label files changed are recomputed
+        metrics_cache = MetricsCache(project_folder)
+        for label_file in label_files:
+            task_metrics = metrics_cache.get_or_compute(os.path.join(project_folder, label_file), use_shapes)
+            if task_metrics:
+                label_metrics.merge(task_metrics)
 
-    image_table_data = {
-        'filename': [],
-        'total_classes': [],
-        'class_names': []
-    }
-
-    for label_file, data_labels in label_objects_dict.items():
-
-        for image in data_labels.images:
-            count = len(image.objects)
-            class_names = set()
-            error_counts = dict()
-            class_counts = dict()  # Track class counts per image
-
-            for ob_id1 in range(count):
-                object_cur = image.objects[ob_id1]
-                label = object_cur.label
-                class_names.add(label)
-                class_counts[label] = class_counts.get(label, 0) + 1
-                if class_labels.get(label):
-                    class_labels[label] += 1
-                else:
-                    class_labels[label] = 1
-                class_columns.add(label)
-
-                if object_cur.verification_result:
-                    error_code = object_cur.verification_result['error_code']
-                    if errors.get(error_code):
-                        errors[error_code] += 1
-                    else:
-                        errors[error_code] = 1
-
-                    if error_counts.get(error_code):
-                        error_counts[error_code] += 1
-                    else:
-                        error_counts[error_code] = 1
-
-                    error_columns.add(error_code)
-                #else:
-                    #errors = dict()
-                    #error_counts = dict()
-                    #error_columns = set()
-                
-        
-                if not object_cur.points:
-                    logger.warn("empty points in {}".format(object_cur.label))
-                    continue
-
-                xtl1, ytl1, xbr1, ybr1 = DataLabels.Object.get_bounding_rectangle(object_cur)
-                rect1 = Rectangle(xtl1, ytl1, xbr1, ybr1)
-                width1 = rect1.xmax - rect1.xmin
-                height1 = rect1.ymax - rect1.ymin
-
-                if dimensions.get(image.name):
-                    dimensions[image.name].append((width1, height1, image.objects[ob_id1].label))
-                else:
-                    dimensions[image.name] = [(width1, height1, image.objects[ob_id1].label)]
-
-                for ob_id2 in range(ob_id1 + 1, count):
-                    if not image.objects[ob_id2].points:
-                        continue
-
-                    xtl2, ytl2, xbr2, ybr2 = DataLabels.Object.get_bounding_rectangle(image.objects[ob_id2])
-                    rect2 = Rectangle(xtl2, ytl2, xbr2, ybr2)
-
-                    overlap_area, max_area = calculate_overlapping_rect(rect1, rect2)
-
-                    if overlap_area > 0:
-                        overlap_percent = format(overlap_area / max_area, '.2f')
-                        overlap_percent = float(overlap_percent) * 100
-                        if overlap_areas.get(overlap_percent):
-                            overlap_areas[overlap_percent] += 1
-                        else:
-                            overlap_areas[overlap_percent] = 1
-
-            image_table_data['filename'].append(image.name)
-            image_table_data['total_classes'].append(len(class_names))
-            image_table_data['class_names'].append(", ".join(class_names))
-
-            # Add class columns dynamically
-            for label in class_columns:
-                if label not in image_table_data:
-                    image_table_data[label] = [class_counts.get(label, 0)]
-                else:
-                    image_table_data[label].append(class_counts.get(label, 0))
-            # Add error columns dynamically
-            for error_code in error_columns:
-                if error_code not in image_table_data:
-                    image_table_data[error_code] = [error_counts.get(error_code, 0)]
-                else:
-                    image_table_data[error_code].append(error_counts.get(error_code, 0))
-
-            
-    required_keys = ['Mis-tagged', 'Untagged', 'Over-tagged', 'Range_error', 'Attributes_error']
-
-    for key in required_keys:
-        if key not in errors:
-            errors[key] = ['0']
-    # Make sure all arrays have the same length
-    max_length = max(len(value) for value in image_table_data.values())
-
-    for key, value in image_table_data.items():
-        if len(value) < max_length:
-            image_table_data[key].extend([0] * (max_length - len(value)))
-    # Add missing error columns with 0 count
-    error_names = ['Mis-tagged', 'Untagged', 'Over-tagged', 'Range_error', 'Attributes_error']
-
-    for error_code in error_names:
-        if error_code not in image_table_data:
-            image_table_data[error_code] = [0] * len(image_table_data['filename'])
-    # Check if the last 5 columns are in the desired order
-    last_columns = list(image_table_data.keys())[-5:]
-    if not last_columns == error_names:
-    # Rearrange the columns to ensure the desired order
-        for column in error_names:
-            if column in image_table_data:
-                image_table_data[column] = image_table_data.pop(column)
-            else:
-                image_table_data[column] = 0
-
-    image_table = pd.DataFrame(image_table_data)
+    image_table = label_metrics.to_data_frame()
     # Check if all values in each row are 0 and delete the row
     image_table = image_table.loc[~(image_table == 0).all(axis=1)]
-    return class_labels, overlap_areas, dimensions, errors, image_table
-
-
-
-
-
-    #return class_labels, overlap_areas, dimensions, errors, image_table
+    return (label_metrics.class_labels,
+            label_metrics.overlap_areas,
+            label_metrics.dimensions,
+            label_metrics.get_errors(),
+            image_table)
 
 
 def triangle_area(vertices):
@@ -288,22 +167,6 @@ def overlapping_area(poly1, poly2):
     return overlapping_area
 
 
-def calculate_overlapping_rect(a, b):
-    overlapping_area = 0.0
-    max_area = 0.0
-
-    dx = min(a.xmax, b.xmax) - max(a.xmin, b.xmin)
-    dy = min(a.ymax, b.ymax) - max(a.ymin, b.ymin)
-    if (dx >= 0) and (dy >= 0):
-        area1 = (a.xmax - a.xmin) * (a.ymax - a.ymin)
-        area2 = (b.xmax - b.xmin) * (b.ymax - b.ymin)
-
-        max_area = max(area1, area2)
-        overlapping_area = dx*dy
-
-    return overlapping_area, max_area
-
-
 def show_label_metrics():
     selected_project = select_project()
     if selected_project:
@@ -312,7 +175,9 @@ def show_label_metrics():
             st.warning("No label files")
             return
 
-        class_labels, overlap_areas, dimensions, errors, image_table = get_label_metrics(label_files)
+        use_shapes = st.sidebar.checkbox("Overlaps of shapes (polygons & splines)",
+                                         help="Compare the actual shapes instead of their bounding rectangles")
+        class_labels, overlap_areas, dimensions, errors, image_table = get_label_metrics(label_files, use_shapes)
         
         if errors:
             chart_errors, table_errors = plot_chart("Error Count", "error", "count", errors)
@@ -392,19 +257,13 @@ def show_label_metrics():
 
             # Generate thumbnails
             project_folder = selected_project.dir_name
-            thumbnail_filenames = get_data_files(project_folder, is_thumbnails=True)
-
-            thumbnails = []
-
-            for file in thumbnail_filenames["."]:
-                thumbnail_image = load_thumbnail(file)
-                thumbnails.append(thumbnail_image)
-
-            # Add thumbnails to the DataFrame
-            df_dimensions['thumbnail'] = thumbnail_filenames
+            get_data_files(project_folder, is_thumbnails=True)
+            # the thumbnails are sliced from the atlas of the folder instead of being opened one by one
+            atlas = ThumbnailAtlas.load(os.path.join(project_folder, "thumbnails"))
 
             # Create a list of image source paths
-            image_sources = [thumbnail_filenames.get(file, '') for file in df_dimensions['filename']]
+            image_sources = [os.path.join(project_folder, "thumbnails", os.path.basename(file))
+                             if atlas and file in atlas else '' for file in df_dimensions['filename']]
 
             # Filter out entries with missing image paths or empty values
             valid_indices = [i for i, source in enumerate(image_sources) if source]
@@ -428,13 +287,7 @@ def show_label_metrics():
             # Encode the thumbnails as base64 strings
             encoded_thumbnails = []
             for filename in df_dimensions['filename']:
-                thumbnail_path = thumbnail_filenames.get(filename, '')
-                if thumbnail_path:
-                    with open(thumbnail_path, 'rb') as f:
-                        encoded_thumbnail = base64.b64encode(f.read()).decode('utf-8')
-                        encoded_thumbnails.append(encoded_thumbnail)
-                else:
-                    encoded_thumbnails.append('')
+                encoded_thumbnails.append(atlas.get_base64(filename) if atlas else '')
 
             # Create a copy of the customdata array with an additional column for the encoded thumbnails
             customdata_with_thumbnails = df_dimensions[['class', 'width', 'height']].copy()
@@ -6,22 +6,28 @@ import streamlit as st
 from PIL import Image
 
 import src.viewer.app as app
-from src.common.constants import SUPPORTED_IMAGE_FILE_EXTENSIONS
+from src.common.constants import ADQ_WORKING_FOLDER
 from src.common.logger import get_logger
+from src.common.thumbnail_atlas import ThumbnailAtlas
 from src.common.utils import get_window_size
-from src.common.utils import (
-    glob_files,
-    load_images
-)
+from src.models.columnar_labels import ColumnarDataLabels
 from src.models.data_labels import DataLabels
+from src.models.feature_store import FeatureStore
+from src.models.label_anomalies import ANOMALY_NEIGHBORS, score_label_anomalies
+from src.models.label_crops import extract_label_crops, get_crop, get_crop_names, load_label_crops
+from src.models.label_journal import get_label_file_key
 from src.models.metrics import (
-    cluster_images,
-    reduce_features,
-    plot_image_clusters
+    cluster_features,
+    get_image_clusters,
+    get_image_features,
+    plot_image_clusters,
+    project_features
 )
+from .image_grid import show_image_grid
 from .home import (
     get_data_files,
     get_label_files,
+    get_tasks_info,
     is_authenticated,
     login,
     logout,
@@ -31,35 +37,20 @@ from .home import (
 logger = get_logger(__name__)
 
 
-@st.cache_resource
-def load_thumbnail(file_path):
-    with Image.open(file_path) as image:
-        return image.copy()
-
-
-def show_images(project_folder):
-    thumbnail_filenames = get_data_files(project_folder, is_thumbnails=True)
-
-    # Define the number of columns
-    num_columns = 5
-
-    columns = st.columns(num_columns)
-    for i, file in enumerate(thumbnail_filenames["."]):
-        with columns[i % num_columns]:
-            thumbnail_image = load_thumbnail(file)
-            st.image(thumbnail_image, width=100)
-            truncated_name = os.path.basename(file)[:20] + "..." if len(
-                os.path.basename(file)) > 20 else os.path.basename(file)
-            if st.button(truncated_name, key=f'{truncated_name}_{i}'):
-                full_size_filename = os.path.join(project_folder, "data", os.path.basename(file))
-                full_size_image = Image.open(full_size_filename)
-                st.image(full_size_image, caption="Full-size Image")
+def show_images(project_folder, label_files: dict = None):
+    # generates the missing thumbnails
+    get_data_files(project_folder, is_thumbnails=True)
+    # the thumbnails are sliced from the atlas of the folder instead of being opened one by one;
+    # the images without a thumbnail are listed too and shown from the full-size file
+    atlas = ThumbnailAtlas.load(os.path.join(project_folder, "thumbnails"))
+    image_names = [os.path.basename(data_file) for data_file in get_data_files(project_folder)["."]]
+    show_image_grid(image_names, os.path.join(project_folder, "data"), atlas, label_files, key="review_images")
 
 
 def review_images():
     selected_project = select_project(is_sidebar=True)
     if selected_project:
-        show_images(selected_project.dir_name)
+        show_images(selected_project.dir_name, get_label_files(selected_project))
         logger.info(f"selected project dir name {selected_project.dir_name} ")
 
 
@@ -103,65 +94,24 @@ def create_label_thumbnail(image: Image, label_object: DataLabels.Object, target
     Returns:
             prev_img: cv2 image of the preview thumbnail.
     """
-    raw_image = np.asarray(image).astype("uint8")
-    height, width, alpha = raw_image.shape
-    width = max(width, 1)
-    height = max(height, 1)
-    prev_img = np.zeros((height, width, alpha), dtype="uint8")
-
-    if label_object.type == 'box':
-        point_list = label_object.points[0]
-        xtl, ytl, xbr, ybr = (
-            int(point_list[0]),
-            int(point_list[1]),
-            int(point_list[2]),
-            int(point_list[3])
-        )
-        x = max(xtl, 0)
-        y = max(ytl, 0)
-
-        x_end = min(xbr, height)
-        y_end = min(ybr, height)
-
-        prev_img[y:y_end, x:x_end] = raw_image[y:y_end, x:x_end]
-        prev_img = prev_img[y:y_end, x:x_end]
-    elif label_object.type == 'spline' or label_object.type == 'boundary' or label_object.type == 'polygon':
-        if label_object.points:
-            min_x, min_y, max_x, max_y = DataLabels.Object.get_bounding_rectangle(label_object)
-            min_x = max(min_x, 0)
-            min_y = max(min_y, 0)
-            max_x = min(max_x, width)
-            max_y = min(max_y, height)
-
-            prev_img[min_y:max_y, min_x:max_x] = raw_image[min_y:max_y, min_x:max_x]
-            prev_img = prev_img[min_y:max_y, min_x:max_x]
-
-    # Resize prev_img to target_size
-    if prev_img.size > 0:
-        return cv2.resize(prev_img, target_size[::-1])
-
-
-def load_label_thumbnails(data_folder: str, data_labels: DataLabels, label_thumbnail_folder: str):
-    # if they are not created, create them first
-    if not os.path.exists(label_thumbnail_folder):
-        os.mkdir(label_thumbnail_folder)
-
-        for label_image in data_labels.images:
-            image_filename = os.path.join(data_folder, label_image.name)
-            image = Image.open(image_filename)
-            for idx, obj in enumerate(label_image.objects):
-                thumbnail_name = os.path.join(label_thumbnail_folder,
-                                              f"{obj.label}-{idx}-{label_image.name}")
-                label_thumbnail = create_label_thumbnail(image, obj)
-                if label_thumbnail is not None:
-                    cv2.imwrite(thumbnail_name, label_thumbnail)
-
-    thumbnail_names = glob_files(label_thumbnail_folder,
-                                 SUPPORTED_IMAGE_FILE_EXTENSIONS)
-    thumbnail_names.sort()
-    label_thumbnails = load_images(thumbnail_names, size=(50, 50))
-
-    return label_thumbnails, thumbnail_names
+    if label_object.type not in ('box', 'spline', 'boundary', 'polygon') or not label_object.points:
+        return None
+
+    # a view of the image in the bounding rectangle instead of a copy into a full-size image
+    crop = get_crop(np.asarray(image), ColumnarDataLabels.Object.get_bounding_rectangle(label_object))
+    if crop is not None:
+        return cv2.resize(crop, target_size[::-1])
+
+
+def load_label_thumbnails(data_folder: str, label_filename: str, data_labels: ColumnarDataLabels,
+                          label_thumbnail_folder: str):
+    """
+    :return: (crops of the objects, their names) from the crop atlas of the label file
+    """
+    # the crops are extracted in memory and kept in a crop atlas instead of a file per crop
+    label_thumbnails, object_indices = load_label_crops(data_folder, label_filename, data_labels,
+                                                        label_thumbnail_folder, size=(50, 50))
+    return label_thumbnails, get_crop_names(data_labels, object_indices)
 
 
 def detect_label_anomalies(selected_project):
@@ -180,48 +130,154 @@ def detect_label_anomalies(selected_project):
         for project_folder, label_files in label_files_dict.items():
             for task_idx, label_file in enumerate(label_files):
                 st.write(f"Analyzing class labels for task {task_idx}")
-                data_labels = DataLabels.load(os.path.join(project_folder, label_file))
-                thumbnails, names = load_label_thumbnails(data_folder, data_labels, label_thumbnail_folder)
+                label_filename = os.path.join(project_folder, label_file)
+                data_labels = ColumnarDataLabels.load(label_filename)
+                thumbnails, names = load_label_thumbnails(data_folder, label_filename, data_labels,
+                                                          label_thumbnail_folder)
 
-                if thumbnails:
-                    label_thumbnails.extend(thumbnails)
+                if len(thumbnails):
+                    label_thumbnails.append(thumbnails)
                     thumbnail_names.extend(names)
 
                 cur_class_labels = data_labels.get_class_labels()
                 class_labels = class_labels.union(cur_class_labels)
 
         class_count = len(class_labels)
-        st.write(f"Found {len(label_thumbnails)} labels in {class_count} classes: {class_labels}")
-        cluster_labels = cluster_images(label_thumbnails, n_clusters=class_count)
-        reduced_features = reduce_features(label_thumbnails)
+        st.write(f"Found {len(thumbnail_names)} labels in {class_count} classes: {class_labels}")
+        if len(thumbnail_names) < max(class_count, 2):
+            st.warning("Please add more labels for clustering purposes")
+            return
+
+        # the features of the crops are computed once for the clusters and the projection
+        features = get_image_features(np.concatenate(label_thumbnails))
+        cluster_labels = cluster_features(features, n_clusters=class_count)
+        reduced_features = project_features(features)
 
         plot_image_clusters(selected_project.id, "Label clusters", thumbnail_names,
-                            label_thumbnails, cluster_labels, reduced_features)
+                            None, cluster_labels, reduced_features)
 
 
-def show_image_clusters(selected_project):
-    data_files = get_data_files(selected_project.dir_name, is_thumbnails=True)
-    # Preprocess and cluster images
-    images = load_images(data_files["."])
-    if len(images) < 5:
+def show_image_clusters(selected_project, refit=False):
+    data_files = get_data_files(selected_project.dir_name, is_thumbnails=True, thumbnails_name="thumbnails_cluster")
+    if len(data_files["."]) < 5:
         st.warning("Please add more images for clustering purposes")
         return
 
-    cluster_labels = cluster_images(images, n_clusters=5)
-    reduced_features = reduce_features(images)
-    plot_image_clusters(selected_project.id, "Image clusters", data_files["."],
-                        images, cluster_labels, reduced_features)
+    # the features are computed once per image and the images are assigned to the clusters fitted before
+    feature_store = FeatureStore(selected_project.dir_name, "thumbnails_cluster")
+    filenames, rows = feature_store.update(data_files["."])
+    cluster_labels, reduced_features = get_image_clusters(feature_store, rows, n_clusters=5, refit=refit)
+    plot_image_clusters(selected_project.id, "Image clusters", filenames,
+                        None, cluster_labels, reduced_features)
+
+
+def score_anomalies(selected_project):
+    """
+    score the label objects against the other objects of their class and keep the ranking in the session
+    """
+    project_folder = os.path.join(ADQ_WORKING_FOLDER, str(selected_project.id))
+    tasks = get_tasks_info().get_tasks_by_project_id(selected_project.id) or []
+    label_files = [(task.id, os.path.join(project_folder, os.path.basename(task.anno_file_name)))
+                   for task in tasks if task.anno_file_name]
+    if not label_files:
+        st.warning("No label file to review")
+        return
+
+    # to tell whether the labels were reviewed after they were scored
+    label_file_keys = {label_filename: get_label_file_key(label_filename) for _, label_filename in label_files
+                       if os.path.exists(label_filename)}
+    with st.spinner("Scoring the labels"):
+        anomalies = score_label_anomalies(os.path.join(selected_project.dir_name, "data"), label_files,
+                                          os.path.join(selected_project.dir_name, "label_thumbnails"))
+    st.session_state["label_anomalies"] = (selected_project.id, anomalies, label_file_keys)
+    st.session_state["anomalies_page"] = 1
+    st.session_state.pop("anomalies_task_id", None)
+
+
+def _open_anomaly(task_id: int, image_index: int):
+    st.session_state["anomalies_task_id"] = task_id
+    # the viewer opens the image at image_index
+    st.session_state["image_index"] = image_index
+
+
+@st.cache_data(max_entries=16)
+def _get_anomaly_crops(data_folder: str, label_filename: str, label_file_key: tuple, object_indices: tuple) -> dict:
+    """
+    :param label_file_key: the state of the label file and its journal to invalidate the cache
+        (see label_journal.get_label_file_key)
+    :return: key=object index value=crop
+    """
+    data_labels = ColumnarDataLabels.load(label_filename)
+    # the objects removed by a review since the scoring have no crop
+    object_count = len(data_labels.image_index) if data_labels else 0
+    crops, crop_indices = extract_label_crops(data_folder, data_labels, size=(100, 100),
+                                              object_indices=[index for index in object_indices
+                                                              if index < object_count])
+    return dict(zip(crop_indices.tolist(), crops))
+
+
+def show_label_anomalies(selected_project):
+    """
+    show the scored objects from the most anomalous, a page at a time, and open the image of an object in the viewer
+    """
+    result = st.session_state.get("label_anomalies")
+    if not result or result[0] != selected_project.id:
+        return
+
+    anomalies, label_file_keys = result[1], result[2]
+    scored = anomalies[anomalies['score'].notna()]
+    st.subheader("Label anomalies")
+    if any(os.path.exists(label_filename) and get_label_file_key(label_filename) != label_file_key
+           for label_filename, label_file_key in label_file_keys.items()):
+        st.warning("The labels were changed after they were scored. Score them again to update the ranking.")
+    st.caption(f"{len(scored)} of {len(anomalies)} objects are scored; "
+               f"classes with {ANOMALY_NEIGHBORS} objects or fewer are not scored")
+
+    col1, col2 = st.columns(2)
+    page_size = col1.selectbox("Objects per page", ANOMALY_PAGE_SIZES, key="anomalies_page_size")
+    page_count = max((len(scored) + page_size - 1) // page_size, 1)
+    if st.session_state.get("anomalies_page", 1) > page_count:
+        st.session_state["anomalies_page"] = page_count
+    page = col2.number_input(f"Page (1-{page_count})", min_value=1, max_value=page_count, step=1,
+                             key="anomalies_page")
+
+    start = (page - 1) * page_size
+    page_rows = scored.iloc[start:start + page_size]
+    # only the crops of the page are extracted
+    data_folder = os.path.join(selected_project.dir_name, "data")
+    crops = dict()
+    for label_filename, rows in page_rows.groupby("label_filename"):
+        crops[label_filename] = _get_anomaly_crops(data_folder, label_filename, get_label_file_key(label_filename),
+                                                   tuple(rows["object_index"].tolist()))
+
+    for rank, row in enumerate(page_rows.itertuples(index=False), start=start + 1):
+        col1, col2, col3 = st.columns([1, 4, 1])
+        crop = crops[row.label_filename].get(row.object_index)
+        if crop is not None:
+            col1.image(crop)
+        col2.markdown(f"**{rank}. {row.label}** in {row.image_name} (task {row.task_id})")
+        col2.caption(f"score {row.score:.2f}")
+        col3.button("Open", key=f"anomalies_open_{rank}", on_click=_open_anomaly,
+                    args=(int(row.task_id), int(row.image_index)))
+
+    task_id = st.session_state.get("anomalies_task_id")
+    if task_id is not None:
+        selected_task = get_tasks_info().get_task_by_id(task_id)
+        if selected_task:
+            app.main(selected_task)
 
 
 OVERLAPS = "Overlaps"
 TINY_OBJECTS = "Tiny objects"
 CLUSTER_LABELS = "Cluster labels"
 CLUSTER_IMAGES = "Cluster images"
+LABEL_ANOMALIES = "Label anomalies"
+ANOMALY_PAGE_SIZES = [10, 20, 50]
 
 
 def auto_review():
     selected_project = select_project(is_sidebar=True)
-    options = [OVERLAPS, TINY_OBJECTS, CLUSTER_IMAGES, CLUSTER_LABELS]
+    options = [OVERLAPS, TINY_OBJECTS, CLUSTER_IMAGES, CLUSTER_LABELS, LABEL_ANOMALIES]
 
     with st.form("Auto-Reviews"):
         selected_options = []
@@ -231,13 +287,20 @@ def auto_review():
                 if selected:
                     selected_options.append(option)
 
+            refit_clusters = st.checkbox("Refit the image clusters on all the images")
             start = st.form_submit_button("Start auto-review")
             if start:
                 st.write(f"Starting {selected_options}")
                 if CLUSTER_LABELS in selected_options:
                     detect_label_anomalies(selected_project)
                 if CLUSTER_IMAGES in selected_options:
-                    show_image_clusters(selected_project)
+                    show_image_clusters(selected_project, refit=refit_clusters)
+                if LABEL_ANOMALIES in selected_options:
+                    score_anomalies(selected_project)
+
+    if selected_project:
+        # outside the form so that the pages and the viewer keep working after the auto-review
+        show_label_anomalies(selected_project)
 
 
 def main():
@@ -1,6 +1,4 @@
 import copy
-import datetime as dt
-import json
 import os.path
 import random
 import shutil
@@ -8,27 +6,21 @@ import shutil
 import pandas as pd
 import streamlit as st
 
-from src.common import utils
+from src.common.bulk_upload import BulkUpload
 from src.common.constants import (
     ADQ_WORKING_FOLDER,
-    CVAT_XML,
-    GPR_JSON,
-    STRADVISION_XML,
+    BULK_UPLOAD_LABEL_FORMATS,
     SUPPORTED_IMAGE_FILE_EXTENSIONS,
     SUPPORTED_LABEL_FILE_EXTENSIONS,
-    SUPPORTED_LABEL_FORMATS,
-    YOLO_V5_TXT)
-from src.common.convert_lib import (
-    from_gpr_json,
-    from_yolo_txt)
+    SUPPORTED_LABEL_FORMATS)
 from src.common.logger import get_logger
-from src.converters.cvat_reader import CVATReader
-from src.converters.stvision_reader import StVisionReader
-from src.models.adq_labels import AdqLabels
-from src.models.data_labels import DataLabels
+from src.common.thumbnail_atlas import ThumbnailAtlas
+from src.converters.registry import convert_label_files
+from src.models.columnar_labels import ColumnarDataLabels
 from src.models.projects_info import Project
 from src.models.tasks_info import Task, TaskState
 from src.pages.users import select_user
+from .image_grid import show_image_grid
 from .home import (
     api_target,
     get_tasks_info,
@@ -44,45 +36,13 @@ logger = get_logger(__name__)
 DATE_FORMAT = "%Y %B %d %A"
 
 
-def _show_full_size_image(full_path, size, date):
-    st.image(full_path,
-             # use_column_width=True,
-             caption="{} {} {}".format(os.path.basename(full_path),
-                                       size,
-                                       date))
-
-
-@st.cache_resource
 def show_images(files_dict: dict):
-    # Define the number of columns
-    num_columns = 5
-
     for folder, files in files_dict.items():
-        # # Calculate the number of rows needed based on the number of images and columns
-        # num_rows = int(len(files) / num_columns) + (1 if len(files) % num_columns > 0 else 0)
-
-        # Create a layout with the specified number of columns
-        columns = st.columns(num_columns)
-        for i, file in enumerate(files):
-            with columns[i % num_columns]:
-                full_path = os.path.join(folder, file)
-                file_stat = os.stat(full_path)
-                dt_datetime = dt.datetime.fromtimestamp(file_stat.st_ctime)
-                st.image(full_path,
-                         # use_column_width=True,
-                         # title="{} {} {}".format(file,
-                         #                           utils.humanize_bytes(file_stat.st_size),
-                         #                           dt_datetime.date()),
-                         width=100)
-                # button_clicked = st.button("click to expand {}".format(file))
-                # Call the event handler if the button is clicked
-                # Create the expander panel
-                with st.expander("{}".format(file)):
-                    # # Call the event handler if the button is clicked
-                    # if button_clicked:
-                    _show_full_size_image(full_path,
-                                          utils.humanize_bytes(file_stat.st_size),
-                                          dt_datetime.date())
+        # the thumbnails of <project>/data are in the atlas of <project>/thumbnails
+        thumbnails_folder = os.path.join(os.path.dirname(os.path.normpath(folder)), "thumbnails")
+        atlas = ThumbnailAtlas.load(thumbnails_folder) if os.path.basename(os.path.normpath(folder)) == "data" else None
+        image_names = sorted(os.path.basename(file) for file in files)
+        show_image_grid(image_names, folder, atlas, key=f"task_images_{folder}")
 
 
 def _calculate_sample_count(count, percent):
@@ -123,8 +83,7 @@ def sample_data(selected_project: Project, data_labels_dict: dict, df_sample_cou
         task_folder = os.path.join(ADQ_WORKING_FOLDER, str(selected_project.id), str(index))
         if not os.path.exists(task_folder):
             os.mkdir(task_folder)
-        utils.to_file(json.dumps(sampled_data_labels, default=utils.default, indent=2),
-                      os.path.join(task_folder, label_filename))
+        sampled_data_labels.save(os.path.join(task_folder, label_filename))
 
         tasks_info = get_tasks_info()
         task_name = "{}-{}".format(selected_project.id, label_filename)
@@ -151,32 +110,8 @@ def sample_data(selected_project: Project, data_labels_dict: dict, df_sample_cou
 
 
 def _convert_anno_files(labels_format_type, save_folder, saved_data_filenames, saved_anno_filenames):
-    converted_anno_files = []
-    if labels_format_type == CVAT_XML:
-        for idx, anno_file in enumerate(saved_anno_filenames):
-            converted_filename = os.path.join(save_folder, f"anno-{idx}.json")
-
-            reader = CVATReader()
-            logger.info(f"parsing {anno_file}")
-            parsed_dict = reader.parse([anno_file], saved_data_filenames)
-            data_labels = DataLabels.from_adq_labels(AdqLabels.from_json(parsed_dict))
-            data_labels.save(converted_filename)
-            converted_anno_files.append(converted_filename)
-    else:
-        converted_filename = os.path.join(save_folder, f"anno-{0}.json")
-        if labels_format_type == STRADVISION_XML:
-            reader = StVisionReader()
-            parsed_dict = reader.parse(saved_anno_filenames, saved_data_filenames)
-            data_labels = DataLabels.from_json(parsed_dict)
-            data_labels.save(converted_filename)
-        elif labels_format_type == GPR_JSON:
-            converted_filename = from_gpr_json("11", saved_anno_filenames, save_folder)
-        elif labels_format_type == YOLO_V5_TXT:
-            converted_filename = from_yolo_txt("11", saved_anno_filenames, saved_data_filenames, save_folder)
-
-        converted_anno_files.append(converted_filename)
-
-    return converted_anno_files
+    # a converted label file per task: anno-<index>.json
+    return convert_label_files(labels_format_type, saved_anno_filenames, save_folder, saved_data_filenames)
 
 
 def change_status():
@@ -269,6 +204,35 @@ def _save_uploaded_files(uploaded_files, project_id, sub_folder):
     return saved_filenames
 
 
+def _create_label_tasks(selected_project: Project, task_name: str, project_folder: str,
+                        converted_anno_filenames: list):
+    data_total_count = 0
+    for idx, converted_filename in enumerate(converted_anno_filenames):
+        data_labels = ColumnarDataLabels.load(converted_filename)
+        data_count = len(data_labels.images)
+        object_count = data_labels.object_count
+
+        moved_converted_filename = os.path.join(project_folder, os.path.basename(converted_filename))
+        shutil.move(converted_filename, moved_converted_filename)
+
+        new_task = Task(name=f"{task_name}-{idx}",
+                        project_id=selected_project.id,
+                        dir_name=project_folder,
+                        anno_file_name=moved_converted_filename,
+                        state_id=TaskState.DVS_NEW.value,
+                        state_name=TaskState.DVS_NEW.description,
+                        data_count=data_count,
+                        object_count=object_count)
+        data_total_count += data_count
+        response = api_target().create_task(new_task.to_json())
+        logger.info(response)
+        st.write(f"Task {response['id']} {response['name']} created")
+
+    selected_project.task_total_count += len(converted_anno_filenames)
+    selected_project.data_total_count += data_total_count
+    api_target().update_project(selected_project.to_json())
+
+
 def add_data_tasks(selected_project: Project):
 
     with st.form("Add Data Task"):
@@ -309,30 +273,7 @@ def add_data_tasks(selected_project: Project):
             new_task_id = task_pointers.get_next_task_id()
 
             if converted_anno_filenames:
-                for idx, converted_filename in enumerate(converted_anno_filenames):
-                    data_labels = DataLabels.load(converted_filename)
-                    data_count = len(data_labels.images)
-                    object_count = sum(len(image.objects) for image in data_labels.images)
-
-                    moved_converted_filename = os.path.join(project_folder, os.path.basename(converted_filename))
-                    shutil.move(converted_filename, moved_converted_filename)
-
-                    new_task = Task(name=f"{task_name}-{idx}",
-                                    project_id=selected_project.id,
-                                    dir_name=project_folder,
-                                    anno_file_name=moved_converted_filename,
-                                    state_id=TaskState.DVS_NEW.value,
-                                    state_name=TaskState.DVS_NEW.description,
-                                    data_count=data_count,
-                                    object_count=object_count)
-                    data_total_count += data_count
-                    response = api_target().create_task(new_task.to_json())
-                    logger.info(response)
-                    st.write(f"Task {response['id']} {response['name']} created")
-
-                selected_project.task_total_count += len(converted_anno_filenames)
-                selected_project.data_total_count += data_total_count
-                api_target().update_project(selected_project.to_json())
+                _create_label_tasks(selected_project, task_name, project_folder, converted_anno_filenames)
 
             elif saved_data_filenames:
                 data_count = len(saved_data_filenames)
@@ -386,6 +327,74 @@ def add_data_tasks(selected_project: Project):
                 st.warning("Please upload images")   
 
 
+def bulk_add_tasks():
+    selected_project = select_project()
+    if not selected_project:
+        return
+
+    with st.form("Bulk Upload"):
+        st.subheader(f"Upload a folder or an archive on the server to project {selected_project.name}")
+        task_name = st.text_input("**Task Name:**")
+        source = st.text_input("**Folder, zip or tar on the server:**")
+        labels_format_type = st.selectbox("**Choose format:**", [None] + BULK_UPLOAD_LABEL_FORMATS,
+                                          format_func=lambda format_type: format_type or "Images only")
+        submitted = st.form_submit_button("Upload")
+
+    if not submitted:
+        return
+    if not source or not os.path.exists(source):
+        st.warning(f"{source} does not exist")
+        return
+
+    project_folder = os.path.join(ADQ_WORKING_FOLDER, str(selected_project.id))
+    progress_bar = st.progress(0.0)
+
+    def _on_progress(count, total_count, filename):
+        progress = count / total_count if total_count else 0.0
+        progress_bar.progress(min(progress, 1.0), text=f"{count} files uploaded: {filename}")
+
+    # uploading the same source again resumes where the previous upload stopped
+    bulk_upload = BulkUpload(source, project_folder, labels_format_type)
+    saved_data_filenames, converted_anno_filenames = bulk_upload.run(on_progress=_on_progress)
+    progress_bar.progress(1.0, text=f"{len(saved_data_filenames)} data files uploaded")
+    if bulk_upload.collisions:
+        st.warning(f"{len(bulk_upload.collisions)} files are skipped because a file of the same name "
+                   f"in another folder was uploaded: {bulk_upload.collisions}")
+
+    # the label files converted by a previous run of the same upload already have their tasks
+    task_anno_filenames = {os.path.abspath(task.anno_file_name) for task
+                           in get_tasks_info().get_tasks_by_project_id(selected_project.id) or []
+                           if task.anno_file_name}
+    new_anno_filenames = [converted_filename for converted_filename in converted_anno_filenames
+                          if os.path.abspath(converted_filename) not in task_anno_filenames]
+    if len(new_anno_filenames) < len(converted_anno_filenames):
+        st.write(f"{len(converted_anno_filenames) - len(new_anno_filenames)} label files already have a task")
+
+    if new_anno_filenames:
+        _create_label_tasks(selected_project, task_name, project_folder, new_anno_filenames)
+    elif converted_anno_filenames:
+        st.info("All the label files already have a task")
+    elif saved_data_filenames:
+        data_count = len(saved_data_filenames)
+        new_task = Task(name=f"{task_name}-{0}",
+                        project_id=selected_project.id,
+                        dir_name=project_folder,
+                        anno_file_name=None,
+                        state_id=TaskState.DVS_NEW.value,
+                        state_name=TaskState.DVS_NEW.description,
+                        data_count=data_count,
+                        object_count=0)
+        response = api_target().create_task(new_task.to_json())
+        logger.info(response)
+        st.write(f"Task {response['id']} {response['name']} created")
+
+        selected_project.task_total_count += 1
+        selected_project.data_total_count += data_count
+        api_target().update_project(selected_project.to_json())
+    else:
+        st.warning(f"No data file is found in {source}")
+
+
 def delete_task():
     selected_project = select_project(is_sidebar=True)
     if not selected_project:
@@ -417,6 +426,7 @@ def main():
     menu = {
         # "Sample Tasks": lambda: create_data_tasks(),
         "Add Tasks": lambda: add_tasks(),
+        "Bulk Upload": lambda: bulk_add_tasks(),
         "Assign Tasks": lambda: assign_tasks(),
         "Change Status": lambda: change_status(),
         "Delete Task": lambda: delete_task(),
@@ -1,5 +1,8 @@
+import hashlib
+import io
 import os
-import zlib
+import threading
+from collections import OrderedDict
 
 import numpy as np
 import streamlit.components.v1 as components
@@ -18,6 +21,47 @@ else:
     build_dir = os.path.join(parent_dir, "frontend/build")
     _component_func = components.declare_component("st_img_label", path=build_dir)
 
+# "jpeg", "webp", "png" or "rgba" (raw pixels as before)
+IMAGE_FORMAT = "jpeg"
+IMAGE_QUALITY = 90
+ENCODED_CACHE_SIZE = 8
+
+_encoded_images = OrderedDict()
+_encoded_lock = threading.Lock()
+
+
+def encode_image(resized_img, image_format: str = IMAGE_FORMAT, quality: int = IMAGE_QUALITY) -> (bytes, str):
+    """
+    compress the image to send to the frontend; the last encoded images are kept
+    because the same (cached) frame is sent again on every rerun
+    :param resized_img: PIL.Image
+    :param image_format: jpeg, webp, png or rgba
+    :param quality: quality of jpeg and webp
+    :return: (encoded image, content hash)
+    """
+    key = (id(resized_img), image_format, quality)
+    with _encoded_lock:
+        entry = _encoded_images.get(key)
+        if entry and entry[0] is resized_img:
+            _encoded_images.move_to_end(key)
+            return entry[1], entry[2]
+
+    if image_format == "rgba":
+        encoded = np.array(resized_img.convert("RGBA")).flatten().tobytes()
+    else:
+        # jpeg has no alpha channel
+        image = resized_img.convert("RGB") if image_format == "jpeg" and resized_img.mode != "RGB" else resized_img
+        buffer = io.BytesIO()
+        image.save(buffer, format=image_format.upper(), quality=quality)
+        encoded = buffer.getvalue()
+    image_hash = hashlib.blake2b(encoded, digest_size=16).hexdigest()
+
+    with _encoded_lock:
+        _encoded_images[key] = (resized_img, encoded, image_hash)
+        while len(_encoded_images) > ENCODED_CACHE_SIZE:
+            _encoded_images.popitem(last=False)
+    return encoded, image_hash
+
 
 def st_img_label(resized_img, shape_color="blue", shape_props=[], key=None) -> dict:
     """Create a new instance of "st_img_label".
@@ -44,26 +88,21 @@ def st_img_label(resized_img, shape_color="blue", shape_props=[], key=None) -> d
     canvasWidth = resized_img.width
     canvasHeight = resized_img.height
 
-    # Translates image to a list for passing to Javascript
-    # imageData = np.array(resized_img.convert("RGBA")).flatten().tolist()
-    imageData = np.array(resized_img.convert("RGBA")).flatten().tobytes()
+    # the image is sent compressed (about 100KB instead of 4MB of RGBA for a 1000x1000 frame)
+    # and the frontend decodes it again only when imageHash changes
+    imageData, imageHash = encode_image(resized_img)
 
     # Call through to our private component function. Arguments we pass here
     # will be sent to the frontend, where they'll be available in an "args"
     # dictionary.
-    #
-    # Defaults to a box whose vertices are at 20% and 80% of height and width.
-    # The _recommended_box function could be replaced with some kind of image
-    # detection algorith if it suits your needs.
-    # compress the imageData using gzip
-    # compressed_image_data = zlib.compress(imageData)
     component_value = _component_func(
         canvasWidth=canvasWidth,
         canvasHeight=canvasHeight,
         shapes=shape_props,
         shapeColor=shape_color,
-        # imageData=compressed_image_data,
         imageData=imageData,
+        imageFormat=IMAGE_FORMAT,
+        imageHash=imageHash,
         key=key,
     )
 
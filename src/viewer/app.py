@@ -15,9 +15,11 @@ from src.common.constants import (
     TypeRoadMarkerQ
 )
 from src.common.logger import get_logger
-from src.models.data_labels import DataLabels
+from src.models.lazy_labels import LazyDataLabels
+from src.models.metrics_cache import MetricsCache
 from src.models.tasks_info import Task
 from src.viewer import st_img_label
+from src.viewer.image_cache import get_image_cache
 from src.viewer.image_manager import ImageManager
 
 logger = get_logger(__name__)
@@ -25,6 +27,8 @@ logger = get_logger(__name__)
 DEFAULT_SHAPE_COLOR = "magenta"
 min_width = 700
 max_width = 1000
+# the number of the next images to decode ahead
+PREFETCH_COUNT = 2
 
 
 def _display_type_attributes(selected_shape: dict, key="1"):
@@ -79,16 +83,15 @@ def _display_type_attributes(selected_shape: dict, key="1"):
 
 def main(selected_task: Task, is_second_viewer=False, error_codes=ErrorType.get_all_types()):
     def save(image_index: int, im: ImageManager):
+        # count before converting the shapes: the image manager updates the image of data_labels in place
+        previous_error_count = data_labels.images[image_index].get_verification_result_sum()
         image_to_save = im.to_data_labels_image()
 
-        curr_image = data_labels.images[image_index]
-        if curr_image.name == image_to_save.name:
-            data_labels.images[image_index] = image_to_save
-        else:
-            data_labels.save_image(image_to_save)
-
-        data_labels.save(selected_task.anno_file_name)
-        selected_task.error_count = data_labels.get_verification_result_sum()
+        # only the edited image is journaled and only its error count delta is applied
+        data_labels.save_image(image_index, image_to_save)
+        MetricsCache(os.path.dirname(selected_task.anno_file_name)).invalidate(selected_task.anno_file_name)
+        error_count_delta = image_to_save.get_verification_result_sum() - previous_error_count
+        selected_task.error_count = max(selected_task.error_count + error_count_delta, 0)
         selected_task.save()
 
     def refresh():
@@ -233,11 +236,15 @@ def main(selected_task: Task, is_second_viewer=False, error_codes=ErrorType.get_
 
         return image_index
 
-    def call_frontend(im: ImageManager, image_index: int) -> dict:
+    def get_frame_widths() -> (float, float):
         window_width = st.session_state.get("window_width", 700)
-        logger.info(f"window_width: {window_width}")
         max_width = window_width * 0.7 if window_width > 700 else 700
         min_width = window_width * 0.6 if window_width > 700 else 700
+        return min_width, max_width
+
+    def call_frontend(im: ImageManager, image_index: int) -> dict:
+        logger.info(f"window_width: {st.session_state.get('window_width', 700)}")
+        min_width, max_width = get_frame_widths()
         logger.info(f"min_width, max_width = {min_width}, {max_width}")
         resized_img = im.resizing_img(min_width=min_width, max_width=max_width)
         resized_shapes = im.get_downscaled_shapes()
@@ -273,13 +280,14 @@ def main(selected_task: Task, is_second_viewer=False, error_codes=ErrorType.get_
         return color_dict.get(label, default_color)
 
     # Load up the image and the labels
-    data_labels = DataLabels.load(selected_task.anno_file_name)
+    # only the image to show is parsed
+    data_labels = LazyDataLabels.load(selected_task.anno_file_name)
     if not data_labels:
         st.warning("Data labels are empty")
         return
 
     # set session states
-    image_filenames = [os.path.join("data", image.name) for image in data_labels.images]
+    image_filenames = [os.path.join("data", image_name) for image_name in data_labels.image_names]
     if not st.session_state.get('image_index'):
         st.session_state["img_files"] = image_filenames
         st.session_state["image_index"] = 0
@@ -291,6 +299,15 @@ def main(selected_task: Task, is_second_viewer=False, error_codes=ErrorType.get_
     image_filename = os.path.join(task_folder, image_filenames[image_index])
     im = ImageManager(image_filename, data_labels.images[image_index])
 
+    # decode and resize the next and the previous images while this one is reviewed
+    frame_min_width, frame_max_width = get_frame_widths()
+    prefetch_indices = [image_index + offset for offset in range(1, PREFETCH_COUNT + 1)] + [image_index - 1]
+    get_image_cache().prefetch(
+        [os.path.join(task_folder, image_filenames[index])
+         for index in prefetch_indices if 0 <= index < len(image_filenames)],
+        lambda width, height: ImageManager.get_resized_size(width, height,
+                                                            min_width=frame_min_width, max_width=frame_max_width))
+
     # call the frontend
     if not is_second_viewer:
         image_index = viewer_menu(im)
@@ -24,7 +24,7 @@ const StreamlitImgLabel = (props: ComponentProps) => {
     const [mode, setMode] = useState<string>("light")
     const [labels, setLabels] = useState<string[]>([])
     const [canvas, setCanvas] = useState(new fabric.Canvas(""))
-    const {canvasWidth, canvasHeight, shapes, shapeColor, imageData}: PythonArgs = props.args
+    const {canvasWidth, canvasHeight, shapes, shapeColor, imageData, imageFormat, imageHash}: PythonArgs = props.args
     const [newBBoxIndex, setNewBBoxIndex] = useState<number>(shapes.length)
     const [opacity, setOpacity] = useState<number>(0.5);
     const [isInteractingWithBox, setIsInteractingWithBox] = useState(false);
@@ -143,16 +143,20 @@ const StreamlitImgLabel = (props: ComponentProps) => {
 
     /*
      * Translate Python image data to a JavaScript Image
+     * A compressed image is handed to the browser as an object URL, raw RGBA is drawn through a canvas.
+     * Either way, it is done only when the content hash changes, not on every rerun.
      */
-    var invisCanvas = document.createElement("canvas")
-    var ctx = invisCanvas.getContext("2d")
-
-    invisCanvas.width = canvasWidth
-    invisCanvas.height = canvasHeight
-  
-    // // create imageData object
+    const imageKey = imageHash || imageData
     const canvasDataUri = useMemo(() => {
+        if (imageFormat && imageFormat !== "rgba") {
+            return URL.createObjectURL(new Blob([imageData], { type: `image/${imageFormat}` }))
+        }
+
         let dataUri = ""
+        const invisCanvas = document.createElement("canvas")
+        invisCanvas.width = canvasWidth
+        invisCanvas.height = canvasHeight
+        const ctx = invisCanvas.getContext("2d")
         if (ctx) {
           const idata = ctx.createImageData(canvasWidth, canvasHeight)
           idata.data.set(imageData)
@@ -160,8 +164,17 @@ const StreamlitImgLabel = (props: ComponentProps) => {
           dataUri = invisCanvas.toDataURL()
         }
         return dataUri
-    }, [imageData, ctx, canvasWidth, canvasHeight, invisCanvas])
+        // eslint-disable-next-line react-hooks/exhaustive-deps
+    }, [imageKey, imageFormat, canvasWidth, canvasHeight])
 
+    // release the object URL of the previous image
+    useEffect(() => {
+        return () => {
+            if (canvasDataUri.startsWith("blob:")) {
+                URL.revokeObjectURL(canvasDataUri)
+            }
+        }
+    }, [canvasDataUri])
 
     useEffect(() => {
         const canvasTmp = new fabric.Canvas("c", {
@@ -204,7 +217,7 @@ const StreamlitImgLabel = (props: ComponentProps) => {
             canvas.renderAll()
         }
 
-    }, [canvas, canvasHeight, canvasWidth, imageData, shapesInternal, shapeColor, props.args, opacity, checkedClassLabels, checkedIndividualLabels])
+    }, [canvas, canvasHeight, canvasWidth, imageKey, shapesInternal, shapeColor, props.args, opacity, checkedClassLabels, checkedIndividualLabels])
 
     const onSelectShapeHandler = ((shape: ShapeProps, fabricShape: fabric.Object) => {
         console.log(`onSelectedShape ${JSON.stringify(shape)}`)
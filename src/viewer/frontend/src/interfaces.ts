@@ -64,5 +64,9 @@ export interface PythonArgs {
   canvasHeight: number
   shapes: ShapeProps[]
   shapeColor: string
+  // compressed image bytes or raw RGBA pixels if imageFormat is "rgba"
   imageData: Uint8ClampedArray
+  imageFormat: "jpeg" | "webp" | "png" | "rgba"
+  // content hash of imageData: the image is decoded again only when it changes
+  imageHash: string
 }
@@ -0,0 +1,153 @@
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from src.common.logger import get_logger
+
+logger = get_logger(__name__)
+
+"""
+.. module:: image_cache
+   :synopsis: process-wide cache of the decoded images of the viewer
+   The decoded images, their resized versions and their pixel arrays are kept in an LRU cache
+   shared by all the sessions of the process, keyed by (path, mtime, size, variant) so that an edited file
+   is decoded again. The least recently used entries are evicted beyond IMAGE_CACHE_BUDGET bytes.
+   prefetch decodes the neighbours of the current image in background threads (PIL releases the GIL
+   while decoding), so that stepping to the next or the previous image hits the cache.
+   The cached images are shared: callers must copy them before modifying them.
+"""
+
+IMAGE_CACHE_BUDGET = 1024 * 1024 * 1024
+PREFETCH_WORKERS = 2
+
+
+def _get_nbytes(value) -> int:
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    return value.width * value.height * len(value.getbands())
+
+
+class ImageCache:
+    def __init__(self, budget: int = IMAGE_CACHE_BUDGET):
+        self.budget = budget
+        self.nbytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._executor = None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def _put(self, key, value):
+        nbytes = _get_nbytes(value)
+        if nbytes > self.budget:
+            return
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = value
+            self.nbytes += nbytes
+            while self.nbytes > self.budget:
+                _, evicted = self._entries.popitem(last=False)
+                self.nbytes -= _get_nbytes(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    @staticmethod
+    def _get_file_key(filename: str) -> tuple:
+        file_stat = os.stat(filename)
+        return os.path.abspath(filename), file_stat.st_mtime_ns, file_stat.st_size
+
+    def get_image(self, filename: str) -> Image:
+        """
+        :param filename: image filename
+        :return: the decoded image
+        """
+        key = self._get_file_key(filename) + (None,)
+        image = self._get(key)
+        if image is None:
+            image = Image.open(filename)
+            # the file is closed once the image is decoded
+            image.load()
+            self._put(key, image)
+        return image
+
+    def get_resized_image(self, filename: str, size: tuple) -> Image:
+        """
+        :param filename: image filename
+        :param size: (width, height)
+        :return: the image resized to size
+        """
+        image = self.get_image(filename)
+        size = (int(size[0]), int(size[1]))
+        if image.size == size:
+            return image
+
+        key = self._get_file_key(filename) + (size,)
+        resized = self._get(key)
+        if resized is None:
+            resized = image.resize(size)
+            self._put(key, resized)
+        return resized
+
+    def get_array(self, filename: str) -> np.ndarray:
+        """
+        :param filename: image filename
+        :return: read-only uint8 array of the decoded image
+        """
+        key = self._get_file_key(filename) + ("array",)
+        array = self._get(key)
+        if array is None:
+            array = np.asarray(self.get_image(filename)).astype("uint8")
+            array.setflags(write=False)
+            self._put(key, array)
+        return array
+
+    def _prefetch(self, filename: str, size_func):
+        try:
+            image = self.get_image(filename)
+            if size_func:
+                self.get_resized_image(filename, size_func(image.width, image.height))
+        except Exception as e:
+            logger.warning(f"Cannot prefetch {filename}: {str(e)}")
+        finally:
+            with self._lock:
+                self._pending.discard(filename)
+
+    def prefetch(self, filenames: list, size_func=None):
+        """
+        decode the images in background threads
+        :param filenames: image filenames
+        :param size_func: returns the resized (width, height) of an image from its (width, height)
+        """
+        for filename in filenames:
+            with self._lock:
+                if filename in self._pending:
+                    continue
+                self._pending.add(filename)
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS,
+                                                        thread_name_prefix="image_prefetch")
+            self._executor.submit(self._prefetch, filename, size_func)
+
+
+_image_cache = ImageCache()
+
+
+def get_image_cache() -> ImageCache:
+    return _image_cache
@@ -4,7 +4,9 @@ import numpy as np
 from PIL import Image
 
 from src.models.data_labels import DataLabels
+from src.models.label_crops import get_crop
 from src.common.logger import get_logger
+from src.viewer.image_cache import get_image_cache
 
 logger = get_logger(__name__)
 
@@ -44,7 +46,9 @@ class ImageManager:
     def __init__(self, image_filename: str, data_label_image: DataLabels.Image):
         """initiate module"""
         self._data_label_image = data_label_image
-        self._image = Image.open(image_filename)
+        self._image_filename = image_filename
+        # decoded once per process and shared across the sessions; never modified in place
+        self._image = get_image_cache().get_image(image_filename)
         # NB: note that the shapes should be all in the ShapeProps format defined in interfaces.tsx in the frontend
         self._shapes = []
         self._load_shapes()
@@ -178,6 +182,28 @@ class ImageManager:
         else:
             logger.warning(f"empty shape {shape}")
 
+    @staticmethod
+    def get_resized_size(width: int, height: int, min_width=700, min_height=700, max_height=1000, max_width=1000):
+        """the size of the image resized by max_height and max_width.
+
+        Args:
+            width(int): the width of the image.
+            height(int): the height of the image.
+            min_width(int): the min_width of the frame.
+            min_height(int): the min_height of the frame.
+            max_width(int): the max_width of the frame.
+            max_height(int): the max_height of the frame.
+        Returns:
+            (width, height) of the resized image.
+        """
+        if width > max_width:
+            ratio = min(max_height / height, max_width / width)
+            width, height = int(width * ratio), int(height * ratio)
+        if width < min_width:
+            ratio = max(min_height / height, min_width / width)
+            width, height = int(width * ratio), int(height * ratio)
+        return width, height
+
     def resizing_img(self, min_width=700, min_height=700, max_height=1000, max_width=1000):
         """resizing the image by max_height and max_width.
 
@@ -187,19 +213,11 @@ class ImageManager:
             max_width(int): the max_width of the frame.
             max_height(int): the max_height of the frame.
         Returns:
-            resized_img(PIL.Image): the resized image.
+            resized_img(PIL.Image): the resized image; shared by the image cache, so do not modify it.
         """
-        resized_img = self._image.copy()
-        if resized_img.width > max_width:
-            ratio = min(max_height / resized_img.height, max_width / resized_img.width)
-            resized_img = resized_img.resize(
-                (int(resized_img.width * ratio), int(resized_img.height * ratio))
-            )
-        if resized_img.width < min_width:
-            ratio = max(min_height / resized_img.height, min_width / resized_img.width)
-            resized_img = resized_img.resize(
-                (int(resized_img.width * ratio), int(resized_img.height * ratio))
-            )
+        resized_size = ImageManager.get_resized_size(self._image.width, self._image.height,
+                                                     min_width, min_height, max_height, max_width)
+        resized_img = get_image_cache().get_resized_image(self._image_filename, resized_size)
 
         self._resized_ratio_w = self._image.width / resized_img.width
         self._resized_ratio_h = self._image.height / resized_img.height
@@ -298,11 +316,8 @@ class ImageManager:
         Returns:
             prev_img: PIL image of the preview thumbnail.
         """
-        raw_image = np.asarray(self._image).astype("uint8")
-        width, height, alpha = raw_image.shape
-        width = max(width, 1)
-        height = max(height, 1)
-        prev_img = np.zeros((width, height, alpha), dtype="uint8")
+        raw_image = get_image_cache().get_array(self._image_filename)
+        prev_img = None
 
         if shape:
             if shape['shapeType'] == 'box':
@@ -313,27 +328,12 @@ class ImageManager:
                     int(point_dict.get('w', 1)),
                     int(point_dict.get('h', 1))
                 )
-                x = max(x, 0)
-                y = max(y, 0)
-                w = max(w, 1)
-                h = max(h, 1)
-
-                x_end = min(x + w, height)
-                y_end = min(y + h, width)
-
-                prev_img[y:y_end, x:x_end] = raw_image[y:y_end, x:x_end]
-                prev_img = prev_img[y:y_end, x:x_end]
+                # a view of the cached image instead of a copy into a full-size image
+                prev_img = get_crop(raw_image, (x, y, x + max(w, 1), y + max(h, 1)))
             elif shape['shapeType'] == 'spline' or shape['shapeType'] == 'boundary' or shape['shapeType'] == 'polygon':
                 bounding_rectangle = ImageManager.get_bounding_rectangle(shape)
                 if bounding_rectangle:
-                    min_x, min_y, max_x, max_y = bounding_rectangle
-                    min_x = max(min_x, 0)
-                    min_y = max(min_y, 0)
-                    max_x = min(max_x, self._image.width)
-                    max_y = min(max_y, self._image.height)
-
-                    prev_img[min_y:max_y, min_x:max_x] = raw_image[min_y:max_y, min_x:max_x]
-                    prev_img = prev_img[min_y:max_y, min_x:max_x]
+                    prev_img = get_crop(raw_image, bounding_rectangle)
 
             elif shape['shapeType'] == 'VP':
                 resized_points = []
@@ -344,7 +344,10 @@ class ImageManager:
                     }
                     resized_points.append(resized_point_dict)
 
-        return Image.fromarray(prev_img)
+        if prev_img is None:
+            return Image.new(self._image.mode, self._image.size)
+        # only the crop is copied
+        return Image.fromarray(np.ascontiguousarray(prev_img))
 
     def set_review(self, shape_id, error_code, comment):
         """set the review label and comment.
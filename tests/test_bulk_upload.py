@@ -0,0 +1,63 @@
+import json
+import os
+
+from PIL import Image
+
+from src.common.bulk_upload import BulkUpload
+from src.common.constants import GPR_JSON
+
+
+def _save_gpr_label(filename: str, image_name: str):
+    with open(filename, 'w') as label_file:
+        json.dump({"fileName": image_name, "targetType": "", "plane": "", "prcStep": "", "madeDate": "",
+                   "fileType": "", "img_attr": {},
+                   "annotation": {"bbox_x": 1, "bbox_y": 2, "bbox_w": 3, "bbox_h": 4, "bbox_xM": 0, "bbox_yM": 0,
+                                  "classes": "car", "bbox_id": "1"}}, label_file)
+
+
+def test_same_name_in_another_folder_is_reported(tmp_path):
+    source = tmp_path / "source"
+    for folder, width in [("s1", 20), ("s2", 30)]:
+        os.makedirs(source / folder)
+        Image.new('RGB', (width, 10)).save(source / folder / "a.jpg")
+
+    bulk_upload = BulkUpload(str(source), str(tmp_path / "project"), max_workers=1)
+    saved_data_filenames, _ = bulk_upload.run()
+
+    assert [os.path.basename(filename) for filename in saved_data_filenames] == ["a.jpg"]
+    assert bulk_upload.collisions == [(os.path.join("s2", "a.jpg"), os.path.join("s1", "a.jpg"))]
+    with Image.open(saved_data_filenames[0]) as image:
+        assert image.size == (20, 10)
+
+
+def test_gpr_images_are_read_from_the_data_folder(tmp_path):
+    source = tmp_path / "source"
+    os.makedirs(source)
+    Image.new('RGB', (20, 10)).save(source / "a.jpg")
+    _save_gpr_label(str(source / "a.json"), "a.jpg")
+
+    _, converted_filenames = BulkUpload(str(source), str(tmp_path / "project"), GPR_JSON, max_workers=1).run()
+    assert [os.path.basename(filename) for filename in converted_filenames] == ["anno-source.json"]
+    with open(converted_filenames[0]) as label_file:
+        images = json.load(label_file)['images']
+    assert [(image['name'], image['width'], image['height']) for image in images] == [("a.jpg", 20, 10)]
+
+
+def test_resumed_upload_keeps_the_converted_label_file(tmp_path):
+    source = tmp_path / "source"
+    os.makedirs(source)
+    Image.new('RGB', (20, 10)).save(source / "a.jpg")
+    _save_gpr_label(str(source / "a.json"), "a.jpg")
+
+    _, converted_filenames = BulkUpload(str(source), str(tmp_path / "project"), GPR_JSON, max_workers=1).run()
+    converted_mtime_ns = os.stat(converted_filenames[0]).st_mtime_ns
+
+    # the same inputs give back the label file of the task as it is
+    assert BulkUpload(str(source), str(tmp_path / "project"), GPR_JSON, max_workers=1).run()[1] == converted_filenames
+    assert os.stat(converted_filenames[0]).st_mtime_ns == converted_mtime_ns
+
+    # changed inputs are converted to a new label file
+    os.utime(source / "a.json", (1, 1))
+    _, new_converted_filenames = BulkUpload(str(source), str(tmp_path / "project"), GPR_JSON, max_workers=1).run()
+    assert [os.path.basename(filename) for filename in new_converted_filenames] == ["anno-source-1.json"]
+    assert os.stat(converted_filenames[0]).st_mtime_ns == converted_mtime_ns
@@ -0,0 +1,52 @@
+import threading
+
+import numpy as np
+from PIL import Image
+
+from src.models.feature_store import FeatureStore, _compute_file_features
+
+
+def _save_images(tmp_path, count: int) -> list:
+    image_paths = []
+    for index in range(count):
+        image_path = str(tmp_path / f"{index}.png")
+        Image.new('RGB', (16, 16), (index * 40, 255 - index * 40, 0)).save(image_path)
+        image_paths.append(image_path)
+    return image_paths
+
+
+def _assert_rows_match(feature_store: FeatureStore, image_paths: list, rows: np.ndarray):
+    for image_path, row in zip(image_paths, rows):
+        np.testing.assert_array_equal(feature_store.features[row], _compute_file_features(image_path))
+
+
+def test_stale_store_does_not_use_the_rows_compacted_by_another(tmp_path):
+    image_paths = _save_images(tmp_path, 4)
+    FeatureStore(str(tmp_path)).update(image_paths[:2], max_workers=1)
+    stale_store = FeatureStore(str(tmp_path))
+    # another session keeps only the third image and compacts the matrix
+    FeatureStore(str(tmp_path)).update(image_paths[2:3], max_workers=1)
+
+    paths, rows = stale_store.update(image_paths[:2] + image_paths[3:], max_workers=1)
+    assert paths == image_paths[:2] + image_paths[3:]
+    _assert_rows_match(stale_store, paths, rows)
+
+
+def test_concurrent_updates(tmp_path):
+    image_paths = _save_images(tmp_path, 6)
+    results = []
+
+    def _update():
+        feature_store = FeatureStore(str(tmp_path))
+        results.append((feature_store, feature_store.update(image_paths, max_workers=1)))
+
+    threads = [threading.Thread(target=_update) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for feature_store, (paths, rows) in results:
+        assert paths == image_paths
+        _assert_rows_match(feature_store, paths, rows)
+    assert FeatureStore(str(tmp_path)).row_count == len(image_paths)
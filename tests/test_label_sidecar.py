@@ -0,0 +1,60 @@
+from src.common import json_codec
+from src.models.columnar_labels import ColumnarDataLabels
+from src.models.data_labels import DataLabels
+from src.models.label_sidecar import load_sidecar
+
+LABELS = {
+    "twconverted": "1",
+    "mode": "annotation",
+    "template_version": "0.1",
+    "images": [
+        {"image_id": "0", "name": "a.jpg", "width": 100, "height": 50, "objects": [
+            {"label": "car", "type": "box", "points": [[1, 2, 30, 40]], "attributes": {"occluded": 0},
+             "verification_result": {"error_code": "DVE_RANGE", "comment": ""}},
+            {"label": "car", "type": "box", "points": [[1.5, 2.0, 30.25, 40.0]], "attributes": [],
+             "verification_result": {}},
+            {"label": "lane", "type": "spline", "points": [[1, 2, 3], [4, 5]], "attributes": None,
+             "verification_result": None},
+            {"label": "lane", "type": "spline", "points": [[1.0, 2.0, 3.0], [4.0, 5.0, 6.5]], "attributes": None,
+             "verification_result": None},
+            {"label": "road", "type": "polygon", "points": [[1, 2.5], [3, 4], [5, 6]], "attributes": None,
+             "verification_result": None},
+            {"label": "road", "type": "polygon", "points": None, "attributes": None, "verification_result": None},
+            {"label": "road", "type": "polygon", "points": [], "attributes": None, "verification_result": None},
+        ]},
+        {"image_id": "1", "name": "b.jpg", "width": 10, "height": 5, "objects": []},
+    ]
+}
+
+
+def _save_label_file(tmp_path) -> str:
+    filename = str(tmp_path / "labels.json")
+    DataLabels.from_json(LABELS).save(filename)
+    return filename
+
+
+def test_columnar_round_trip():
+    columnar_labels = ColumnarDataLabels.from_json(LABELS)
+    assert json_codec.loads(json_codec.dumps(columnar_labels.to_data_labels())) == LABELS
+
+
+def test_sidecar_round_trip(tmp_path):
+    filename = _save_label_file(tmp_path)
+    assert load_sidecar(filename) is not None
+
+    data_labels = DataLabels.load(filename)
+    assert json_codec.dumps(data_labels) == json_codec.dumps(LABELS)
+
+
+def test_compact_journal_keeps_the_other_images(tmp_path):
+    filename = _save_label_file(tmp_path)
+    image = DataLabels.load(filename).images[1]
+    image.objects.append(DataLabels.Object(label="car", type="box", points=[[1, 1, 2, 2]]))
+    DataLabels.save_image_to_journal(filename, 1, image)
+    DataLabels.compact_journal(filename)
+
+    expected = json_codec.loads(json_codec.dumps(LABELS))
+    expected['images'][1]['objects'].append({"label": "car", "type": "box", "points": [[1, 1, 2, 2]],
+                                             "attributes": None, "verification_result": None})
+    assert json_codec.loads(open(filename, 'rb').read()) == expected
+    assert json_codec.dumps(DataLabels.load(filename)) == json_codec.dumps(expected)
@@ -0,0 +1,28 @@
+from src.common import json_codec
+from src.models.data_labels import DataLabels
+from src.models.lazy_labels import LazyDataLabels
+from tests.test_label_sidecar import LABELS
+
+
+def test_lazy_images_match_the_json(tmp_path):
+    filename = str(tmp_path / "labels.json")
+    DataLabels.from_json(LABELS).save(filename)
+
+    lazy_labels = LazyDataLabels.load(filename)
+    assert [json_codec.loads(json_codec.dumps(image)) for image in lazy_labels.images] == LABELS['images']
+
+
+def test_journaled_image_keeps_the_points(tmp_path):
+    filename = str(tmp_path / "labels.json")
+    DataLabels.from_json(LABELS).save(filename)
+
+    lazy_labels = LazyDataLabels.load(filename)
+    image = lazy_labels.images[0]
+    image.objects[0].verification_result = None
+    lazy_labels.save_image(0, image)
+
+    expected = json_codec.loads(json_codec.dumps(LABELS))
+    expected['images'][0]['objects'][0]['verification_result'] = None
+    assert json_codec.loads(json_codec.dumps(DataLabels.load(filename))) == expected
+    reloaded = LazyDataLabels.load(filename)
+    assert json_codec.loads(json_codec.dumps(reloaded.images[0])) == expected['images'][0]
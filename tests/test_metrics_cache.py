@@ -0,0 +1,30 @@
+from src.models.data_labels import DataLabels
+from src.models.label_journal import LabelJournal
+from src.models.metrics_cache import MetricsCache
+
+LABELS = {
+    "twconverted": "1",
+    "mode": "annotation",
+    "template_version": "0.1",
+    "images": [
+        {"image_id": "0", "name": "a.jpg", "width": 100, "height": 50, "objects": [
+            {"label": "car", "type": "box", "points": [[1, 2, 30, 40]], "attributes": None,
+             "verification_result": None},
+        ]},
+    ]
+}
+
+
+def test_journaled_review_invalidates_the_metrics(tmp_path):
+    filename = str(tmp_path / "labels.json")
+    data_labels = DataLabels.from_json(LABELS)
+    data_labels.save(filename)
+
+    metrics_cache = MetricsCache(str(tmp_path))
+    metrics_cache.get_or_compute(filename)
+    assert metrics_cache.get(filename) is not None
+
+    image = data_labels.images[0]
+    image.objects = []
+    LabelJournal(filename).append(0, image)
+    assert metrics_cache.get(filename) is None